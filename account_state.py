@@ -0,0 +1,232 @@
+# account_state.py
+import collections
+import json
+import queue
+import threading
+import time
+
+from market_data import connect_websocket
+from rate_limiter import governed_call, PRIORITY_ACCOUNT
+from logging_setup import get_logger
+
+log = get_logger("account")
+
+# Endpoint do user-data stream da Binance (um stream por listen key)
+BINANCE_USER_STREAM_URL = "wss://stream.binance.com:9443/ws/"
+
+# A Binance expira a listen key após 60 minutos sem keepalive
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60
+
+
+def balances_from_account(account_info):
+    """Converte a resposta de get_account em {ativo: (free, locked)}, descartando saldos zerados."""
+    balances = {}
+    for balance in account_info['balances']:
+        free = float(balance['free'])
+        locked = float(balance['locked'])
+        if free + locked > 0:
+            balances[balance['asset']] = (free, locked)
+    return balances
+
+
+class LocalUserDataStream:
+    """
+    Fonte local de eventos do user-data stream, para testes offline.
+    Os eventos são injetados com `push` (no mesmo formato JSON enviado pela Binance)
+    e entregues por `recv`, que levanta TimeoutError quando não há nada na fila.
+    """
+    def __init__(self, timeout=0.05):
+        self._events = queue.Queue()
+        self._timeout = timeout
+        self._closed = False
+
+    def push(self, event):
+        self._events.put(json.dumps(event))
+
+    def disconnect(self):
+        """Simula a queda da conexão pelo servidor."""
+        self._events.put(None)
+
+    def send(self, message):
+        pass
+
+    def recv(self):
+        if self._closed:
+            raise ConnectionError("Stream local fechado.")
+        try:
+            message = self._events.get(timeout=self._timeout)
+        except queue.Empty:
+            raise TimeoutError()
+        if message is None:
+            raise ConnectionError("Stream local encerrado pelo servidor.")
+        return message
+
+    def close(self):
+        self._closed = True
+
+
+class AccountStateCache:
+    """
+    Estado incremental da conta de um usuário. É semeado uma vez com o snapshot REST (get_account)
+    e mantido pelos eventos do user-data stream (outboundAccountPosition, balanceUpdate,
+    executionReport). Leituras no ciclo do bot vêm da memória; uma reconciliação periódica
+    contra o REST corrige eventuais divergências.
+    """
+    def __init__(self, client, connect=connect_websocket, url=BINANCE_USER_STREAM_URL,
+                 reconcile_interval=300, max_backoff=30.0):
+        self.client = client
+        self.connect = connect
+        self.url = url
+        self.reconcile_interval = reconcile_interval
+        self.max_backoff = max_backoff
+        self._balances = {} # {ativo: (free, locked)} apenas com saldos não nulos
+        self._updated_at = {} # {ativo: horário do evento (ms) que definiu o saldo}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listen_key = None
+        self._last_keepalive = 0.0
+        self._last_reconcile = 0.0
+        self.recent_executions = collections.deque(maxlen=50) # Últimos executionReport recebidos
+        self.drift_corrections = 0
+
+    # --- Leitura ---
+
+    def is_ready(self):
+        """Indica se o cache já foi semeado e o stream está ativo."""
+        return self._ready.is_set()
+
+    def balances(self):
+        """Retorna uma cópia de {ativo: (free, locked)} sem tocar na rede."""
+        with self._lock:
+            return dict(self._balances)
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="user-data-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._ready.clear()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self._listen_key:
+            try:
+                governed_call(self.client, PRIORITY_ACCOUNT, "stream_close", listenKey=self._listen_key)
+            except Exception:
+                pass
+            self._listen_key = None
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                if self._listen_key is None:
+                    self._listen_key = governed_call(self.client, PRIORITY_ACCOUNT, "stream_get_listen_key")
+                    self._last_keepalive = time.monotonic()
+                conn = self.connect(self.url + self._listen_key)
+                # O snapshot REST é tirado depois de conectar, para que nenhum evento se perca
+                # entre o snapshot e o início do stream; eventos que o snapshot já inclui (horário do
+                # evento <= horário do saldo em memória) são descartados em apply_event.
+                self.reconcile()
+                self._ready.set()
+                backoff = 1.0
+                self._read_loop(conn)
+            except Exception as e:
+                self._ready.clear()
+                if self._stop_event.is_set():
+                    break
+                delay = min(backoff, self.max_backoff)
+                log.warning("User-data stream: conexão perdida (%s). Reconectando em %.1fs...", e, delay)
+                self._listen_key = None # Uma listen key nova é pedida na reconexão
+                self._stop_event.wait(delay)
+                backoff *= 2
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _read_loop(self, conn):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now - self._last_keepalive >= LISTEN_KEY_KEEPALIVE_SECONDS:
+                governed_call(self.client, PRIORITY_ACCOUNT, "stream_keepalive", listenKey=self._listen_key)
+                self._last_keepalive = now
+            if self.reconcile_interval and now - self._last_reconcile >= self.reconcile_interval:
+                self.reconcile()
+            try:
+                message = conn.recv()
+            except TimeoutError:
+                continue
+            self.apply_event(json.loads(message))
+
+    # --- Atualizações ---
+
+    def reconcile(self):
+        """Busca o snapshot REST e substitui o estado em memória, registrando divergências."""
+        account_info = governed_call(self.client, PRIORITY_ACCOUNT, "get_account")
+        snapshot = balances_from_account(account_info)
+        snapshot_time = account_info.get('updateTime', 0)
+        with self._lock:
+            # Saldos que o stream atualizou depois do snapshot são preservados
+            for asset, updated_at in self._updated_at.items():
+                if updated_at > snapshot_time:
+                    if asset in self._balances:
+                        snapshot[asset] = self._balances[asset]
+                    else:
+                        snapshot.pop(asset, None)
+            if self._last_reconcile and snapshot != self._balances:
+                drifted = sorted(set(snapshot.items()) ^ set(self._balances.items()))
+                self.drift_corrections += 1
+                log.warning("Divergência corrigida na reconciliação do user-data stream.", extra={"drifted": drifted})
+            self._balances = snapshot
+            for asset in snapshot:
+                self._updated_at[asset] = max(self._updated_at.get(asset, 0), snapshot_time)
+        self._last_reconcile = time.monotonic()
+
+    def apply_event(self, event):
+        """Aplica um evento do user-data stream ao estado em memória."""
+        event_type = event.get('e')
+        if event_type == 'outboundAccountPosition':
+            event_time = event.get('u', event.get('E', 0))
+            with self._lock:
+                for balance in event['B']:
+                    asset = balance['a']
+                    if event_time < self._updated_at.get(asset, 0):
+                        continue # Evento mais antigo que o estado atual
+                    free = float(balance['f'])
+                    locked = float(balance['l'])
+                    if free + locked > 0:
+                        self._balances[asset] = (free, locked)
+                    else:
+                        self._balances.pop(asset, None)
+                    self._updated_at[asset] = event_time
+        elif event_type == 'balanceUpdate':
+            # Depósitos/saques: o delta afeta apenas o saldo livre
+            asset = event['a']
+            delta = float(event['d'])
+            event_time = event.get('T', event.get('E', 0))
+            with self._lock:
+                if event_time <= self._updated_at.get(asset, 0):
+                    return # Já incluído no snapshot REST (ou em um evento posterior): não soma duas vezes
+                free, locked = self._balances.get(asset, (0.0, 0.0))
+                free += delta
+                if free + locked > 0:
+                    self._balances[asset] = (free, locked)
+                else:
+                    self._balances.pop(asset, None)
+                self._updated_at[asset] = event_time
+        elif event_type == 'executionReport':
+            # Os saldos resultantes chegam no outboundAccountPosition seguinte
+            self.recent_executions.append(event)
+
@@ -0,0 +1,88 @@
+# action_stream.py
+import json
+
+
+class IncrementalActionParser:
+    """
+    Parser incremental da resposta do LLM, que deve ser uma lista JSON de ações.
+    `feed` recebe pedaços do texto conforme chegam do streaming e retorna cada objeto de ação
+    assim que ele fica sintaticamente completo, sem esperar o fim da lista.
+    Tudo o que vem antes do '[' inicial (ex: ```json) e depois do ']' final é ignorado.
+    """
+    def __init__(self):
+        self.actions = [] # Todas as ações emitidas até agora
+        self.started = False # Já encontrou o '[' da lista
+        self.finished = False # Já encontrou o ']' que fecha a lista
+        self.errors = [] # Elementos que não puderam ser interpretados como objeto
+        self._depth = 0 # Profundidade dentro do elemento atual da lista
+        self._in_string = False
+        self._escaped = False
+        self._element = [] # Caracteres do elemento atual
+
+    @property
+    def valid(self):
+        """True quando a lista foi fechada e todos os seus elementos eram objetos JSON."""
+        return self.finished and not self.errors
+
+    def feed(self, text):
+        """Consome um pedaço da resposta e retorna a lista de ações completadas por ele."""
+        completed = []
+        for char in text:
+            if self.finished:
+                break
+            if not self.started:
+                self.started = char == "["
+                continue
+
+            if self._in_string:
+                if self._depth:
+                    self._element.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if not self._depth:
+                    self.errors.append("string fora de um objeto")
+                else:
+                    self._element.append(char)
+            elif char in "{[":
+                self._depth += 1
+                self._element.append(char)
+            elif char in "}]":
+                if not self._depth:
+                    # ']' no nível da lista: fim da resposta
+                    self.finished = char == "]"
+                    if not self.finished:
+                        self.errors.append("'}' sem objeto aberto")
+                    continue
+                self._depth -= 1
+                self._element.append(char)
+                if not self._depth:
+                    action = self._complete_element()
+                    if action is not None:
+                        completed.append(action)
+            elif self._depth:
+                self._element.append(char)
+            elif not char.isspace() and char != ",":
+                self.errors.append(f"caractere inesperado {char!r} na lista")
+        self.actions.extend(completed)
+        return completed
+
+    def _complete_element(self):
+        text = "".join(self._element)
+        self._element = []
+        try:
+            action = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.errors.append(f"{e}: {text}")
+            return None
+        if not isinstance(action, dict):
+            self.errors.append(f"elemento não é um objeto: {text}")
+            return None
+        return action
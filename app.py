@@ -1,13 +1,23 @@
 import threading
 import json
 import time
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, g
+import hmac
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, g, Response, stream_with_context
 from werkzeug.security import check_password_hash # Para verificar senhas
 import os # Para a chave secreta da sessão
 
 # Importar as funções de auth e db
 from auth import register_user, get_user_by_email, add_broker_config, get_user_broker_configs, get_openai_key_for_user, check_password
 from db import get_db, close_db, init_app as init_db_app # Importar init_app do db
+from rate_limiter import weight_governor
+from http_pool import http_pool
+from trade_ledger import fetch_trades
+from equity_series import equity_store
+from metrics import metrics, bot_profilers
+from logging_setup import get_logger
+from dashboard_store import dashboard_store
+
+log = get_logger("dashboard")
 
 # Importar funções do main.py para iniciar/parar o bot
 # Note: Estas serão referências às funções no escopo global de main.py
@@ -21,72 +31,32 @@ bot_stop_events = {} # Manter o controle dos eventos de parada no app também
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['DATABASE'] = 'database.db' # Define o nome do arquivo do banco de dados
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'sua_chave_secreta_padrao_muito_segura') # Use uma variável de ambiente ou uma chave forte
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN') # Se definido, o /metrics exige "Authorization: Bearer <token>"
 
 # Inicializa os Blueprints de db (para comandos CLI)
 init_db_app(app)
 
-# Global variables to store dashboard data (per user, in a real app, but for simplicity here)
-# For a multi-user dashboard, this would need to be a dict indexed by user_id
-dashboard_data_by_user = {} # {user_id: {status, usdt, portfolio, history}}
-
+# Estado do dashboard de cada usuário: snapshots imutáveis e versionados no dashboard_store,
+# escritos pelo barramento dos bots e lidos pelas rotas sem lock (ver dashboard_store.py)
 def get_user_dashboard_data(user_id):
-    if user_id not in dashboard_data_by_user:
-        dashboard_data_by_user[user_id] = {
-            "status": "Aguardando início do bot...",
-            "usdt": 0,
-            "portfolio": {},
-            "history": [],
-            "next_cycle_time": 0
-        }
-    return dashboard_data_by_user[user_id]
+    return dashboard_store.get(user_id).view()
 
 def update_dashboard_data(user_id, new_data):
-    current_data = get_user_dashboard_data(user_id)
-    
-    if "status" in new_data:
-        current_data["status"] = new_data["status"]
-    
-    if "usdt" in new_data:
-        current_data["usdt"] = new_data["usdt"]
-    
-    if "portfolio" in new_data:
-        # A lógica de atualização do portfólio pode ser mais complexa
-        # para garantir que os preços e quantidades sejam atualizados corretamente
-        updated_portfolio_data = {}
-        for symbol_pair, item_data in new_data["portfolio"].items():
-            if symbol_pair in current_data["portfolio"]:
-                # Atualiza item existente
-                current_data["portfolio"][symbol_pair].update(item_data)
-            else:
-                # Adiciona novo item
-                current_data["portfolio"][symbol_pair] = item_data
-            updated_portfolio_data[symbol_pair] = current_data["portfolio"][symbol_pair]
-        
-        # Remove símbolos que não estão mais no portfólio e não são USDT (ou tem qte zero)
-        keys_to_remove = [
-            sym for sym, data in current_data["portfolio"].items()
-            if sym not in updated_portfolio_data and sym != "USDT" and data.get("amount", 0) <= 0
-        ]
-        for key in keys_to_remove:
-            del current_data["portfolio"][key]
-
-        # Garante que USDT esteja sempre presente
-        if "USDT" in new_data["portfolio"]:
-            current_data["portfolio"]["USDT"] = new_data["portfolio"]["USDT"]
-        elif "USDT" not in current_data["portfolio"]:
-             current_data["portfolio"]["USDT"] = {"amount": 0, "current_price": 1.0}
-
-
-    if "history" in new_data:
-        for item in new_data["history"]:
-            if len(current_data["history"]) >= 20:
-                current_data["history"].pop(0)
-            current_data["history"].append(item)
-    
-    if "next_cycle_time" in new_data:
-        current_data["next_cycle_time"] = new_data["next_cycle_time"]
+    dashboard_store.update(user_id, new_data)
+    # Só a atualização recebida (não o estado inteiro do usuário), e só com o componente "dashboard" em DEBUG
+    log.debug("Dashboard atualizado.", extra={"user_id": user_id, "update": new_data})
+
+def get_dashboard_delta(user_id, since=0):
+    """
+    Retorna o que mudou no dashboard do usuário desde a versão `since`.
+    Com since=0 (ou uma versão desconhecida, ex: após reiniciar o servidor) devolve o estado completo
+    com "full": True. O campo "version" deve ser enviado de volta na próxima consulta.
+    """
+    return dashboard_store.delta(user_id, since)
 
-    print(f"[WEB DASHBOARD DATA UPDATED] for user {user_id}", current_data)
+def wait_for_dashboard_change(user_id, since, timeout):
+    """Bloqueia até o dashboard do usuário passar da versão `since` ou o timeout expirar."""
+    dashboard_store.wait_for_change(user_id, since, timeout)
 
 
 # --- Rotas de Autenticação e Principal ---
@@ -232,7 +202,7 @@ def start_bot_endpoint():
     success = start_bot_for_user(user_id) # Esta função é do main.py
 
     if success:
-        get_user_dashboard_data(user_id)["status"] = f"Bot iniciado para {g.user['email']}. Aguardando ciclo..."
+        update_dashboard_data(user_id, {"status": f"Bot iniciado para {g.user['email']}. Aguardando ciclo..."})
         return jsonify({"status": "success", "message": f"Bot iniciado para o usuário {g.user['email']}."}), 200
     else:
         return jsonify({"status": "error", "message": f"Falha ao iniciar o bot para o usuário {g.user['email']}. Verifique os logs."}), 500
@@ -255,7 +225,7 @@ def stop_bot_endpoint():
     success = stop_bot_for_user(user_id) # Esta função é do main.py
 
     if success:
-        get_user_dashboard_data(user_id)["status"] = f"Bot parado para {g.user['email']}."
+        update_dashboard_data(user_id, {"status": f"Bot parado para {g.user['email']}."})
         return jsonify({"status": "success", "message": f"Bot parado para o usuário {g.user['email']}."}), 200
     else:
         return jsonify({"status": "error", "message": f"Falha ao parar o bot para o usuário {g.user['email']}."}), 500
@@ -266,8 +236,113 @@ def data():
     if not g.user:
         return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
     
-    # Retorna os dados do dashboard específicos para o usuário logado
-    return jsonify(get_user_dashboard_data(g.user['id']))
+    # Retorna os dados do dashboard específicos para o usuário logado.
+    # Com ?since=N retorna apenas o que mudou desde a versão N; com &wait=S (long-poll)
+    # espera até S segundos por uma mudança antes de responder.
+    since = request.args.get('since', 0, type=int)
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    if since and wait > 0:
+        wait_for_dashboard_change(g.user['id'], since, wait)
+    return jsonify(get_dashboard_delta(g.user['id'], since))
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events: envia ao navegador apenas as mudanças do dashboard, assim que acontecem."""
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+
+    user_id = g.user['id']
+    # Ao reconectar, o EventSource envia o último id recebido no cabeçalho Last-Event-ID
+    since = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+
+    def generate():
+        last_version = since
+        while True:
+            delta = get_dashboard_delta(user_id, last_version)
+            if delta["version"] != last_version or delta.get("full"):
+                last_version = delta["version"]
+                yield f"id: {last_version}\ndata: {json.dumps(delta)}\n\n"
+            else:
+                yield ": keepalive\n\n" # Mantém a conexão viva através de proxies
+            wait_for_dashboard_change(user_id, last_version, timeout=15)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/history')
+def history():
+    """
+    Histórico completo de negociações do usuário, paginado por cursor:
+    /history?limit=50 e depois /history?cursor=<next_cursor> até next_cursor ser null.
+    """
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    trades, next_cursor = fetch_trades(get_db(), g.user['id'], request.args.get('cursor'), limit)
+    return jsonify({"trades": trades, "next_cursor": next_cursor})
+
+@app.route('/equity')
+def equity():
+    """
+    Evolução do patrimônio do usuário, já reduzida no servidor para `width` pontos
+    (/equity?width=800&method=lttb|minmax&start=<epoch>&end=<epoch>).
+    """
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+    width = max(3, min(request.args.get('width', 800, type=int), 4000))
+    return jsonify(equity_store.query(
+        g.user['id'], width,
+        start=request.args.get('start', type=float),
+        end=request.args.get('end', type=float),
+        method=request.args.get('method', 'lttb')
+    ))
+
+@app.route('/rate_limits')
+def rate_limits():
+    """Uso atual do orçamento de peso da Binance, compartilhado por todos os bots do processo."""
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+    return jsonify(weight_governor.metrics())
+
+@app.route('/http_stats')
+def http_stats():
+    """Reuso de conexões, tempo de conexão (TCP+TLS) e espera pelo pool de cada upstream."""
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+    return jsonify(http_pool.metrics())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Métricas do processo no formato de texto do Prometheus: duração de cada estágio dos ciclos por usuário,
+    chamadas à Binance e ao OpenAI, ordens enviadas e o estado do processo. Sem sessão, para o coletor.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return Response("Não autorizado.\n", status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profile', methods=['GET', 'POST'])
+def profile():
+    """
+    Profiler por amostragem do bot do usuário logado. POST liga o profiler por `seconds` (até 300),
+    com uma amostra a cada `interval` segundos; GET retorna o resultado (?format=folded para flame graphs).
+    """
+    if not g.user:
+        return jsonify({"status": "error", "message": "Usuário não autenticado."}), 401
+    user_id = g.user['id']
+    if request.method == 'POST':
+        seconds = max(1.0, min(request.values.get('seconds', 30, type=float), 300))
+        interval = max(0.001, request.values.get('interval', 0.005, type=float))
+        if bot_profilers.start(user_id, seconds, interval) is None:
+            return jsonify({"status": "error", "message": "O bot deste usuário não está rodando."}), 400
+        return jsonify({"status": "success", "message": f"Profiler ligado por {seconds:.0f} segundos."})
+    profiler = bot_profilers.get(user_id)
+    if profiler is None:
+        return jsonify({"status": "error", "message": "Nenhum profiler foi ligado para este bot."}), 404
+    if request.args.get('format') == 'folded':
+        return Response(profiler.folded(), mimetype='text/plain')
+    return jsonify(profiler.report(request.args.get('limit', 20, type=int)))
 
 @app.route('/update_data', methods=['POST'])
 def receive_bot_data():
@@ -1,11 +1,59 @@
 # auth.py
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import Blueprint, request, redirect, url_for, session, g
 from db import get_db, close_db # Importar get_db e close_db
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+class BrokerConfigCache:
+    """
+    Cache das configurações de corretora por usuário (LRU de até `max_entries` usuários).
+    add_broker_config invalida a entrada do usuário; o `ttl` só cobre alterações feitas
+    no banco por fora deste processo. max_entries = 0 desativa o cache.
+    """
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # {user_id: (instante, configurações)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Retorna uma cópia das configurações do usuário, ou None se não estiverem no cache."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return [dict(config) for config in entry[1]]
+
+    def put(self, user_id, configs):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), [dict(config) for config in configs])
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Remove a entrada do usuário (ou todas, com user_id=None)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+# Instância única do processo
+broker_config_cache = BrokerConfigCache()
+
 # Função para inicializar o Blueprint em seu app Flask
 def init_app(app):
     app.register_blueprint(bp)
@@ -69,20 +117,24 @@ def add_broker_config(user_id, broker_name, api_key, secret_key, openai_api_key)
     except Exception as e:
         db.rollback()
         raise Exception(f"Erro ao adicionar/atualizar configuração da corretora: {e}")
+    finally:
+        broker_config_cache.invalidate(user_id)
 
 def get_user_broker_configs(user_id):
+    configs = broker_config_cache.get(user_id)
+    if configs is not None:
+        return configs
     db = get_db()
     configs = db.execute(
-        "SELECT id, broker_name, api_key, secret_key, openai_api_key FROM broker_configs WHERE user_id = ?",
+        "SELECT id, broker_name, api_key, secret_key, openai_api_key FROM broker_configs WHERE user_id = ? ORDER BY id",
         (user_id,)
     ).fetchall()
-    return [dict(row) for row in configs] # Converte para lista de dicionários
+    configs = [dict(row) for row in configs] # Converte para lista de dicionários
+    broker_config_cache.put(user_id, configs)
+    return configs
 
 # NOVO: Função para obter apenas a chave da OpenAI para um usuário
 def get_openai_key_for_user(user_id):
-    db = get_db()
-    config = db.execute(
-        "SELECT openai_api_key FROM broker_configs WHERE user_id = ? LIMIT 1",
-        (user_id,)
-    ).fetchone()
-    return config['openai_api_key'] if config else None
\ No newline at end of file
+    # Mesma linha que a primeira configuração do usuário, lida do cache quando possível
+    configs = get_user_broker_configs(user_id)
+    return configs[0]['openai_api_key'] if configs else None
\ No newline at end of file
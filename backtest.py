@@ -0,0 +1,363 @@
+# backtest.py
+# Reexecuta a estratégia sobre candles históricos (OHLCV) pelo mesmo caminho de decisão do bot:
+# generate_openai_prompt -> LLM -> parse_openai_response -> execute_trade_action.
+# Uso: python backtest.py dados/BTCUSDT-1m.csv dados/ETHUSDT-1m.csv --llm momentum --output resultado.json
+#      python backtest.py --synthetic-bars 525600 --llm momentum   (1 ano de candles de 1 minuto sintéticos)
+import argparse
+import bisect
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from exchange_info import exchange_info
+from logging_setup import quiet_logs
+from trade_logic import build_portfolio, execute_trade_action, generate_openai_prompt, parse_openai_response
+
+# Configuração usada quando config.json não define as chaves
+DEFAULT_CONFIG = {
+    "TRADE_INTERVAL_SECONDS": 300,
+    "MAX_TRADES_PER_CYCLE": 1,
+    "QUANTITY_PER_TRADE_USDT": 10,
+    "PROMPT_TOKEN_BUDGET": 300
+}
+
+
+def read_klines(path):
+    """
+    Lê um CSV de candles de um símbolo: o formato do data.binance.vision (sem cabeçalho, open_time em
+    ms ou µs) ou um CSV com cabeçalho contendo open_time/timestamp, open e close.
+    Retorna um DataFrame com colunas open e close indexado pelo horário (UTC).
+    """
+    frame = pd.read_csv(path, header=None)
+    if not pd.api.types.is_numeric_dtype(frame[0]):
+        frame = pd.read_csv(path)
+        time_column = "open_time" if "open_time" in frame.columns else "timestamp"
+        frame = frame.rename(columns={time_column: 0, "open": 1, "close": 4})
+    times = frame[0]
+    if pd.api.types.is_numeric_dtype(times):
+        unit = "us" if times.iloc[0] > 1e14 else "ms"
+        index = pd.to_datetime(times, unit=unit, utc=True)
+    else:
+        index = pd.to_datetime(times, utc=True)
+    return pd.DataFrame({"open": frame[1].astype(float).values, "close": frame[4].astype(float).values},
+                        index=pd.DatetimeIndex(index, name="timestamp"))
+
+
+def load_ohlcv(paths):
+    """
+    Junta os CSVs ({símbolo: caminho}) em duas matrizes alinhadas pelo horário (linhas = candles,
+    colunas = símbolos): aberturas e fechamentos. Fechamentos ausentes repetem o último conhecido.
+    """
+    frames = {symbol: read_klines(path) for symbol, path in paths.items()}
+    closes = pd.concat({symbol: frame["close"] for symbol, frame in frames.items()}, axis=1).sort_index().ffill()
+    opens = pd.concat({symbol: frame["open"] for symbol, frame in frames.items()}, axis=1).sort_index()
+    return opens.fillna(closes.shift(1)), closes
+
+
+def synthetic_ohlcv(symbols, bars, start="2024-01-01", freq="1min", seed=7):
+    """Candles sintéticos (passeio aleatório geométrico) para testar a estratégia e medir desempenho."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=bars, freq=freq, tz="UTC")
+    start_prices = rng.uniform(0.1, 50000, len(symbols))
+    log_returns = rng.normal(0.0, 0.0015, (bars, len(symbols)))
+    closes = start_prices * np.exp(np.cumsum(log_returns, axis=0))
+    opens = np.vstack([start_prices, closes[:-1]]) * np.exp(rng.normal(0.0, 0.0002, (bars, len(symbols))))
+    return pd.DataFrame(opens, index=index, columns=symbols), pd.DataFrame(closes, index=index, columns=symbols)
+
+
+def to_utc_timestamp(value):
+    """Epoch em segundos ou data ISO (sem fuso = UTC) como pd.Timestamp em UTC."""
+    if isinstance(value, (int, float)):
+        return pd.Timestamp(value, unit="s", tz="UTC")
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+
+class ConstantLLM:
+    """LLM de teste: sempre a mesma resposta (ex: "[]" para nunca negociar)."""
+    def __init__(self, response="[]"):
+        self.response = response
+
+    def __call__(self, prompt, context):
+        return self.response
+
+
+class MomentumLLM:
+    """
+    LLM de teste determinístico: compra o símbolo de maior alta nos últimos `lookback` candles
+    e vende os ativos em queda. Usa só os candles até o momento da decisão (sem olhar o futuro).
+    """
+    def __init__(self, lookback=60):
+        self.lookback = lookback
+
+    def __call__(self, prompt, context):
+        closes = context["closes"]
+        if len(closes) <= self.lookback:
+            return "[]"
+        change = closes[-1] / closes[-1 - self.lookback] - 1
+        actions = []
+        for symbol, data in context["portfolio"].items():
+            if symbol != "USDT" and data["amount"] > 0 and change[context["symbols"].index(symbol)] < 0:
+                # Arredondada para baixo: sem filtros da Binance, o bot arredonda a quantidade para 5 casas
+                actions.append({"action": "SELL", "symbol": symbol, "quantity": float(np.floor(data["amount"] * 1e5) / 1e5)})
+        best = int(np.argmax(np.where(np.isfinite(change), change, -np.inf)))
+        if change[best] > 0:
+            actions.append({"action": "BUY", "symbol": context["symbols"][best], "usdt_amount": context["max_trade_usdt"]})
+        return json.dumps(actions)
+
+
+class RecordedLLM:
+    """
+    Respostas gravadas de um LLM real, uma por linha em JSONL: {"timestamp": <epoch ou ISO>, "response": "..."}.
+    Cada decisão recebe a última resposta gravada até o seu horário; sem timestamps, as respostas
+    são usadas em sequência.
+    """
+    def __init__(self, path):
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        self.responses = [record["response"] for record in records]
+        self.times = None
+        if records and all("timestamp" in record for record in records):
+            self.times = [to_utc_timestamp(record["timestamp"]) for record in records]
+            order = sorted(range(len(records)), key=self.times.__getitem__)
+            self.times = [self.times[i] for i in order]
+            self.responses = [self.responses[i] for i in order]
+        self._next = 0
+
+    def __call__(self, prompt, context):
+        if self.times is not None:
+            position = bisect.bisect_right(self.times, context["timestamp"]) - 1
+            return self.responses[position] if position >= 0 else "[]"
+        if self._next >= len(self.responses):
+            return "[]"
+        self._next += 1
+        return self.responses[self._next - 1]
+
+
+class BacktestBroker:
+    """
+    Conta simulada com a mesma interface de ordens do BinanceAPI usada por execute_trade_action.
+    Uma ordem decidida no candle t é executada na abertura do candle t + 1, com slippage contra
+    quem negocia e taxa cobrada em USDT. Cada execução é guardada para a avaliação vetorizada.
+    """
+    def __init__(self, opens, symbols, initial_usdt, fee_rate=0.001, slippage=0.0005):
+        self.opens = opens # Matriz NumPy (candles x símbolos)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.usdt = float(initial_usdt)
+        self.holdings = np.zeros(len(symbols))
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.bar = 0 # Candle da decisão atual
+        self.fills = [] # (candle da execução, símbolo, quantidade com sinal, preço, fluxo de caixa, taxa)
+        self._order_ids = 0
+
+    def submit_market_order(self, side, symbol, quantity, client_order_id=None):
+        column = self.symbol_index.get(symbol)
+        fill_bar = self.bar + 1
+        if column is None or fill_bar >= len(self.opens) or not np.isfinite(self.opens[fill_bar, column]):
+            return None, "rejected"
+        quantity = float(quantity)
+        price = float(self.opens[fill_bar, column]) * (1 + self.slippage if side == "BUY" else 1 - self.slippage)
+        notional = quantity * price
+        fee = notional * self.fee_rate
+        if side == "BUY":
+            if notional + fee > self.usdt:
+                return None, "rejected" # Saldo insuficiente no preço de execução
+            cash_flow, signed_quantity = -(notional + fee), quantity
+        else:
+            if quantity > self.holdings[column] + 1e-12:
+                return None, "rejected"
+            cash_flow, signed_quantity = notional - fee, -quantity
+        self.usdt += cash_flow
+        self.holdings[column] += signed_quantity
+        self.fills.append((fill_bar, column, signed_quantity, price, cash_flow, fee))
+        self._order_ids += 1
+        return {
+            "symbol": symbol,
+            "orderId": self._order_ids,
+            "clientOrderId": client_order_id,
+            "side": side,
+            "status": "FILLED",
+            "executedQty": repr(quantity),
+            "cummulativeQuoteQty": repr(notional),
+            "fills": [{"price": repr(price), "qty": repr(quantity), "commission": repr(fee), "commissionAsset": "USDT"}]
+        }, "filled"
+
+    def balances(self, symbols):
+        """Saldos no formato de get_balances: {ativo: (livre, bloqueado)}."""
+        balances = {"USDT": (self.usdt, 0.0)}
+        for symbol, amount in zip(symbols, self.holdings):
+            if amount > 0:
+                balances[symbol.replace("USDT", "")] = (float(amount), 0.0)
+        return balances
+
+
+class Backtest:
+    """
+    Replay da estratégia sobre candles históricos. As decisões (a cada TRADE_INTERVAL_SECONDS)
+    passam pelo caminho real do bot; como cada uma depende dos saldos deixados pela anterior, esse
+    laço é sequencial. Já a avaliação de todos os candles (posições, caixa, patrimônio, taxas,
+    drawdown) é feita de uma vez com NumPy a partir das execuções registradas pelo BacktestBroker.
+    """
+    def __init__(self, opens, closes, llm, config=None, initial_usdt=1000.0, fee_rate=0.001, slippage=0.0005):
+        self.symbols = list(closes.columns)
+        self.index = closes.index
+        self.opens = opens[self.symbols].to_numpy(dtype=np.float64)
+        self.closes = closes.to_numpy(dtype=np.float64)
+        self.llm = llm
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.initial_usdt = initial_usdt
+        self.broker = BacktestBroker(self.opens, self.symbols, initial_usdt, fee_rate, slippage)
+
+    def decision_bars(self):
+        """Índices dos candles em que o bot decide, um a cada TRADE_INTERVAL_SECONDS."""
+        seconds = (self.index - self.index[0]).total_seconds().to_numpy()
+        steps = (seconds // max(1, int(self.config["TRADE_INTERVAL_SECONDS"]))).astype(np.int64)
+        return np.flatnonzero(np.diff(steps, prepend=-1))
+
+    def run(self, quiet=True):
+        """Executa o replay e retorna {"stats", "equity" (Series), "trades" (DataFrame)}."""
+        started_at = time.perf_counter()
+        decision_bars = self.decision_bars()
+        max_trades = self.config.get("MAX_TRADES_PER_CYCLE", 1)
+        # Os logs do caminho de negociação a cada ordem dominariam o tempo do replay
+        with quiet_logs() if quiet else contextlib.nullcontext():
+            for bar, timestamp in zip(decision_bars, self.index[decision_bars]):
+                self._decide(bar, timestamp, max_trades)
+        stats, equity, trades = self.evaluate()
+        stats["decisions"] = int(len(decision_bars))
+        stats["elapsed_seconds"] = round(time.perf_counter() - started_at, 3)
+        return {"stats": stats, "equity": equity, "trades": trades}
+
+    def _decide(self, bar, timestamp, max_trades):
+        """Um ciclo do bot no candle `bar`: prompt -> LLM -> parse -> execute_trade_action."""
+        self.broker.bar = bar
+        row = self.closes[bar]
+        current_prices = {symbol: float(price) for symbol, price in zip(self.symbols, row) if np.isfinite(price)}
+        usdt_balance, portfolio_data = build_portfolio(self.broker.balances(self.symbols), current_prices, self.symbols)
+        portfolio_data["USDT"] = {"amount": usdt_balance, "current_price": 1.0}
+        prompt = generate_openai_prompt(usdt_balance, portfolio_data, self.config)
+        response = self.llm(prompt, {
+            "timestamp": timestamp,
+            "symbols": self.symbols,
+            "closes": self.closes[:bar + 1],
+            "portfolio": portfolio_data,
+            "max_trade_usdt": self.config["QUANTITY_PER_TRADE_USDT"]
+        })
+        executed = 0
+        for action in parse_openai_response(response):
+            if executed >= max_trades:
+                break
+            user_config = dict(self.config, portfolio_data=portfolio_data)
+            if execute_trade_action(action, self.broker, current_prices, self.broker.usdt, user_config):
+                executed += 1
+                _, portfolio_data = build_portfolio(self.broker.balances(self.symbols), current_prices, self.symbols)
+
+    def evaluate(self):
+        """Posições, caixa e patrimônio em todos os candles, vetorizados a partir das execuções."""
+        bars, columns = self.closes.shape
+        fills = np.array(self.broker.fills, dtype=np.float64).reshape(-1, 6)
+        fill_bars = fills[:, 0].astype(np.int64)
+        position_changes = np.zeros((bars, columns))
+        np.add.at(position_changes, (fill_bars, fills[:, 1].astype(np.int64)), fills[:, 2])
+        positions = np.cumsum(position_changes, axis=0)
+        cash = self.initial_usdt + np.cumsum(np.bincount(fill_bars, weights=fills[:, 4], minlength=bars))
+        equity = cash + np.nansum(positions * self.closes, axis=1)
+
+        returns = np.diff(equity) / equity[:-1]
+        bar_seconds = float(np.median(np.diff((self.index - self.index[0]).total_seconds()))) if bars > 1 else 60.0
+        periods_per_year = 365 * 86400 / bar_seconds
+        drawdown = equity / np.maximum.accumulate(equity) - 1
+        first_prices = pd.DataFrame(self.closes).bfill().to_numpy()[0]
+        buy_and_hold = np.nanmean(self.closes[-1] / first_prices) - 1
+        stats = {
+            "symbols": self.symbols,
+            "bars": int(bars),
+            "start": str(self.index[0]),
+            "end": str(self.index[-1]),
+            "initial_usdt": self.initial_usdt,
+            "final_equity": round(float(equity[-1]), 2),
+            "total_return": round(float(equity[-1] / self.initial_usdt - 1), 6),
+            "buy_and_hold_return": round(float(buy_and_hold), 6),
+            "max_drawdown": round(float(drawdown.min()), 6),
+            "sharpe": round(float(returns.mean() / returns.std() * np.sqrt(periods_per_year)), 3) if len(returns) and returns.std() > 0 else 0.0,
+            "trades": int(len(fills)),
+            "fees_usdt": round(float(fills[:, 5].sum()), 4),
+            "turnover_usdt": round(float(np.abs(fills[:, 2] * fills[:, 3]).sum()), 2)
+        }
+        trades = pd.DataFrame({
+            "timestamp": self.index[fill_bars],
+            "symbol": [self.symbols[i] for i in fills[:, 1].astype(np.int64)],
+            "side": np.where(fills[:, 2] > 0, "BUY", "SELL"),
+            "quantity": np.abs(fills[:, 2]),
+            "price": fills[:, 3],
+            "fee_usdt": fills[:, 5]
+        })
+        return stats, pd.Series(equity, index=self.index, name="equity"), trades
+
+
+def load_config(path="config.json"):
+    config = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                config = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Erro ao ler {path}. Usando configurações padrão.")
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest da estratégia sobre candles históricos.")
+    parser.add_argument("files", nargs="*", help="CSVs de candles, um por símbolo (o símbolo vem do início do nome do arquivo)")
+    parser.add_argument("--synthetic-bars", type=int, default=0, help="Usa N candles sintéticos de 1 minuto em vez de arquivos")
+    parser.add_argument("--llm", choices=["hold", "momentum", "recorded"], default="momentum")
+    parser.add_argument("--recorded", help="JSONL com respostas gravadas (--llm recorded)")
+    parser.add_argument("--lookback", type=int, default=60, help="Candles observados pelo --llm momentum")
+    parser.add_argument("--initial-usdt", type=float, default=1000.0)
+    parser.add_argument("--fee", type=float, default=0.001, help="Taxa por negociação (0.001 = 0,1%%)")
+    parser.add_argument("--slippage", type=float, default=0.0005)
+    parser.add_argument("--exchange-info", help="JSON de exchangeInfo da Binance, para quantizar as ordens como no bot")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--output", help="Grava estatísticas e negociações em JSON")
+    parser.add_argument("--equity-csv", help="Grava a curva de patrimônio em CSV")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    symbols = config.get("symbols_to_watch", ["BTCUSDT", "ETHUSDT"])
+    if args.synthetic_bars:
+        opens, closes = synthetic_ohlcv(symbols, args.synthetic_bars)
+    elif args.files:
+        opens, closes = load_ohlcv({os.path.basename(path).split("-")[0].split(".")[0].upper(): path for path in args.files})
+    else:
+        parser.error("informe arquivos CSV ou --synthetic-bars")
+
+    if args.exchange_info:
+        with open(args.exchange_info) as f:
+            exchange_info.load(json.load(f))
+
+    if args.llm == "recorded":
+        if not args.recorded:
+            parser.error("--llm recorded requer --recorded <arquivo.jsonl>")
+        llm = RecordedLLM(args.recorded)
+    elif args.llm == "hold":
+        llm = ConstantLLM("[]")
+    else:
+        llm = MomentumLLM(args.lookback)
+
+    result = Backtest(opens, closes, llm, config, args.initial_usdt, args.fee, args.slippage).run()
+    print(json.dumps(result["stats"], indent=2))
+    if args.output:
+        trades = result["trades"].assign(timestamp=result["trades"]["timestamp"].astype(str))
+        with open(args.output, "w") as f:
+            json.dump({"stats": result["stats"], "trades": trades.to_dict(orient="records")}, f, indent=2)
+    if args.equity_csv:
+        result["equity"].to_csv(args.equity_csv)
+
+
+if __name__ == "__main__":
+    main()
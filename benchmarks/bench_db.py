@@ -0,0 +1,148 @@
+# benchmarks/bench_db.py
+"""
+Vazão das leituras do dashboard/auth com bots gravando negociações ao mesmo tempo.
+Compara a camada antiga (uma conexão nova por requisição, journal padrão, sem cache)
+com a atual (pool de conexões, WAL + pragmas, cache das configurações de corretora).
+
+Uso: python benchmarks/bench_db.py --threads 8 --seconds 5 --users 200
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import auth
+import db
+from trade_ledger import INSERT_TRADE, fetch_trades
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema.sql")
+
+
+def create_database(path, users, trades_per_user, pragmas):
+    conn = db.connect(path, pragmas)
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    for user_id in range(1, users + 1):
+        conn.execute("INSERT INTO users (id, email, password) VALUES (?, ?, ?)", (user_id, f"user{user_id}@bench", "x"))
+        conn.execute(
+            "INSERT INTO broker_configs (user_id, broker_name, api_key, secret_key, openai_api_key) VALUES (?, ?, ?, ?, ?)",
+            (user_id, "Binance", f"key{user_id}", f"secret{user_id}", f"sk-{user_id}")
+        )
+        conn.executemany(INSERT_TRADE, [
+            (user_id, datetime.now().isoformat(), "BUY", "BTCUSDT", 0.001, 60000.0, None, None, None, "llm")
+            for _ in range(trades_per_user)
+        ])
+    conn.commit()
+    conn.close()
+
+
+def writer(path, pragmas, users, stop, counters):
+    """Simula os bots: pequenas transações de negociações, como o trade_ledger faz em lotes."""
+    conn = db.connect(path, pragmas)
+    while not stop.is_set():
+        batch = [(random.randint(1, users), datetime.now().isoformat(), "SELL", "ETHUSDT", 0.01, 3000.0, None, None, None, "llm")
+                 for _ in range(8)]
+        try:
+            with conn:
+                conn.executemany(INSERT_TRADE, batch)
+            counters["writes"] += len(batch)
+        except sqlite3.OperationalError:
+            counters["write_errors"] += 1
+        time.sleep(0.005)
+    conn.close()
+
+
+def reader(app, users, stop, latencies, counters):
+    """Simula as requisições web: configurações do usuário, chave da OpenAI e uma página do histórico."""
+    while not stop.is_set():
+        user_id = random.randint(1, users)
+        started_at = time.perf_counter()
+        try:
+            with app.app_context():
+                auth.get_user_broker_configs(user_id)
+                auth.get_openai_key_for_user(user_id)
+                fetch_trades(db.get_db(), user_id, limit=20)
+                db.close_db()
+        except sqlite3.OperationalError:
+            counters["read_errors"] += 1
+            continue
+        latencies.append(time.perf_counter() - started_at)
+
+
+def run(mode, threads, seconds, users, trades_per_user):
+    if mode == "before":
+        pragmas, max_idle, cache_entries = (), 0, 0
+    else:
+        pragmas, max_idle, cache_entries = db.PRAGMAS, threads, 256
+    db.connection_pool.close_all()
+    db.connection_pool.pragmas = pragmas
+    db.connection_pool.max_idle = max_idle
+    auth.broker_config_cache.max_entries = cache_entries
+    auth.broker_config_cache.invalidate()
+
+    directory = tempfile.mkdtemp(prefix="bench_db_")
+    path = os.path.join(directory, "bench.db")
+    create_database(path, users, trades_per_user, pragmas)
+    app = Flask(__name__)
+    app.config["DATABASE"] = path
+
+    stop = threading.Event()
+    counters = {"writes": 0, "write_errors": 0, "read_errors": 0}
+    latencies = [[] for _ in range(threads)]
+    workers = [threading.Thread(target=writer, args=(path, pragmas, users, stop, counters))]
+    workers += [threading.Thread(target=reader, args=(app, users, stop, latencies[i], counters)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    db.connection_pool.close_all()
+
+    samples = sorted(latency for per_thread in latencies for latency in per_thread)
+    return {
+        "mode": mode,
+        "requests": len(samples),
+        "requests_per_second": round(len(samples) / seconds, 1),
+        "p50_ms": round(1000 * samples[len(samples) // 2], 3) if samples else None,
+        "p99_ms": round(1000 * samples[int(len(samples) * 0.99)], 3) if samples else None,
+        "mean_ms": round(1000 * statistics.fmean(samples), 3) if samples else None,
+        "trades_written": counters["writes"],
+        "read_errors": counters["read_errors"],
+        "write_errors": counters["write_errors"],
+        "connections_opened": db.connection_pool.opened
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da camada de banco de dados (antes/depois).")
+    parser.add_argument("--threads", type=int, default=8, help="Threads simulando requisições web")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duração de cada modo")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--trades-per-user", type=int, default=50)
+    args = parser.parse_args()
+
+    results = []
+    for mode in ("before", "after"):
+        db.connection_pool.opened = 0
+        results.append(run(mode, args.threads, args.seconds, args.users, args.trades_per_user))
+        print(json.dumps(results[-1]))
+    before, after = results
+    if before["requests_per_second"]:
+        print(f"Vazão: {before['requests_per_second']} -> {after['requests_per_second']} req/s "
+              f"({after['requests_per_second'] / before['requests_per_second']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
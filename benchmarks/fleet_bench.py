@@ -0,0 +1,311 @@
+# benchmarks/fleet_bench.py
+"""
+Quantos usuários simultâneos um processo do main.py aguenta. Sobe N bots por start_bot_for_user,
+como o dashboard faz, contra servidores locais que imitam a Binance e o OpenAI (latências lognormais
+configuráveis), com TRADE_INTERVAL_SECONDS curto, e mede: latência dos ciclos (total e por estágio),
+ciclos/s, threads, RSS e latência do /data do dashboard sob carga.
+
+O resultado é um JSON (--output) com a configuração e o commit, para comparar regressões entre commits:
+    python benchmarks/fleet_bench.py --bots 200 --seconds 60 --output fleet_$(git rev-parse --short HEAD).json
+
+Uso: python benchmarks/fleet_bench.py --bots 50 --interval 5 --seconds 30 --llm-latency gpt-4o=1.5:0.5
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import requests
+from binance.client import Client
+from werkzeug.serving import make_server
+
+from fake_binance_server import DEFAULT_LATENCY as EXCHANGE_LATENCY, FakeBinanceServer
+from fake_openai_server import DEFAULT_LATENCY as LLM_LATENCY, FakeOpenAIServer
+
+# Uma compra pequena por ciclo: exercita prompt, parse, validação dos filtros, ordem e dashboard
+DEFAULT_RESPONSE = '[{"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10, "reason": "Resposta simulada."}]'
+INITIAL_USDT = 1000000 # Saldo de cada conta: não acaba durante o teste
+
+
+def parse_latency(specs, defaults):
+    """['nome=mediana:sigma', ...] -> {nome: (mediana, sigma)}, partindo dos padrões."""
+    latency = dict(defaults)
+    for spec in specs:
+        name, values = spec.split("=", 1)
+        median, sigma = values.split(":", 1)
+        latency[name] = (float(median), float(sigma))
+    return latency
+
+
+def percentiles(samples):
+    """p50/p90/p99/max/média (mesma unidade das amostras), ou None sem amostras."""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {
+        "count": len(samples),
+        "p50": round(pick(0.5), 1),
+        "p90": round(pick(0.9), 1),
+        "p99": round(pick(0.99), 1),
+        "max": round(samples[-1], 1),
+        "mean": round(statistics.fmean(samples), 1)
+    }
+
+
+def rss_mb():
+    """Memória residente atual do processo (MB); sem /proc, o pico informado pelo getrusage."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class FleetCollector:
+    """Assinante do dashboard_bus: guarda os cycle_timings publicados pelos bots, com o instante da publicação."""
+    def __init__(self):
+        self.cycles = [] # [(instante, user_id, {estágio: ms})]
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id, data):
+        timings = data.get("cycle_timings")
+        if timings:
+            with self._lock:
+                self.cycles.append((time.time(), user_id, timings))
+
+    def window(self, start, end):
+        with self._lock:
+            return [cycle for cycle in self.cycles if start <= cycle[0] < end]
+
+
+def sample_process(stop, samples, interval=1.0):
+    """Threads ativas e RSS a cada `interval` segundos."""
+    while not stop.wait(interval):
+        samples.append((time.time(), threading.active_count(), rss_mb()))
+
+
+def poll_dashboard(base_url, cookies, stop, latencies, errors, interval):
+    """Um navegador aberto no dashboard: GET /data de um usuário aleatório a cada `interval` segundos."""
+    session = requests.Session()
+    while not stop.is_set():
+        user_id, cookie = random.choice(cookies)
+        started_at = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}/data", cookies=cookie, timeout=10)
+            if response.status_code == 200:
+                latencies.append((time.time(), (time.perf_counter() - started_at) * 1000))
+            else:
+                errors.append(response.status_code)
+        except requests.RequestException as e:
+            errors.append(type(e).__name__)
+        stop.wait(interval)
+
+
+def write_config(args, openai_url):
+    """config.json do diretório de trabalho, lido pelo main.py na importação."""
+    config = {
+        "TRADE_INTERVAL_SECONDS": args.interval,
+        "QUANTITY_PER_TRADE_USDT": 10,
+        "MARKET_DATA_STREAM": False, # Sem WebSocket: os preços vêm do servidor falso pelo REST
+        "USER_DATA_STREAM": False,
+        "DECISION_CACHE_ENABLED": False, # Todo ciclo chama o LLM
+        "RISK_ENGINE_ENABLED": False,
+        "OPENAI_BASE_URL": openai_url,
+        "EXCHANGE_BACKEND": args.backend,
+        "SIM_LATENCY_SECONDS": EXCHANGE_LATENCY["order"][0],
+        "SIM_INITIAL_USDT": INITIAL_USDT,
+        "EQUITY_PERSIST_SECONDS": 5,
+        "LOG_LEVEL": "INFO" if args.verbose else "WARNING" # Só avisos e erros dos bots, salvo com --verbose
+    }
+    with open("config.json", "w") as f:
+        json.dump(config, f)
+    return config
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="fleet_bench_")
+    os.chdir(workdir) # O main.py lê .env e config.json e cria o banco e as séries no diretório atual
+
+    exchange_latency = parse_latency(args.exchange_latency, EXCHANGE_LATENCY)
+    llm_latency = parse_latency(args.llm_latency, LLM_LATENCY)
+    fake_binance = FakeBinanceServer(latency=exchange_latency, error_rate=args.exchange_error_rate, seed=1).start()
+    fake_binance.exchange.initial_balances = {"USDT": INITIAL_USDT}
+    fake_openai = FakeOpenAIServer(latency=llm_latency, error_rate=args.llm_error_rate, response=args.response,
+                                   seed=2).start()
+    # Todos os clientes do python-binance (públicos e por usuário) passam a falar com o servidor falso
+    Client.API_URL = fake_binance.api_url
+    config = write_config(args, fake_openai.base_url)
+
+    import main
+    from db import get_db
+    from dashboard_bus import dashboard_bus
+    from equity_series import equity_store
+    from exchange_info import exchange_info
+    from trade_ledger import trade_ledger
+
+    app = main.app
+    with app.app_context():
+        main.init_db()
+        db = get_db()
+        for user_id in range(1, args.bots + 1):
+            db.execute("INSERT INTO users (id, email, password) VALUES (?, ?, ?)", (user_id, f"bot{user_id}@fleet", "x"))
+            db.execute(
+                "INSERT INTO broker_configs (user_id, broker_name, api_key, secret_key, openai_api_key) VALUES (?, ?, ?, ?, ?)",
+                (user_id, "Binance", f"fleet-key-{user_id}", f"fleet-secret-{user_id}", f"sk-fleet-{user_id}")
+            )
+        db.commit()
+    exchange_info.start()
+
+    collector = FleetCollector()
+    dashboard_bus.subscribe(collector)
+
+    # Dashboard servido por um servidor WSGI de verdade, com cookies de sessão assinados como os do login
+    if not args.verbose:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING) # Uma linha por GET /data dos pollers
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="fleet-dashboard", daemon=True).start()
+    dashboard_url = f"http://127.0.0.1:{httpd.server_port}"
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie_name = app.config.get("SESSION_COOKIE_NAME", "session")
+    cookies = [
+        (user_id, {cookie_name: serializer.dumps({"user_id": user_id, "user_email": f"bot{user_id}@fleet"})})
+        for user_id in range(1, args.bots + 1)
+    ]
+
+    stop = threading.Event()
+    process_samples = [(time.time(), threading.active_count(), rss_mb())]
+    data_latencies, data_errors = [], []
+    workers = [threading.Thread(target=sample_process, args=(stop, process_samples), daemon=True)]
+    workers += [
+        threading.Thread(target=poll_dashboard, args=(dashboard_url, cookies, stop, data_latencies, data_errors,
+                                                      args.data_interval), daemon=True)
+        for _ in range(args.data_pollers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    started_at = time.time()
+    with app.app_context():
+        started = sum(1 for user_id in range(1, args.bots + 1) if main.start_bot_for_user(user_id))
+    startup_seconds = time.time() - started_at
+
+    time.sleep(args.warmup)
+    window_start = time.time()
+    time.sleep(args.seconds)
+    window_end = time.time()
+
+    stop.set()
+    for worker in workers:
+        worker.join(timeout=15)
+    for user_id in range(1, args.bots + 1):
+        main.stop_bot_for_user(user_id)
+    httpd.shutdown()
+    trade_ledger.stop()
+    equity_store.stop()
+
+    cycles = collector.window(window_start, window_end)
+    stages = sorted({stage for _, _, timings in cycles for stage in timings if stage != "total"})
+    in_window = [sample for sample in process_samples if window_start <= sample[0] < window_end] or process_samples[-1:]
+    data_samples = [latency for at, latency in data_latencies if window_start <= at < window_end]
+    return {
+        "commit": git_commit(),
+        "timestamp": int(window_start),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "bots": args.bots,
+            "bots_started": started,
+            "backend": args.backend,
+            "trade_interval_seconds": args.interval,
+            "warmup_seconds": args.warmup,
+            "measure_seconds": args.seconds,
+            "exchange_latency": exchange_latency,
+            "exchange_error_rate": args.exchange_error_rate,
+            "llm_latency": llm_latency,
+            "llm_error_rate": args.llm_error_rate,
+            "data_pollers": args.data_pollers,
+            "data_interval_seconds": args.data_interval,
+            "bot_config": config
+        },
+        "startup_seconds": round(startup_seconds, 3),
+        "cycles": len(cycles),
+        "cycles_per_second": round(len(cycles) / args.seconds, 2),
+        "users_cycling": len({user_id for _, user_id, _ in cycles}),
+        "cycle_latency_ms": percentiles([timings["total"] for _, _, timings in cycles]),
+        "stage_latency_ms": {stage: percentiles([timings[stage] for _, _, timings in cycles if stage in timings])
+                             for stage in stages},
+        "threads": {"max": max(sample[1] for sample in in_window),
+                    "mean": round(statistics.fmean(sample[1] for sample in in_window), 1)},
+        "rss_mb": {"max": round(max(sample[2] for sample in in_window), 1),
+                   "end": round(in_window[-1][2], 1)},
+        "dashboard_data_latency_ms": percentiles(data_samples),
+        "dashboard_data_errors": len(data_errors),
+        "upstream": { # Totais desde o início, incluindo o aquecimento
+            "binance_requests": fake_binance.requests,
+            "binance_errors": fake_binance.errors,
+            "openai_requests": fake_openai.requests,
+            "openai_errors": fake_openai.errors,
+            "orders_filled": fake_binance.exchange.orders_filled
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga: N bots em um processo do main.py contra servidores falsos.")
+    parser.add_argument("--bots", type=int, default=50, help="Usuários com bot rodando")
+    parser.add_argument("--interval", type=float, default=5.0, help="TRADE_INTERVAL_SECONDS dos bots")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Segundos descartados antes da medição")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Duração da medição")
+    parser.add_argument("--backend", choices=("binance", "simulated"), default="binance",
+                        help="binance: BinanceAPI via HTTP no servidor falso; simulated: exchange local em processo")
+    parser.add_argument("--exchange-latency", action="append", default=[], metavar="TIPO=MEDIANA:SIGMA",
+                        help="Latência lognormal da Binance falsa (order ou default), ex: order=0.05:0.5")
+    parser.add_argument("--exchange-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", action="append", default=[], metavar="MODELO=MEDIANA:SIGMA",
+                        help="Latência lognormal do OpenAI falso, ex: gpt-4o=1.5:0.5")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="Resposta do LLM falso")
+    parser.add_argument("--data-pollers", type=int, default=4, help="Clientes consultando /data em paralelo")
+    parser.add_argument("--data-interval", type=float, default=0.5, help="Intervalo entre consultas de cada cliente")
+    parser.add_argument("--output", help="Arquivo JSON com o resultado (padrão: só imprime)")
+    parser.add_argument("--verbose", action="store_true", help="Logs dos bots em INFO (padrão: só avisos e erros)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    print(f"{result['config']['bots']} bots: {result['cycles_per_second']} ciclos/s, "
+          f"p99 do ciclo {result['cycle_latency_ms']['p99'] if result['cycle_latency_ms'] else '-'} ms, "
+          f"{result['threads']['max']} threads, {result['rss_mb']['max']} MB")
+
+
+if __name__ == "__main__":
+    main()
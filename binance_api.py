@@ -2,68 +2,175 @@
 from binance.client import Client
 from binance.exceptions import BinanceAPIException # Importe para tratar erros específicos
 import json
+import threading
 import requests # Mantenha se você tiver outras funcionalidades HTTP
 
+from price_cache import price_snapshot
+from market_data import market_data_hub
+from account_state import AccountStateCache, balances_from_account
+from rate_limiter import governed_call, observe_responses, PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_MARKET
+from http_pool import http_pool
+from logging_setup import get_logger
+
+log = get_logger("binance")
+
+_public_client = None
+_public_client_lock = threading.Lock()
+
+def get_public_client():
+    """Cliente sem chaves, compartilhado, para endpoints públicos (preços, exchange info)."""
+    global _public_client
+    if _public_client is None:
+        with _public_client_lock:
+            if _public_client is None: # Outra thread pode ter criado enquanto esta esperava
+                # ping=False: o ping do construtor sairia antes do pool e do governor (sem medir o peso)
+                client = Client(requests_params={"timeout": http_pool.timeout}, ping=False)
+                http_pool.mount_binance(client.session)
+                observe_responses(client.session)
+                _public_client = client # Publicado só depois de montado no pool
+    return _public_client
+
 class BinanceAPI:
     def __init__(self, api_key, api_secret):
-        self.client = Client(api_key, api_secret)
+        self.client = Client(api_key, api_secret, requests_params={"timeout": http_pool.timeout}, ping=False)
+        # Conexões keep-alive com a Binance compartilhadas por todos os usuários
+        http_pool.mount_binance(self.client.session)
+        observe_responses(self.client.session) # Peso usado por resposta, não pela última do Client
+        self.account_state = None # Cache de saldos alimentado pelo user-data stream (opcional)
+
+    def _call(self, priority, method, **params):
+        """Chama o método do Client passando pelo governor de peso compartilhado por todos os bots."""
+        return governed_call(self.client, priority, method, **params)
+
+    def start_account_stream(self, reconcile_interval=300):
+        """Passa a manter os saldos em memória via user-data stream, com reconciliação periódica."""
+        if self.account_state is None:
+            self.account_state = AccountStateCache(self.client, reconcile_interval=reconcile_interval)
+        self.account_state.start()
+
+    def stop_account_stream(self):
+        if self.account_state is not None:
+            self.account_state.stop()
 
     def get_account_info(self):
         """Retorna informações da conta."""
         try:
-            return self.client.get_account()
+            return self._call(PRIORITY_ACCOUNT, "get_account")
         except BinanceAPIException as e:
-            print(f"Erro da API Binance ao obter informações da conta: {e}")
+            log.error("Erro da API Binance ao obter informações da conta: %s", e)
             return None
         except Exception as e:
-            print(f"Erro inesperado ao obter informações da conta: {e}")
+            log.error("Erro inesperado ao obter informações da conta: %s", e)
+            return None
+
+    def get_balances(self):
+        """
+        Retorna {ativo: (free, locked)} apenas com saldos não nulos.
+        Lê da memória quando o user-data stream está ativo; senão, consulta a conta via REST.
+        """
+        if self.account_state is not None and self.account_state.is_ready():
+            return self.account_state.balances()
+        account_info = self.get_account_info()
+        if account_info is None:
             return None
+        return balances_from_account(account_info)
 
     def get_current_price(self, symbol):
         """Obtém o preço atual de um símbolo."""
         try:
-            ticker = self.client.get_symbol_ticker(symbol=symbol)
+            ticker = self._call(PRIORITY_MARKET, "get_symbol_ticker", symbol=symbol)
             return float(ticker['price'])
         except BinanceAPIException as e:
-            print(f"Erro da API Binance ao obter preço para {symbol}: {e}")
+            log.error("Erro da API Binance ao obter preço para %s: %s", symbol, e)
             return None
         except Exception as e:
-            print(f"Erro inesperado ao obter preço para {symbol}: {e}")
+            log.error("Erro inesperado ao obter preço para %s: %s", symbol, e)
             return None
 
-    def buy_market(self, symbol, quantity):
-        """Executa uma ordem de compra a mercado."""
+    def get_prices(self, symbols):
+        """
+        Obtém os preços atuais de vários símbolos. Lê primeiro a tabela do hub de streaming
+        (sem rede) e completa os que faltarem com o snapshot REST compartilhado.
+        Retorna {símbolo: preço}; símbolos sem preço são omitidos.
+        """
+        prices = market_data_hub.get_prices(symbols)
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if not missing:
+            return prices
         try:
-            # Em um ambiente real, você precisa validar quantity
-            order = self.client.order_market_buy(
-                symbol=symbol,
-                quantity=quantity
-            )
-            print(f"Ordem de compra a mercado de {quantity} {symbol} executada: {order}")
-            return order
+            prices.update(price_snapshot.get_prices(self.client, missing))
+            return prices
         except BinanceAPIException as e:
-            print(f"Erro da API Binance ao executar compra de {symbol}: {e}. Código: {e.code}, Mensagem: {e.message}")
-            return None
+            log.error("Erro da API Binance ao obter preços em lote: %s", e)
+            return prices
         except Exception as e:
-            print(f"Erro inesperado ao executar compra de {symbol}: {e}")
-            return None
+            log.error("Erro inesperado ao obter preços em lote: %s", e)
+            return prices
 
-    def sell_market(self, symbol, quantity):
+    def submit_market_order(self, side, symbol, quantity, client_order_id=None):
+        """
+        Envia uma ordem a mercado e retorna (ordem, situação), onde situação é:
+        "filled" (ordem aceita), "rejected" (recusada pela Binance, não existe) ou
+        "unknown" (timeout ou erro de rede/servidor: a ordem pode ou não ter sido executada,
+        então quem chamou deve consultá-la por client_order_id em vez de reenviá-la).
+        """
+        params = {"symbol": symbol, "quantity": quantity}
+        if client_order_id:
+            params["newClientOrderId"] = client_order_id # Torna a ordem identificável numa consulta posterior
+        try:
+            # quantity já chega ajustada aos filtros do símbolo (minQty, stepSize etc., ver exchange_info.py)
+            if side == "BUY":
+                order = self._call(PRIORITY_ORDER, "order_market_buy", **params)
+            else:
+                order = self._call(PRIORITY_ORDER, "order_market_sell", **params)
+            # A resposta completa (com os fills) só com o componente "binance" em DEBUG
+            log.debug("Ordem %s a mercado de %s %s executada.", side, quantity, symbol, extra={"order": order})
+            return order, "filled"
+        except BinanceAPIException as e:
+            # -1007: timeout no backend da Binance, "execution status unknown"; 5xx também é incerto
+            if e.code == -1007 or getattr(e, "status_code", 0) >= 500:
+                log.warning("Situação desconhecida da ordem %s de %s: %s", client_order_id, symbol, e)
+                return None, "unknown"
+            log.error("Erro da API Binance ao executar %s de %s: %s", side, symbol, e.message, extra={"code": e.code})
+            return None, "rejected"
+        except Exception as e:
+            # Timeout ou conexão perdida depois do envio: não dá para saber se a ordem chegou
+            log.warning("Situação desconhecida da ordem %s de %s (%s).", client_order_id, symbol, e)
+            return None, "unknown"
+
+    def buy_market(self, symbol, quantity, client_order_id=None):
+        """Executa uma ordem de compra a mercado."""
+        order, _ = self.submit_market_order("BUY", symbol, quantity, client_order_id)
+        return order
+
+    def sell_market(self, symbol, quantity, client_order_id=None):
         """Executa uma ordem de venda a mercado."""
+        order, _ = self.submit_market_order("SELL", symbol, quantity, client_order_id)
+        return order
+
+    def get_order(self, symbol, client_order_id):
+        """
+        Consulta uma ordem pelo client order id. Retorna (ordem, situação), com situação
+        "found", "missing" (a Binance não conhece a ordem) ou "unknown" (a consulta falhou).
+        """
         try:
-            # Em um ambiente real, você precisa validar quantity com minQty, stepSize etc.
-            order = self.client.order_market_sell(
-                symbol=symbol,
-                quantity=quantity
-            )
-            print(f"Ordem de venda a mercado de {quantity} {symbol} executada: {order}")
-            return order
+            return self._call(PRIORITY_ORDER, "get_order", symbol=symbol, origClientOrderId=client_order_id), "found"
         except BinanceAPIException as e:
-            print(f"Erro da API Binance ao executar venda de {symbol}: {e}. Código: {e.code}, Mensagem: {e.message}")
-            return None
+            if e.code == -2013: # Order does not exist
+                return None, "missing"
+            log.error("Erro da API Binance ao consultar a ordem %s de %s: %s", client_order_id, symbol, e)
+            return None, "unknown"
         except Exception as e:
-            print(f"Erro inesperado ao executar venda de {symbol}: {e}")
-            return None
+            log.error("Erro inesperado ao consultar a ordem %s de %s: %s", client_order_id, symbol, e)
+            return None, "unknown"
+
+    def get_order_fills(self, symbol, order_id):
+        """Retorna as execuções (trades) de uma ordem, no mesmo formato dos 'fills' da resposta da ordem."""
+        try:
+            return self._call(PRIORITY_ACCOUNT, "get_my_trades", symbol=symbol, orderId=order_id)
+        except Exception as e:
+            log.error("Erro ao obter as execuções da ordem %s de %s: %s", order_id, symbol, e)
+            return []
             
     # Pode manter get_price como um alias se preferir
     def get_price(self, symbol):
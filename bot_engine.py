@@ -0,0 +1,143 @@
+# bot_engine.py
+import asyncio
+import concurrent.futures
+import threading
+
+from metrics import SamplingProfiler
+from logging_setup import get_logger
+
+log = get_logger("engine")
+
+
+class IOLimits:
+    """
+    Limites de concorrência para as chamadas bloqueantes dos bots.
+    Cada chamada roda no pool de threads do event loop, mas no máximo `max_exchange_calls`
+    chamadas à corretora e `max_llm_calls` chamadas ao LLM ficam em andamento ao mesmo tempo,
+    independentemente de quantos usuários estejam ativos.
+    """
+    def __init__(self, max_exchange_calls=32, max_llm_calls=8):
+        self.max_exchange_calls = max_exchange_calls
+        self.max_llm_calls = max_llm_calls
+        self._exchange_semaphore = asyncio.Semaphore(max_exchange_calls)
+        self._llm_semaphore = asyncio.Semaphore(max_llm_calls)
+
+    async def exchange(self, func, *args):
+        """Executa uma chamada à corretora (Binance) respeitando o limite de concorrência."""
+        async with self._exchange_semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    async def llm(self, func, *args):
+        """Executa uma chamada ao LLM (OpenAI) respeitando o limite de concorrência."""
+        async with self._llm_semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    async def io(self, func, *args):
+        """Executa uma chamada bloqueante sem limite próprio (ex: notificações do dashboard)."""
+        return await asyncio.to_thread(func, *args)
+
+
+class BotHandle:
+    """
+    Referência a um bot em execução no engine. Expõe is_alive()/join() como uma Thread,
+    para que app.py continue verificando bot_threads[user_id].is_alive() sem mudanças.
+    """
+    def __init__(self, engine, user_id):
+        self._engine = engine
+        self.user_id = user_id
+        self._done = threading.Event()
+
+    def is_alive(self):
+        return not self._done.is_set()
+
+    def join(self, timeout=None):
+        self._done.wait(timeout)
+
+    def stop(self):
+        """Pede o cancelamento da corrotina do bot (substitui o stop_event)."""
+        self._engine.cancel(self.user_id)
+
+
+class BotEngine:
+    """
+    Executa o ciclo de todos os usuários como corrotinas em um único event loop,
+    rodando em uma thread dedicada, em vez de uma thread do sistema operacional por usuário.
+    """
+    def __init__(self, max_exchange_calls=32, max_llm_calls=8):
+        self.max_exchange_calls = max_exchange_calls
+        self.max_llm_calls = max_llm_calls
+        self.loop = None
+        self.limits = None
+        self._thread = None
+        self._tasks = {} # {user_id: asyncio.Task}, acessado apenas na thread do loop
+        self._start_lock = threading.Lock()
+
+    def _ensure_running(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="bot-engine", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # O pool precisa comportar todas as chamadas permitidas pelos limites, mais as notificações
+        self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_exchange_calls + self.max_llm_calls + 8,
+            thread_name_prefix="bot-io"
+        ))
+        self.limits = IOLimits(self.max_exchange_calls, self.max_llm_calls)
+        ready.set()
+        self.loop.run_forever()
+
+    def start(self, user_id, coroutine_factory):
+        """
+        Agenda a corrotina retornada por coroutine_factory(limits) como o bot do usuário.
+        Retorna um BotHandle.
+        """
+        self._ensure_running()
+        handle = BotHandle(self, user_id)
+
+        def spawn():
+            task = self.loop.create_task(coroutine_factory(self.limits), name=f"bot-{user_id}")
+            self._tasks[user_id] = task
+            task.add_done_callback(lambda finished: self._on_done(user_id, finished, handle))
+
+        self.loop.call_soon_threadsafe(spawn)
+        return handle
+
+    def _on_done(self, user_id, task, handle):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Erro no bot do usuário: %r", task.exception(), extra={"user_id": user_id},
+                      exc_info=task.exception())
+        handle._done.set()
+
+    def cancel(self, user_id):
+        """Cancela o bot do usuário; é seguro chamar de qualquer thread."""
+        if self.loop is None:
+            return
+
+        def cancel_task():
+            task = self._tasks.get(user_id)
+            if task is not None:
+                task.cancel()
+
+        self.loop.call_soon_threadsafe(cancel_task)
+
+    def profile(self, user_id, duration=30.0, interval=0.005):
+        """
+        Liga um SamplingProfiler na thread do loop que só conta as amostras em que a corrotina do bot
+        do usuário está executando (tempo de CPU no loop; as chamadas de I/O rodam no pool de threads).
+        Retorna o profiler já iniciado, ou None se o bot não estiver rodando.
+        """
+        task = self._tasks.get(user_id) # Só leitura, fora da thread do loop
+        if task is None or self._thread is None:
+            return None
+        loop = self.loop
+        return SamplingProfiler(self._thread.ident, lambda: asyncio.current_task(loop) is task,
+                                interval=interval, duration=duration).start()
@@ -1,27 +1,84 @@
 # chatgpt_api.py
 from openai import OpenAI
 import json
+import time
+
+from http_pool import http_pool
+from metrics import upstream_request_seconds, upstream_requests_total
+from logging_setup import get_logger
+
+log = get_logger("llm")
 
 class OpenAIAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=None):
         """
         Inicializa o cliente OpenAI com a chave da API fornecida.
+        'base_url' permite apontar para outro servidor compatível (ex: fake_openai_server.py em testes).
         """
-        self.client = OpenAI(api_key=api_key)
+        # As tentativas são controladas pelo DecisionClient, então o cliente não repete sozinho.
+        # O httpx.Client é compartilhado por todos os usuários (conexões keep-alive com o OpenAI).
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_pool.openai_client())
 
-    def get_completion(self, prompt, model="gpt-4o", temperature=0):
+    def complete(self, prompt, model="gpt-4o", temperature=0, timeout=None):
         """
         Envia um prompt para a API do OpenAI e retorna a conclusão.
+        Diferente de get_completion, propaga os erros (inclusive o timeout) para quem chamou.
         """
+        started_at = time.perf_counter()
+        outcome = "error"
         try:
             response = self.client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
-                temperature=temperature
+                temperature=temperature,
+                timeout=timeout
+            )
+            outcome = "ok"
+        finally:
+            upstream_request_seconds.observe(time.perf_counter() - started_at, "openai", model)
+            upstream_requests_total.inc("openai", model, outcome)
+        return response.choices[0].message.content.strip()
+
+    def stream_completion(self, prompt, model="gpt-4o", temperature=0, timeout=None):
+        """
+        Envia um prompt para a API do OpenAI em modo streaming e gera os pedaços de texto
+        da conclusão à medida que chegam. Erros são propagados para quem chamou.
+        A duração medida vai do pedido até o fim do streaming (ou até o consumidor parar de ler).
+        """
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                timeout=timeout,
+                stream=True
             )
-            return response.choices[0].message.content.strip()
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                outcome = "ok"
+            except GeneratorExit:
+                outcome = "ok" # O consumidor já tinha o que precisava
+                raise
+            finally:
+                stream.close() # Libera a conexão mesmo se o consumidor parar antes do fim
+        finally:
+            upstream_request_seconds.observe(time.perf_counter() - started_at, "openai", model)
+            upstream_requests_total.inc("openai", model, outcome)
+
+    def get_completion(self, prompt, model="gpt-4o", temperature=0, timeout=None):
+        """
+        Envia um prompt para a API do OpenAI e retorna a conclusão.
+        """
+        try:
+            return self.complete(prompt, model=model, temperature=temperature, timeout=timeout)
         except Exception as e:
-            print(f"Erro ao obter resposta do OpenAI: {e}")
+            log.error("Erro ao obter resposta do OpenAI: %s", e)
             return "Manter portfolio atual." # Resposta de fallback em caso de erro
\ No newline at end of file
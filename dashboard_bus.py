@@ -0,0 +1,139 @@
+# dashboard_bus.py
+import collections
+import threading
+import time
+
+import requests
+
+from http_pool import http_pool
+from metrics import metrics, bot_stage_seconds
+from logging_setup import get_logger
+
+log = get_logger("dashboard")
+
+# Endpoint do dashboard Flask, usado apenas quando os bots rodam em outro processo
+FLASK_DASHBOARD_URL = "http://127.0.0.1:5000/update_data"
+
+
+def merge_updates(older, newer):
+    """
+    Combina duas atualizações do dashboard em uma só: campos simples ficam com o valor mais novo
+    e as entradas de histórico das duas são preservadas, em ordem.
+    """
+    merged = dict(older)
+    merged.update(newer)
+    if "history" in older and "history" in newer:
+        merged["history"] = list(older["history"]) + list(newer["history"])
+    return merged
+
+
+class DashboardBus:
+    """
+    Barramento publish/subscribe em processo entre os bots e o dashboard.
+    `publish` nunca bloqueia: cada usuário tem uma fila limitada e, quando ela enche,
+    as atualizações mais antigas são combinadas (sem perder histórico) em vez de descartadas.
+    Uma única thread entrega as atualizações aos assinantes, então um dashboard lento
+    não atrasa o ciclo de negociação.
+    """
+    def __init__(self, max_queue_per_user=32):
+        self.max_queue_per_user = max_queue_per_user
+        self._queues = {} # {user_id: deque de atualizações pendentes}
+        self._ready_users = collections.deque() # Usuários com atualizações pendentes, em ordem de chegada
+        self._condition = threading.Condition()
+        self._subscribers = []
+        self._thread = None
+        self._stopping = False
+        self.published = 0
+        self.coalesced = 0
+
+    def subscribe(self, callback):
+        """Registra callback(user_id, data) e inicia a entrega, se ainda não estiver ativa."""
+        with self._condition:
+            self._subscribers.append(callback)
+        self.start()
+
+    def unsubscribe(self, callback):
+        with self._condition:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, user_id, data):
+        """Enfileira uma atualização do usuário. O dicionário não deve ser alterado depois de publicado."""
+        with self._condition:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = collections.deque()
+            if not queue:
+                self._ready_users.append(user_id)
+            elif len(queue) >= self.max_queue_per_user:
+                oldest = queue.popleft()
+                if queue:
+                    queue[0] = merge_updates(oldest, queue[0])
+                else:
+                    data = merge_updates(oldest, data) # Fila de uma posição: combina com a nova
+                self.coalesced += 1
+            queue.append(data)
+            self.published += 1
+            self._condition.notify()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._dispatch_loop, name="dashboard-bus", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while not self._ready_users and not self._stopping:
+                    self._condition.wait()
+                if self._stopping and not self._ready_users:
+                    return
+                user_id = self._ready_users.popleft()
+                updates = list(self._queues.pop(user_id))
+                subscribers = list(self._subscribers)
+            user_label = metrics.user_label(user_id)
+            for data in updates:
+                started_at = time.perf_counter()
+                for callback in subscribers:
+                    try:
+                        callback(user_id, data)
+                    except Exception as e:
+                        log.error("Assinante do dashboard falhou: %s", e, extra={"user_id": user_id})
+                bot_stage_seconds.observe(time.perf_counter() - started_at, "dashboard_publish", user_label)
+
+
+class HttpDashboardTransport:
+    """
+    Assinante que encaminha as atualizações ao endpoint /update_data do Flask.
+    Usado quando os bots rodam em um processo separado do dashboard.
+    """
+    def __init__(self, url=FLASK_DASHBOARD_URL, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, user_id, data):
+        data_with_user_id = data.copy()
+        data_with_user_id['user_id'] = user_id # Adiciona o user_id
+        try:
+            # Sessão com pool keep-alive: não abre uma conexão nova a cada atualização
+            response = http_pool.dashboard_session().post(self.url, json=data_with_user_id, timeout=self.timeout)
+            response.raise_for_status() # Lança exceções para status de erro (4xx ou 5xx)
+        except requests.exceptions.ConnectionError:
+            log.error("Não foi possível conectar ao dashboard Flask. Ele está rodando?", extra={"user_id": user_id})
+        except requests.exceptions.RequestException as e:
+            log.error("Erro ao enviar dados ao dashboard Flask: %s", e, extra={"user_id": user_id})
+
+
+# Instância única do processo, compartilhada por todos os bots
+dashboard_bus = DashboardBus()
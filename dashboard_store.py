@@ -0,0 +1,338 @@
+# dashboard_store.py
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+from logging_setup import get_logger
+
+log = get_logger("dashboard")
+
+# Campos simples do dashboard; cycle_timings é o tempo de parede (ms) de cada estágio do último ciclo do bot
+SCALAR_FIELDS = ("status", "usdt", "next_cycle_time", "cycle_timings")
+DEFAULT_FIELDS = {"status": "Aguardando início do bot...", "usdt": 0, "next_cycle_time": 0}
+
+
+class Versioned:
+    """Valor do dashboard (item do portfólio ou entrada do histórico) e a versão em que mudou. Imutável por convenção."""
+    __slots__ = ("value", "version")
+
+    def __init__(self, value, version):
+        self.value = value
+        self.version = version
+
+
+class DashboardSnapshot:
+    """
+    Estado do dashboard de um usuário em uma versão. Nunca é alterado depois de publicado: cada
+    atualização monta um snapshot novo, reaproveitando as partes que não mudaram, e o troca
+    atomicamente. Quem lê pega a referência do snapshot atual sem lock.
+    """
+    __slots__ = ("version", "base", "fields", "field_versions", "portfolio", "removed", "history")
+
+    def __init__(self, version, base, fields, field_versions, portfolio, removed, history):
+        self.version = version
+        self.base = base # Versões de clientes abaixo desta são de um estado descartado: recebem o estado completo
+        self.fields = fields # {campo: valor}
+        self.field_versions = field_versions # {campo: versão da última alteração}
+        self.portfolio = portfolio # {símbolo: Versioned(item)}
+        self.removed = removed # {símbolo removido: versão da remoção}
+        self.history = history # (Versioned(entrada), ...) do mais antigo ao mais recente
+
+    def view(self):
+        """Estado completo no formato do template e do /data."""
+        data = dict(self.fields)
+        data["portfolio"] = {symbol: item.value for symbol, item in self.portfolio.items()}
+        data["history"] = [entry.value for entry in self.history]
+        return data
+
+    def delta(self, since):
+        """
+        O que mudou desde a versão `since`. Com since=0 (ou uma versão desconhecida, ex: após o estado
+        do usuário ser descartado) devolve o estado completo com "full": True.
+        """
+        if since <= 0 or since < self.base or since > self.version:
+            data = self.view()
+            data["version"] = self.version
+            data["full"] = True
+            return data
+
+        data = {"version": self.version}
+        for field, field_version in self.field_versions.items():
+            if field_version > since:
+                data[field] = self.fields[field]
+        changed_portfolio = {symbol: item.value for symbol, item in self.portfolio.items() if item.version > since}
+        if changed_portfolio:
+            data["portfolio"] = changed_portfolio
+        removed = [symbol for symbol, removed_version in self.removed.items() if removed_version > since]
+        if removed:
+            data["portfolio_removed"] = removed
+        new_history = [entry.value for entry in self.history if entry.version > since]
+        if new_history:
+            data["history"] = new_history
+        return data
+
+    def to_json(self):
+        return {
+            "version": self.version,
+            "base": self.base,
+            "fields": {field: [value, self.field_versions.get(field, 0)] for field, value in self.fields.items()},
+            "portfolio": {symbol: [item.value, item.version] for symbol, item in self.portfolio.items()},
+            "removed": self.removed,
+            "history": [[entry.value, entry.version] for entry in self.history]
+        }
+
+    @classmethod
+    def from_json(cls, data, history_limit):
+        fields, field_versions = {}, {}
+        for field, (value, field_version) in data["fields"].items():
+            fields[field] = value
+            if field_version:
+                field_versions[field] = field_version
+        return cls(
+            data["version"], data.get("base", 0), fields, field_versions,
+            {symbol: Versioned(value, item_version) for symbol, (value, item_version) in data["portfolio"].items()},
+            dict(data["removed"]),
+            tuple(Versioned(value, entry_version) for value, entry_version in data["history"][-history_limit:])
+        )
+
+
+class UserDashboard:
+    """
+    Estado de um usuário no DashboardStore: o snapshot publicado e o lado de escrita (lock,
+    histórico em deque limitado). A Condition usa o lock de escrita e serve ao long-poll.
+    """
+    __slots__ = ("snapshot", "history", "lock", "condition", "last_access", "evicted")
+
+    def __init__(self, snapshot, history_limit):
+        self.snapshot = snapshot
+        self.history = collections.deque(snapshot.history, maxlen=history_limit)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.last_access = time.monotonic()
+        self.evicted = False
+
+
+class DashboardStore:
+    """
+    Estado do dashboard de todos os usuários, versionado: cada atualização recebe um número de sequência
+    crescente por usuário e cada campo (ou símbolo do portfólio / entrada do histórico) guarda a versão em
+    que mudou, então /data?since=N e /stream enviam apenas o que mudou desde a versão N do cliente.
+
+    As atualizações de um usuário são serializadas pelo lock dele e publicam um snapshot imutável; as
+    leituras nunca pegam lock e nunca atrasam os bots. Usuários sem leitura nem escrita há `idle_seconds`
+    (ou os mais antigos, acima de `max_users` em memória) são gravados em `directory` e saem da memória;
+    voltam do disco, com as mesmas versões, no próximo acesso. Sem `directory`, são só descartados.
+    """
+    def __init__(self, directory="dashboard", history_limit=20, idle_seconds=1800.0, max_users=1000,
+                 sweep_interval=60.0):
+        self.directory = directory
+        self.history_limit = history_limit
+        self.idle_seconds = idle_seconds
+        self.max_users = max_users
+        self.sweep_interval = sweep_interval
+        self.evicted = 0 # Usuários tirados da memória desde o início
+        self.loaded = 0 # Usuários recarregados do disco
+        self._users = {} # {user_id: UserDashboard}
+        self._version_floor = 0 # Acima da maior versão descartada sem gravar: os estados novos começam nela
+        self._lock = threading.Lock() # Só para criar, carregar e tirar usuários da memória
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"dashboard_{re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))}.json")
+
+    def _user(self, user_id):
+        """Estado do usuário em memória, carregado do disco ou criado vazio."""
+        user = self._users.get(user_id) # Caminho comum: sem lock
+        if user is not None:
+            user.last_access = time.monotonic()
+            return user
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                user = UserDashboard(self._load(user_id), self.history_limit)
+                self._users[user_id] = user
+            overflow = len(self._users) > self.max_users
+        if overflow:
+            self._evict_oldest()
+        self.start()
+        return user
+
+    def _load(self, user_id):
+        """Snapshot gravado do usuário (o arquivo é apagado: a memória passa a ser a fonte) ou um estado vazio."""
+        if self.directory:
+            path = self._path(user_id)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        snapshot = DashboardSnapshot.from_json(json.load(f), self.history_limit)
+                    os.remove(path)
+                    self.loaded += 1
+                    return snapshot
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    log.error("Erro ao carregar o dashboard: %s", e, extra={"user_id": user_id})
+        base = self._version_floor
+        return DashboardSnapshot(base, base, dict(DEFAULT_FIELDS), {}, {}, {}, ())
+
+    def get(self, user_id):
+        """Snapshot atual do usuário (imutável: pode ser lido sem lock)."""
+        return self._user(user_id).snapshot
+
+    def update(self, user_id, new_data):
+        """Aplica uma atualização parcial (campos, portfólio e/ou novas entradas de histórico)."""
+        while True:
+            user = self._user(user_id)
+            with user.lock:
+                if user.evicted: # Tirado da memória entre a busca e o lock: busca de novo
+                    continue
+                snapshot = self._apply(user, new_data)
+                if snapshot is not None:
+                    user.snapshot = snapshot # Troca atômica: leitores veem o snapshot antigo ou o novo, inteiros
+                    user.condition.notify_all()
+                return
+
+    def _apply(self, user, new_data):
+        """Snapshot com a atualização aplicada, ou None se nada mudou. Chamar com o lock do usuário."""
+        current = user.snapshot
+        version = current.version + 1
+        fields, field_versions = current.fields, current.field_versions
+        portfolio, removed, history = current.portfolio, current.removed, current.history
+        changed = False
+
+        for field in SCALAR_FIELDS:
+            if field in new_data and fields.get(field) != new_data[field]:
+                if fields is current.fields: # Copia só na primeira alteração
+                    fields, field_versions = dict(fields), dict(field_versions)
+                fields[field] = new_data[field]
+                field_versions[field] = version
+                changed = True
+
+        if "portfolio" in new_data:
+            new_portfolio = new_data["portfolio"]
+            for symbol_pair, item_data in new_portfolio.items():
+                item = portfolio.get(symbol_pair)
+                if item is not None and all(item.value.get(key) == value for key, value in item_data.items()):
+                    continue # Sem mudança: o item continua sendo o mesmo objeto
+                if portfolio is current.portfolio:
+                    portfolio, removed = dict(portfolio), dict(removed)
+                # Itens publicados nunca são alterados: a atualização cria um item novo
+                portfolio[symbol_pair] = Versioned({**item.value, **item_data} if item is not None else dict(item_data), version)
+                removed.pop(symbol_pair, None)
+                changed = True
+
+            # Remove símbolos que não estão mais no portfólio e não são USDT (ou tem qte zero)
+            keys_to_remove = [
+                symbol for symbol, item in portfolio.items()
+                if symbol not in new_portfolio and symbol != "USDT" and item.value.get("amount", 0) <= 0
+            ]
+            if keys_to_remove or "USDT" not in portfolio:
+                if portfolio is current.portfolio:
+                    portfolio, removed = dict(portfolio), dict(removed)
+                for key in keys_to_remove:
+                    del portfolio[key]
+                    removed[key] = version
+                # Garante que USDT esteja sempre presente
+                if "USDT" not in portfolio:
+                    portfolio["USDT"] = Versioned({"amount": 0, "current_price": 1.0}, version)
+                changed = True
+
+        if new_data.get("history"):
+            user.history.extend(Versioned(entry, version) for entry in new_data["history"]) # O deque descarta as mais antigas
+            history = tuple(user.history)
+            changed = True
+
+        if not changed:
+            return None
+        return DashboardSnapshot(version, current.base, fields, field_versions, portfolio, removed, history)
+
+    def delta(self, user_id, since=0):
+        """O que mudou no dashboard do usuário desde a versão `since` (ver DashboardSnapshot.delta)."""
+        return self.get(user_id).delta(since)
+
+    def wait_for_change(self, user_id, since, timeout):
+        """Bloqueia até o dashboard do usuário passar da versão `since` ou o timeout expirar."""
+        user = self._user(user_id)
+        with user.condition:
+            user.condition.wait_for(lambda: user.snapshot.version != since or user.evicted, timeout=timeout)
+
+    def sweep(self):
+        """Tira da memória os usuários sem acesso há `idle_seconds`."""
+        deadline = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [(user_id, user) for user_id, user in self._users.items() if user.last_access < deadline]
+        for user_id, user in idle:
+            self._evict(user_id, user, deadline)
+
+    def _evict_oldest(self):
+        """Com mais de `max_users` em memória, tira os menos acessados até sobrar 90% do limite."""
+        with self._lock:
+            excess = len(self._users) - int(self.max_users * 0.9)
+            oldest = sorted(self._users.items(), key=lambda pair: pair[1].last_access)[:max(excess, 0)]
+        for user_id, user in oldest:
+            self._evict(user_id, user)
+
+    def _evict(self, user_id, user, idle_before=None):
+        with user.lock:
+            if user.evicted or (idle_before is not None and user.last_access >= idle_before):
+                return # Acessado enquanto a varredura rodava
+            snapshot = user.snapshot
+            saved = self._save(user_id, snapshot)
+            with self._lock:
+                if not saved:
+                    self._version_floor = max(self._version_floor, snapshot.version + 1)
+                if self._users.get(user_id) is user:
+                    del self._users[user_id]
+                user.evicted = True
+                self.evicted += 1
+            user.condition.notify_all() # Quem espera neste estado acorda e passa a usar o recarregado
+
+    def _save(self, user_id, snapshot):
+        """Grava o snapshot (arquivo temporário + rename). Retorna False sem diretório ou se a gravação falhar."""
+        if not self.directory:
+            return False
+        path = self._path(user_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot.to_json(), f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            log.error("Erro ao gravar o dashboard: %s", e, extra={"user_id": user_id})
+            return False
+
+    def metrics(self):
+        return {"users_in_memory": len(self._users), "evicted": self.evicted, "loaded": self.loaded}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._sweep_loop, name="dashboard-store", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Para a varredura e grava o estado de todos os usuários, para o próximo processo continuar as versões."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.directory:
+            with self._lock:
+                users = list(self._users.items())
+            for user_id, user in users:
+                self._evict(user_id, user)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+
+# Instância única do processo, escrita pelo barramento do dashboard e lida pelas rotas do Flask
+dashboard_store = DashboardStore()
@@ -1,21 +1,91 @@
 # db.py
 import sqlite3
+import threading
 import click
 from flask import current_app, g
 
+# Aplicados a cada conexão nova (o journal_mode=WAL fica gravado no próprio arquivo)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL", # Leitores não bloqueiam o escritor, e o escritor não bloqueia leitores
+    "PRAGMA synchronous=NORMAL", # Seguro com WAL: o fsync acontece só nos checkpoints
+    "PRAGMA busy_timeout=5000", # Espera até 5 s pelo lock em vez de falhar com "database is locked"
+    "PRAGMA cache_size=-8000", # Cache de páginas de ~8 MB por conexão
+    "PRAGMA temp_store=MEMORY",
+)
+
+def connect(path, pragmas=PRAGMAS):
+    """Abre uma conexão já configurada. Pode ser usada por outra thread, desde que por uma de cada vez."""
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """
+    Conexões abertas reaproveitadas entre requisições, em vez de um sqlite3.connect (e os pragmas)
+    por requisição. Cada thread pega uma conexão no início da requisição e a devolve no teardown,
+    então uma conexão nunca é usada por duas threads ao mesmo tempo. Funciona também com o servidor
+    do Flask, que cria uma thread por requisição. Até `max_idle` conexões ociosas ficam guardadas por banco.
+    """
+    def __init__(self, max_idle=8, pragmas=PRAGMAS):
+        self.max_idle = max_idle
+        self.pragmas = pragmas
+        self._idle = {} # {caminho do banco: [conexões ociosas]}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self, path):
+        with self._lock:
+            idle = self._idle.get(path)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.opened += 1
+        return connect(path, self.pragmas)
+
+    def release(self, path, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback() # Não devolve ao pool uma transação pela metade
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(path, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "reused": self.reused,
+                "idle": sum(len(conns) for conns in self._idle.values())
+            }
+
+# Instância única do processo, usada por todas as requisições
+connection_pool = ConnectionPool()
+
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = connection_pool.acquire(current_app.config['DATABASE'])
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        connection_pool.release(current_app.config['DATABASE'], db)
 
 def init_db():
     db = get_db()
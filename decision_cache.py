@@ -0,0 +1,93 @@
+# decision_cache.py
+import collections
+import copy
+import math
+import threading
+import time
+
+
+def quantize_relative(value, tolerance):
+    """
+    Coloca o valor em uma faixa logarítmica de largura relativa `tolerance`
+    (ex: 0.005 = faixas de 0,5%). Valores dentro da mesma faixa geram a mesma chave.
+    """
+    if value is None:
+        return None
+    if value <= 1e-12:
+        return 0
+    if tolerance <= 0:
+        return value
+    return math.floor(math.log(value) / math.log1p(tolerance))
+
+
+class DecisionCache:
+    """
+    Cache das decisões (ações já parseadas) do LLM, indexado por uma impressão digital quantizada
+    do estado que generate_openai_prompt consome: saldo USDT, quantidade e preço de cada ativo.
+    Quando o estado não mudou além das faixas de tolerância, o ciclo reutiliza a última decisão
+    sem chamar o OpenAI. Entradas expiram após `ttl` segundos; acima de `max_entries`, a menos
+    usada recentemente é descartada (LRU).
+    """
+    def __init__(self, price_tolerance=0.005, balance_tolerance=0.01, ttl=900, max_entries=128):
+        self.price_tolerance = price_tolerance
+        self.balance_tolerance = balance_tolerance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # {chave: (instante de inserção, ações)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def fingerprint(self, usdt_balance, portfolio_data, extra=()):
+        """
+        Gera a chave do estado. `extra` inclui parâmetros que também mudam o prompt
+        (ex: o limite de USDT por trade).
+        """
+        holdings = tuple(sorted(
+            (symbol,
+             quantize_relative(data.get('amount', 0), self.balance_tolerance),
+             quantize_relative(data.get('current_price'), self.price_tolerance))
+            for symbol, data in portfolio_data.items() if symbol != "USDT"
+        ))
+        return (quantize_relative(usdt_balance, self.balance_tolerance), holdings, tuple(extra))
+
+    def get(self, key):
+        """Retorna uma cópia das ações em cache para a chave, ou None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, actions):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(actions))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores do cache, para logs e para o dashboard."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "size": len(self._entries)
+        }
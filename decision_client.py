@@ -0,0 +1,236 @@
+# decision_client.py
+import bisect
+import concurrent.futures
+import random
+import threading
+import time
+
+from action_stream import IncrementalActionParser
+from logging_setup import get_logger
+
+log = get_logger("llm")
+
+# Limites superiores (segundos) das faixas do histograma de latência, em escala aproximadamente logarítmica
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+# Pool compartilhado pelas requisições (primária e hedge) de todos os bots
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-request")
+
+
+class LatencyHistogram:
+    """Histograma de latências com faixas fixas; percentis são estimados pelo limite superior da faixa."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # A última faixa recebe tudo acima do maior limite
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, fraction):
+        """Retorna o limite superior da faixa que contém o percentil pedido, ou None sem amostras."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = fraction * self.count
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else None,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))
+            }
+
+
+class DecisionClient:
+    """
+    Obtém a decisão do LLM com prazo por ciclo e requisição de hedge.
+    A requisição vai primeiro ao modelo principal; se ele não responder até o percentil
+    `hedge_percentile` da sua própria latência histórica, uma segunda requisição é enviada
+    ao modelo de hedge (mais rápido) e vale a primeira resposta que for parseada com sucesso.
+    Falhas são repetidas com backoff exponencial com jitter, sempre dentro do prazo.
+    """
+    def __init__(self, openai_api, parse, primary_model="gpt-4o", hedge_model="gpt-4o-mini",
+                 deadline=45.0, hedge_percentile=0.9, default_hedge_delay=8.0, min_hedge_delay=1.0,
+                 min_samples=20, max_retries=2, backoff_base=0.5, backoff_max=4.0, on_parse=None):
+        self.openai_api = openai_api
+        self.parse = parse # Função resposta -> (ações, válida), ex: trade_logic.try_parse_openai_response
+        self.on_parse = on_parse # on_parse(segundos) com o tempo de parse de cada resposta (métricas)
+        self.primary_model = primary_model
+        self.hedge_model = hedge_model
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay # Usado até haver amostras suficientes
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.histograms = {} # {modelo: LatencyHistogram} das chamadas bem-sucedidas
+        self.errors = {} # {modelo: número de falhas}
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def _histogram(self, model):
+        if model not in self.histograms:
+            self.histograms[model] = LatencyHistogram()
+        return self.histograms[model]
+
+    def hedge_delay(self):
+        """Quanto esperar pelo modelo principal antes de disparar o hedge."""
+        histogram = self._histogram(self.primary_model)
+        if histogram.count < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, histogram.percentile(self.hedge_percentile))
+
+    def decide(self, prompt, deadline=None):
+        """
+        Retorna (ações, válida, info). 'válida' é False se nenhum modelo produziu uma resposta
+        parseável dentro do prazo; 'info' traz o modelo vencedor, se houve hedge e a latência.
+        """
+        started_at = time.monotonic()
+        deadline_at = started_at + (deadline or self.deadline)
+        finished = threading.Event() # Avisa a tentativa perdedora para não repetir depois de decidido
+        futures = {_executor.submit(self._attempt, self.primary_model, prompt, deadline_at, finished): self.primary_model}
+        hedged = False
+
+        while futures:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            # Antes do hedge, espera apenas até o limiar de hedge; depois, até o prazo final
+            wait_for = remaining
+            if not hedged and self.hedge_model:
+                wait_for = min(remaining, max(0.0, started_at + self.hedge_delay() - time.monotonic()))
+            done, _ = concurrent.futures.wait(futures, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                model = futures.pop(future)
+                actions, valid = future.result()
+                if valid:
+                    if model == self.hedge_model and hedged:
+                        self.hedges_won += 1
+                    finished.set()
+                    return actions, True, {"model": model, "hedged": hedged, "latency": time.monotonic() - started_at}
+
+            # O principal está lento (ou falhou de vez): dispara o hedge uma única vez
+            if not hedged and self.hedge_model and (not futures or time.monotonic() - started_at >= self.hedge_delay()):
+                hedged = True
+                self.hedges_sent += 1
+                futures[_executor.submit(self._attempt, self.hedge_model, prompt, deadline_at, finished)] = self.hedge_model
+
+        finished.set()
+        log.warning("Nenhuma resposta válida do OpenAI dentro do prazo de %.1fs.", deadline_at - started_at)
+        return [], False, {"model": None, "hedged": hedged, "latency": time.monotonic() - started_at}
+
+    def decide_streaming(self, prompt, on_action, deadline=None):
+        """
+        Como decide, mas consome a resposta do modelo principal em streaming e chama on_action(ação)
+        (na thread do streaming) assim que cada objeto da lista fica completo.
+        Só há nova tentativa enquanto nenhuma ação foi emitida, para nunca repetir uma ordem;
+        se o streaming falhar antes disso, recorre a decide() (com hedge) no tempo restante.
+        'info' inclui 'first_action_latency' (None se nenhuma ação foi emitida).
+        """
+        started_at = time.monotonic()
+        deadline_at = started_at + (deadline or self.deadline)
+        info = {"model": self.primary_model, "hedged": False, "streamed": True, "first_action_latency": None}
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            parser = IncrementalActionParser()
+            parse_seconds = 0.0 # Soma do tempo de parse dos pedaços (sem a espera pela rede)
+            request_started_at = time.monotonic()
+            try:
+                for text in self.openai_api.stream_completion(prompt, model=self.primary_model, timeout=remaining):
+                    parse_started_at = time.perf_counter()
+                    actions = parser.feed(text)
+                    parse_seconds += time.perf_counter() - parse_started_at
+                    for action in actions:
+                        if info["first_action_latency"] is None:
+                            info["first_action_latency"] = time.monotonic() - started_at
+                        on_action(action)
+                    # O resto do texto (ex: o ``` final) não muda a decisão
+                    if parser.finished or time.monotonic() > deadline_at:
+                        break
+            except Exception as e:
+                self.errors[self.primary_model] = self.errors.get(self.primary_model, 0) + 1
+                log.warning("Erro no streaming do OpenAI (%s, tentativa %s): %s", self.primary_model, attempt + 1, e)
+            else:
+                if parser.valid:
+                    self._histogram(self.primary_model).record(time.monotonic() - request_started_at)
+                    info["latency"] = time.monotonic() - started_at
+                    return parser.actions, True, info
+                self.errors[self.primary_model] = self.errors.get(self.primary_model, 0) + 1
+                log.warning("Resposta do OpenAI em streaming incompleta ou inválida: %s", parser.errors or "lista não foi fechada")
+            finally:
+                if self.on_parse is not None:
+                    self.on_parse(parse_seconds)
+            if parser.actions:
+                # Ações já emitidas podem ter virado ordens: repetir o pedido poderia duplicá-las
+                info["latency"] = time.monotonic() - started_at
+                return parser.actions, False, info
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+            time.sleep(max(0.0, min(backoff, deadline_at - time.monotonic())))
+
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            log.warning("Nenhuma resposta válida do OpenAI dentro do prazo de %.1fs.", deadline_at - started_at)
+            info["latency"] = time.monotonic() - started_at
+            return [], False, info
+        actions, valid, fallback_info = self.decide(prompt, deadline=remaining)
+        for action in actions:
+            if info["first_action_latency"] is None:
+                info["first_action_latency"] = time.monotonic() - started_at
+            on_action(action)
+        fallback_info.update(streamed=False, first_action_latency=info["first_action_latency"],
+                             latency=time.monotonic() - started_at)
+        return actions, valid, fallback_info
+
+    def _attempt(self, model, prompt, deadline_at, finished):
+        """Chama o modelo, repetindo falhas com backoff com jitter até max_retries ou o prazo."""
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0 or finished.is_set():
+                break
+            request_started_at = time.monotonic()
+            try:
+                response = self.openai_api.complete(prompt, model=model, timeout=remaining)
+            except Exception as e:
+                self.errors[model] = self.errors.get(model, 0) + 1
+                log.warning("Erro ao obter resposta do OpenAI (%s, tentativa %s): %s", model, attempt + 1, e)
+            else:
+                self._histogram(model).record(time.monotonic() - request_started_at)
+                parse_started_at = time.perf_counter()
+                actions, valid = self.parse(response)
+                if self.on_parse is not None:
+                    self.on_parse(time.perf_counter() - parse_started_at)
+                if valid:
+                    return actions, True
+                self.errors[model] = self.errors.get(model, 0) + 1
+            # "Full jitter": espera aleatória até o teto exponencial, sem passar do prazo
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+            finished.wait(max(0.0, min(backoff, deadline_at - time.monotonic())))
+        return [], False
+
+    def stats(self):
+        return {
+            "hedge_delay": self.hedge_delay(),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "errors": dict(self.errors),
+            "latency": {model: histogram.snapshot() for model, histogram in self.histograms.items()}
+        }
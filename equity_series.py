@@ -0,0 +1,237 @@
+# equity_series.py
+import os
+import threading
+import time
+
+import numpy as np
+
+from logging_setup import get_logger
+
+log = get_logger("equity")
+
+
+class EquitySeries:
+    """
+    Série temporal do valor total do portfólio de um usuário em arrays float64 (timestamp, valor).
+    Os arrays crescem dobrando até `capacity` pontos; depois disso viram um buffer circular
+    e os pontos mais antigos são sobrescritos. Não é thread-safe: o EquityStore faz o lock.
+    """
+    __slots__ = ("capacity", "timestamps", "values", "start", "size", "dirty")
+
+    def __init__(self, capacity, initial=1024):
+        self.capacity = capacity
+        initial = max(1, min(initial, capacity))
+        self.timestamps = np.empty(initial, dtype=np.float64)
+        self.values = np.empty(initial, dtype=np.float64)
+        self.start = 0 # Posição do ponto mais antigo (só muda depois que o buffer enche)
+        self.size = 0
+        self.dirty = False
+
+    def append(self, timestamp, value):
+        if self.size == len(self.values) and self.size < self.capacity:
+            self._grow(min(self.capacity, 2 * self.size))
+        if self.size < len(self.values):
+            index = self.size
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.size
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+        self.dirty = True
+
+    def _grow(self, length):
+        timestamps, values = self.arrays()
+        self.timestamps = np.empty(length, dtype=np.float64)
+        self.values = np.empty(length, dtype=np.float64)
+        self.timestamps[:self.size] = timestamps
+        self.values[:self.size] = values
+        self.start = 0
+
+    def arrays(self, start=None, end=None):
+        """Cópias (timestamps, valores) em ordem cronológica, opcionalmente só entre start e end."""
+        timestamps = np.concatenate([self.timestamps[self.start:self.size], self.timestamps[:self.start]])
+        values = np.concatenate([self.values[self.start:self.size], self.values[:self.start]])
+        if start is not None or end is not None:
+            lo = np.searchsorted(timestamps, start, side="left") if start is not None else 0
+            hi = np.searchsorted(timestamps, end, side="right") if end is not None else self.size
+            timestamps, values = timestamps[lo:hi], values[lo:hi]
+        return timestamps, values
+
+    @classmethod
+    def load(cls, path, capacity):
+        """Série gravada por save_series, mantendo só os `capacity` pontos mais recentes."""
+        with np.load(path) as data:
+            timestamps, values = data["timestamps"][-capacity:], data["values"][-capacity:]
+        series = cls(capacity, initial=max(len(timestamps), 1024))
+        series.timestamps[:len(timestamps)] = timestamps
+        series.values[:len(values)] = values
+        series.size = len(timestamps)
+        return series
+
+
+def save_series(path, timestamps, values):
+    """Grava a série em .npz (arquivo temporário + rename: nunca fica um arquivo pela metade)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, timestamps=timestamps, values=values)
+    os.replace(tmp_path, path)
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: escolhe `threshold` pontos que preservam a forma visual da série
+    (picos e vales), mantendo o primeiro e o último. Cada balde é avaliado com operações do NumPy,
+    então o custo é O(n) com um laço de apenas `threshold` iterações.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    # threshold - 2 baldes entre o primeiro e o último ponto: o balde i é [edges[i], edges[i + 1])
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # Vértice C do triângulo: média do próximo balde (no último balde, o último ponto)
+        next_lo, next_hi = hi, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - avg_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y - ay))
+        previous = lo + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+
+def minmax_downsample(x, y, width):
+    """Mínimo e máximo de cada um dos `width` baldes (em ordem de tempo): até 2 * width pontos, sem perder picos."""
+    n = len(x)
+    if 2 * width >= n or width < 1:
+        return x, y
+    edges = np.linspace(0, n, width + 1).astype(np.int64)
+    starts = edges[:-1]
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+    # Índices do mínimo e do máximo de cada balde, para mantê-los na ordem em que ocorreram
+    bucket_of = np.repeat(np.arange(width), np.diff(edges))
+    is_min = y == mins[bucket_of]
+    is_max = y == maxs[bucket_of]
+    first_min = np.full(width, n, dtype=np.int64)
+    first_max = np.full(width, n, dtype=np.int64)
+    np.minimum.at(first_min, bucket_of[is_min], np.nonzero(is_min)[0])
+    np.minimum.at(first_max, bucket_of[is_max], np.nonzero(is_max)[0])
+    selected = np.unique(np.concatenate([first_min, first_max]))
+    return x[selected], y[selected]
+
+
+class EquityStore:
+    """
+    Séries de patrimônio de todos os usuários. `record` só escreve nos arrays em memória;
+    uma thread grava as séries alteradas em `directory` a cada `persist_interval` segundos.
+    As séries são carregadas do disco no primeiro acesso de cada usuário.
+    """
+    def __init__(self, directory="equity", capacity=525600, persist_interval=60.0):
+        self.directory = directory
+        self.capacity = capacity # Pontos por usuário (525600 = 1 ano de pontos por minuto, ~8 MB)
+        self.persist_interval = persist_interval
+        self._series = {} # {user_id: EquitySeries}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"equity_{user_id}.npz")
+
+    def _get(self, user_id):
+        """
+        Série do usuário, carregada do disco se existir. Chamar sem o lock: a leitura do arquivo
+        é feita fora dele, para não travar os outros usuários.
+        """
+        with self._lock:
+            series = self._series.get(user_id)
+        if series is not None:
+            return series
+        path = self._path(user_id)
+        if os.path.exists(path):
+            try:
+                series = EquitySeries.load(path, self.capacity)
+            except (OSError, ValueError, KeyError) as e:
+                log.error("Erro ao carregar a série de patrimônio: %s", e, extra={"user_id": user_id})
+        if series is None:
+            series = EquitySeries(self.capacity)
+        with self._lock:
+            return self._series.setdefault(user_id, series) # Outra thread pode ter carregado antes
+
+    def record(self, user_id, value, timestamp=None):
+        """
+        Registra o valor total do portfólio (em USDT) do usuário. O primeiro acesso de cada usuário
+        lê o arquivo da série: os bots chamam via limits.io, fora da thread do event loop.
+        """
+        series = self._get(user_id)
+        with self._lock:
+            series.append(time.time() if timestamp is None else timestamp, float(value))
+        self.start()
+
+    def query(self, user_id, width=800, start=None, end=None, method="lttb"):
+        """
+        Série do usuário reduzida para caber em `width` pixels ("lttb" ou "minmax", com width / 2 baldes).
+        Retorna {"points": [[timestamp, valor], ...], "total_points": n, "method": método}.
+        """
+        series = self._get(user_id)
+        with self._lock:
+            timestamps, values = series.arrays(start, end)
+        total = len(timestamps)
+        if method == "minmax":
+            timestamps, values = minmax_downsample(timestamps, values, max(1, width // 2))
+        else:
+            method = "lttb"
+            timestamps, values = lttb(timestamps, values, width)
+        return {
+            "points": np.column_stack([timestamps, np.round(values, 2)]).tolist(),
+            "total_points": total,
+            "method": method
+        }
+
+    def flush(self):
+        """Grava no disco as séries alteradas desde a última gravação."""
+        with self._lock:
+            snapshots = []
+            for user_id, series in self._series.items():
+                if series.dirty:
+                    snapshots.append((user_id, series.arrays())) # Cópias: gravadas fora do lock
+                    series.dirty = False
+        if snapshots:
+            os.makedirs(self.directory, exist_ok=True)
+        for user_id, (timestamps, values) in snapshots: # O disco não atrasa os bots
+            try:
+                save_series(self._path(user_id), timestamps, values)
+            except OSError as e:
+                log.error("Erro ao gravar a série de patrimônio: %s", e, extra={"user_id": user_id})
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._persist_loop, name="equity-store", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _persist_loop(self):
+        while not self._stop.wait(self.persist_interval):
+            self.flush()
+
+
+# Instância única do processo, compartilhada por todos os bots e pelo Flask
+equity_store = EquityStore()
@@ -0,0 +1,223 @@
+# exchange_info.py
+import threading
+import time
+from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
+
+from logging_setup import get_logger
+
+log = get_logger("binance")
+
+ZERO = Decimal("0")
+
+
+class SymbolFilters:
+    """Filtros de negociação de um símbolo (LOT_SIZE, MARKET_LOT_SIZE, PRICE_FILTER, (MIN_)NOTIONAL)."""
+    __slots__ = ("symbol", "status", "min_qty", "max_qty", "step_size",
+                 "market_min_qty", "market_max_qty", "market_step_size",
+                 "min_price", "max_price", "tick_size",
+                 "min_notional", "max_notional", "notional_applies_to_market")
+
+    def __init__(self, symbol, status="TRADING"):
+        self.symbol = symbol
+        self.status = status
+        self.min_qty = ZERO
+        self.max_qty = ZERO
+        self.step_size = ZERO
+        self.market_min_qty = ZERO
+        self.market_max_qty = ZERO
+        self.market_step_size = ZERO
+        self.min_price = ZERO
+        self.max_price = ZERO
+        self.tick_size = ZERO
+        self.min_notional = ZERO
+        self.max_notional = ZERO
+        self.notional_applies_to_market = True
+
+    @classmethod
+    def from_symbol_info(cls, info):
+        """Constrói os filtros a partir de um item de exchangeInfo['symbols']."""
+        filters = cls(info["symbol"], info.get("status", "TRADING"))
+        for f in info.get("filters", []):
+            kind = f.get("filterType")
+            if kind == "LOT_SIZE":
+                filters.min_qty = Decimal(f["minQty"])
+                filters.max_qty = Decimal(f["maxQty"])
+                filters.step_size = Decimal(f["stepSize"])
+            elif kind == "MARKET_LOT_SIZE":
+                filters.market_min_qty = Decimal(f["minQty"])
+                filters.market_max_qty = Decimal(f["maxQty"])
+                filters.market_step_size = Decimal(f["stepSize"])
+            elif kind == "PRICE_FILTER":
+                filters.min_price = Decimal(f["minPrice"])
+                filters.max_price = Decimal(f["maxPrice"])
+                filters.tick_size = Decimal(f["tickSize"])
+            elif kind == "MIN_NOTIONAL":
+                filters.min_notional = Decimal(f["minNotional"])
+                filters.notional_applies_to_market = f.get("applyToMarket", True)
+            elif kind == "NOTIONAL":
+                filters.min_notional = Decimal(f["minNotional"])
+                filters.max_notional = Decimal(f.get("maxNotional", "0"))
+                filters.notional_applies_to_market = f.get("applyMinToMarket", True)
+        return filters
+
+    def quantity_limits(self, market=True):
+        """Retorna (min, max, step) para ordens a mercado ou limitadas. MARKET_LOT_SIZE com zero herda de LOT_SIZE."""
+        if market:
+            return (self.market_min_qty or self.min_qty,
+                    self.market_max_qty or self.max_qty,
+                    self.market_step_size or self.step_size)
+        return self.min_qty, self.max_qty, self.step_size
+
+
+def to_decimal(value):
+    """Converte via str para não herdar o erro de representação binária do float."""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def format_decimal(value):
+    """Formata um Decimal sem notação científica nem zeros à direita, como a Binance espera."""
+    text = format(value, "f")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text or "0"
+
+
+class ExchangeInfoCache:
+    """
+    Cache dos filtros de todos os símbolos da Binance, carregado uma vez (uma chamada a exchangeInfo)
+    e atualizado em segundo plano. Oferece quantização e validação exatas (Decimal), para que
+    ordens não sejam rejeitadas por stepSize/tickSize/minNotional.
+    Só a thread de atualização chama o loader: get() e a validação leem da memória e nunca fazem I/O
+    (rodam na thread do event loop dos bots). Se a carga falhar, a thread tenta de novo com backoff.
+    """
+    def __init__(self, loader=None, refresh_interval=3600, retry_interval=5.0):
+        self.loader = loader # Função sem argumentos que retorna a resposta de get_exchange_info()
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval # Primeira espera após uma falha; dobra a cada falha seguida
+        self.failures = 0 # Falhas seguidas da carga
+        self.failed_at = None # Instante (monotonic) da última falha
+        self._filters = {} # {símbolo: SymbolFilters}
+        self._loaded_at = 0.0
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def load(self, exchange_info=None):
+        """Carrega (ou recarrega) os filtros a partir da resposta de exchangeInfo ou do loader."""
+        if exchange_info is None:
+            exchange_info = self.loader()
+        filters = {info["symbol"]: SymbolFilters.from_symbol_info(info) for info in exchange_info["symbols"]}
+        self._filters = filters # Troca atômica: leitores nunca veem um índice parcial
+        self._loaded_at = time.monotonic()
+        self._loaded.set()
+
+    def ensure_loaded(self, timeout=30.0):
+        """
+        Liga a thread de atualização e espera a primeira carga por até `timeout` segundos.
+        Não chama o loader na thread de quem espera; se a carga ainda não veio, get() retorna None.
+        """
+        if self._filters or self.loader is None:
+            return
+        self.start()
+        self._loaded.wait(timeout)
+
+    def get(self, symbol):
+        """Retorna os SymbolFilters do símbolo, ou None se ele não for conhecido (ou ainda não carregado)."""
+        return self._filters.get(symbol)
+
+    # --- Atualização em segundo plano ---
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._refresh_loop, name="exchange-info", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        delay = 0 # Primeira carga logo na partida
+        while not self._stop_event.wait(delay):
+            if self.loader is None:
+                delay = self.retry_interval
+                continue
+            try:
+                self.load()
+                self.failures = 0
+                delay = self.refresh_interval
+            except Exception as e:
+                self.failures += 1
+                self.failed_at = time.monotonic()
+                delay = min(self.retry_interval * 2 ** (self.failures - 1), self.refresh_interval)
+                if self._filters:
+                    log.warning("Erro ao atualizar exchange info da Binance (mantendo a versão anterior): %s", e)
+                else:
+                    log.error("Erro ao carregar exchange info da Binance (nova tentativa em %gs): %s", delay, e)
+
+    # --- Quantização e validação ---
+
+    def quantize_quantity(self, symbol, quantity, market=True):
+        """
+        Arredonda a quantidade PARA BAIXO até minQty + um múltiplo do stepSize (a mesma regra que
+        validate_order e a Binance conferem), para nunca exceder o saldo ou o valor pretendido.
+        Retorna Decimal, ou None se o símbolo não for conhecido.
+        """
+        filters = self.get(symbol)
+        if filters is None:
+            return None
+        min_qty, _, step = filters.quantity_limits(market)
+        quantity = to_decimal(quantity)
+        if step <= 0:
+            return quantity
+        steps = ((quantity - min_qty) / step).to_integral_value(rounding=ROUND_FLOOR)
+        return max(min_qty + steps * step, ZERO)
+
+    def quantize_price(self, symbol, price, rounding=ROUND_HALF_UP):
+        """Arredonda o preço para um múltiplo do tickSize. Retorna Decimal, ou None se o símbolo não for conhecido."""
+        filters = self.get(symbol)
+        if filters is None:
+            return None
+        price = to_decimal(price)
+        if filters.tick_size <= 0:
+            return price
+        return (price / filters.tick_size).to_integral_value(rounding=rounding) * filters.tick_size
+
+    def validate_order(self, symbol, quantity, price, market=True):
+        """
+        Verifica se a ordem passa nos filtros da Binance. Com price=None, apenas a quantidade é validada.
+        Retorna (True, None) ou (False, motivo).
+        """
+        filters = self.get(symbol)
+        if filters is None:
+            return False, f"Símbolo {symbol} desconhecido na exchange info."
+        if filters.status != "TRADING":
+            return False, f"Símbolo {symbol} não está em negociação (status {filters.status})."
+        quantity = to_decimal(quantity)
+        min_qty, max_qty, step = filters.quantity_limits(market)
+        if quantity <= 0 or quantity < min_qty:
+            return False, f"Quantidade {format_decimal(quantity)} abaixo do mínimo {format_decimal(min_qty)}."
+        if max_qty > 0 and quantity > max_qty:
+            return False, f"Quantidade {format_decimal(quantity)} acima do máximo {format_decimal(max_qty)}."
+        if step > 0 and (quantity - min_qty) % step != 0:
+            return False, f"Quantidade {format_decimal(quantity)} não é múltipla do stepSize {format_decimal(step)}."
+        if price is None:
+            return True, None
+        price = to_decimal(price)
+        if not market and filters.tick_size > 0 and price % filters.tick_size != 0:
+            return False, f"Preço {format_decimal(price)} não é múltiplo do tickSize {format_decimal(filters.tick_size)}."
+        if not market or filters.notional_applies_to_market:
+            notional = quantity * price
+            if notional < filters.min_notional:
+                return False, f"Valor da ordem {format_decimal(notional)} abaixo do mínimo {format_decimal(filters.min_notional)}."
+            if filters.max_notional > 0 and notional > filters.max_notional:
+                return False, f"Valor da ordem {format_decimal(notional)} acima do máximo {format_decimal(filters.max_notional)}."
+        return True, None
+
+
+# Instância única do processo, compartilhada por todos os bots
+exchange_info = ExchangeInfoCache()
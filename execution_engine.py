@@ -0,0 +1,180 @@
+# execution_engine.py
+import asyncio
+import hashlib
+import json
+import time
+
+from metrics import metrics, bot_stage_seconds, bot_orders_total
+from logging_setup import get_logger
+
+log = get_logger("orders")
+
+
+def client_order_id(user_id, cycle_id, index, action):
+    """
+    Id determinístico da ordem (newClientOrderId): o mesmo usuário, ciclo, posição e conteúdo
+    da ação geram sempre o mesmo id, até 36 caracteres de [A-Za-z0-9-].
+    """
+    digest = hashlib.sha1(json.dumps(action, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8]
+    return f"bot{user_id}-{cycle_id}-{index}-{digest}"[-36:]
+
+
+def aggregate_fills(order):
+    """
+    Soma todas as execuções da ordem (não só fills[0]): quantidade, valor em USDT,
+    preço médio ponderado (VWAP) e comissões por ativo.
+    """
+    fills = order.get('fills') or []
+    executed_quantity = 0.0
+    quote_quantity = 0.0
+    commission = {}
+    for fill in fills:
+        qty = float(fill.get('qty', 0))
+        executed_quantity += qty
+        quote_quantity += qty * float(fill.get('price', 0))
+        asset = fill.get('commissionAsset')
+        if asset:
+            commission[asset] = commission.get(asset, 0.0) + float(fill.get('commission', 0))
+    if not fills:
+        # Sem fills (ex: ordem obtida por consulta), usa os totais da própria ordem
+        executed_quantity = float(order.get('executedQty') or 0)
+        quote_quantity = float(order.get('cummulativeQuoteQty') or 0)
+    return {
+        "executed_quantity": executed_quantity,
+        "quote_quantity": quote_quantity,
+        "avg_price": quote_quantity / executed_quantity if executed_quantity else None,
+        "commission": commission,
+        "fills": len(fills)
+    }
+
+
+def resolve_unknown_order(binance_api, symbol, order_id, attempts=5, delay=0.5):
+    """
+    Descobre o que aconteceu com uma ordem de situação desconhecida consultando-a pelo client order id,
+    em vez de reenviá-la (o que poderia executá-la duas vezes). Retorna a ordem, ou None se ela não existe.
+    """
+    for attempt in range(attempts):
+        order, status = binance_api.get_order(symbol, order_id)
+        if status == "found":
+            if float(order.get('executedQty') or 0) > 0 and order.get('orderId') is not None:
+                order['fills'] = binance_api.get_order_fills(symbol, order['orderId'])
+            return order
+        if status == "missing" and attempt >= 1:
+            # Consultado mais de uma vez e ainda desconhecido pela Binance: a ordem não chegou
+            return None
+        time.sleep(delay * (2 ** attempt))
+    log.error("Não foi possível confirmar a ordem %s de %s. Verifique a conta manualmente.", order_id, symbol)
+    return None
+
+
+def place_order(binance_api, plan, order_id):
+    """Envia a ordem planejada (em uma thread) e retorna a ordem final, resolvendo situações desconhecidas."""
+    order, status = binance_api.submit_market_order(plan["side"], plan["symbol"], plan["quantity"], order_id)
+    if status == "unknown":
+        order = resolve_unknown_order(binance_api, plan["symbol"], order_id)
+    return order
+
+
+class ExecutionBatch:
+    """
+    Executa as ações de um ciclo contra um único snapshot de preços e saldos.
+    `submit` valida cada ação na hora (via `plan`), reservando o USDT de compras e a quantidade de
+    vendas já enviadas, e dispara a ordem sem esperar as anteriores: ordens de símbolos diferentes
+    correm em paralelo e as do mesmo símbolo ficam em sequência. Cada ordem leva um client order id
+    determinístico, e situações desconhecidas são resolvidas por consulta, nunca por reenvio.
+    Como no loop sequencial original, só ordens executadas contam para `max_orders`: uma ordem
+    recusada ou não executada devolve a vaga e a reserva de USDT/quantidade.
+    """
+    def __init__(self, user_id, binance_api, plan, current_prices, usdt_balance, user_config, limits,
+                 cycle_id, max_orders=1):
+        self.user_id = user_id
+        self.binance_api = binance_api
+        self.plan = plan # Função (ação, preços, usdt disponível, config) -> plano da ordem ou None
+        self.current_prices = current_prices
+        self.usdt_available = usdt_balance
+        self.user_config = dict(user_config)
+        # Cópia própria do portfólio, descontada a cada venda reservada
+        self.user_config["portfolio_data"] = {symbol: dict(data) for symbol, data in user_config.get("portfolio_data", {}).items()}
+        self.limits = limits
+        self.cycle_id = cycle_id
+        self.max_orders = max_orders
+        self.actions_seen = 0
+        self.slots_used = 0 # Ordens em andamento ou executadas
+        self.first_fill_at = None
+        self._tasks = []
+        self._last_task_by_symbol = {}
+
+    @property
+    def full(self):
+        return self.slots_used >= self.max_orders
+
+    async def wait_for_slot(self):
+        """
+        Com o lote cheio, espera as ordens em andamento. Retorna True se alguma não executou e
+        liberou a vaga, ou False se todas as vagas ficaram com ordens executadas.
+        """
+        while self.full:
+            pending = [task for task in self._tasks if not task.done()]
+            if not pending:
+                return False
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        return True
+
+    def submit(self, action):
+        """Valida e dispara uma ação. Retorna True se uma ordem foi enviada."""
+        index = self.actions_seen
+        self.actions_seen += 1
+        if self.full:
+            return False
+        plan = self.plan(action, self.current_prices, self.usdt_available, self.user_config)
+        if plan is None:
+            return False
+        symbol = plan["symbol"]
+        self._reserve(plan, 1)
+        self.slots_used += 1
+
+        order_id = client_order_id(self.user_id, self.cycle_id, index, action)
+        task = asyncio.ensure_future(self._execute(plan, order_id, self._last_task_by_symbol.get(symbol)))
+        self._last_task_by_symbol[symbol] = task
+        self._tasks.append(task)
+        return True
+
+    def _reserve(self, plan, direction):
+        """Reserva (direction=1) ou devolve (-1) o USDT de uma compra ou a quantidade de uma venda."""
+        if plan["side"] == "BUY":
+            self.usdt_available -= direction * plan["usdt_amount"]
+        else:
+            holding = self.user_config["portfolio_data"].get(plan["symbol"])
+            if holding is not None:
+                holding["amount"] -= direction * float(plan["quantity"])
+
+    async def _execute(self, plan, order_id, previous):
+        if previous is not None:
+            await asyncio.wait([previous]) # Mesmo símbolo: espera a ordem anterior, sem herdar seu erro
+        # Blindado contra cancelamento: parar o bot não deve abandonar uma ordem pela metade
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            order = await asyncio.shield(self.limits.exchange(place_order, self.binance_api, plan, order_id))
+            outcome = "filled" if order else "not_filled"
+        finally:
+            if outcome != "filled": # Roda na thread do loop, como submit: sem corrida com as reservas
+                self._reserve(plan, -1)
+                self.slots_used -= 1
+            user_label = metrics.user_label(self.user_id)
+            bot_stage_seconds.observe(time.perf_counter() - started_at, "order_submit", user_label)
+            bot_orders_total.inc(user_label, plan["side"], outcome)
+        if order and self.first_fill_at is None:
+            self.first_fill_at = time.perf_counter()
+        return plan, order
+
+    async def results(self):
+        """Aguarda todas as ordens enviadas e retorna [(plano, ordem ou None)] na ordem de envio."""
+        outcomes = await asyncio.gather(*self._tasks, return_exceptions=True)
+        results = []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                log.error("Erro ao executar ordem: %r", outcome, extra={"user_id": self.user_id})
+                continue
+            results.append(outcome)
+        return results
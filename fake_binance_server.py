@@ -0,0 +1,229 @@
+# fake_binance_server.py
+# Servidor local que imita os endpoints REST da Binance Spot usados pelo bot, sobre a exchange simulada,
+# para testes de carga sem rede nem dinheiro. Uso: python fake_binance_server.py --port 8098
+# e aponte o python-binance para ele com binance.client.Client.API_URL = "http://127.0.0.1:8098/api".
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from exchange_info import format_decimal
+from rate_limiter import WEIGHTS
+from sim_exchange import DEFAULT_PRICES, SimulatedExchange, SimulatedOrderError
+
+# Latência lognormal por tipo de endpoint: (mediana em segundos, sigma)
+DEFAULT_LATENCY = {
+    "order": (0.03, 0.5),
+    "default": (0.015, 0.4),
+}
+
+# Endpoint -> nome do método do python-binance, para contar o peso como a Binance conta
+ENDPOINT_METHODS = {
+    ("GET", "account"): "get_account",
+    ("GET", "ticker/price"): "get_all_tickers",
+    ("GET", "exchangeInfo"): "get_exchange_info",
+    ("POST", "order"): "order_market_buy",
+    ("GET", "order"): "get_order",
+    ("GET", "myTrades"): "get_my_trades",
+}
+
+
+def symbol_info(symbol, price):
+    """Item de exchangeInfo['symbols'] com filtros plausíveis para o preço (stepSize de ~0,01-0,1 USDT)."""
+    step = format_decimal(Decimal(10) ** math.floor(math.log10(1 / price)))
+    return {
+        "symbol": symbol,
+        "status": "TRADING",
+        "baseAsset": symbol[:-4],
+        "quoteAsset": "USDT",
+        "filters": [
+            {"filterType": "PRICE_FILTER", "minPrice": "0.00000001", "maxPrice": "1000000", "tickSize": "0.00000001"},
+            {"filterType": "LOT_SIZE", "minQty": step, "maxQty": "9000000", "stepSize": step},
+            {"filterType": "MARKET_LOT_SIZE", "minQty": "0", "maxQty": "9000000", "stepSize": "0"},
+            {"filterType": "NOTIONAL", "minNotional": "5", "applyMinToMarket": True, "maxNotional": "9000000", "applyMaxToMarket": False}
+        ]
+    }
+
+
+class FakeBinanceServer:
+    """
+    Servidor HTTP em thread própria. Cada chave de API (cabeçalho X-MBX-APIKEY) é uma conta da
+    exchange simulada; `latency` e `error_rate` podem ser alterados em tempo de execução.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_rate=0.0, exchange=None, prices=None, seed=None):
+        self.latency = dict(latency or DEFAULT_LATENCY)
+        self.error_rate = error_rate
+        # A latência é do servidor: a exchange simulada executa na hora
+        self.exchange = exchange or SimulatedExchange(latency=0.0, latency_jitter=0.0, seed=seed)
+        self.exchange.set_prices(prices or DEFAULT_PRICES)
+        self.requests = 0
+        self.errors = 0
+        self._weight_minute = 0
+        self._weight_used = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """Valor para binance.client.Client.API_URL."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def sample_latency(self, kind):
+        median, sigma = self.latency.get(kind, self.latency["default"])
+        with self._lock:
+            return self._random.lognormvariate(math.log(median), sigma)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def use_weight(self, weight):
+        """Soma o peso da requisição no minuto corrente e retorna o total (x-mbx-used-weight-1m)."""
+        minute = int(time.time() // 60)
+        with self._lock:
+            self.requests += 1
+            if minute != self._weight_minute:
+                self._weight_minute, self._weight_used = minute, 0
+            self._weight_used += weight
+            return self._weight_used
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-binance", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.exchange.stop()
+
+    def _make_handler(self):
+        server = self
+        exchange = self.exchange
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, como a Binance
+
+            def log_message(self, format, *args):
+                pass # Silencioso: os testes geram muitas requisições
+
+            def _send_json(self, status, payload, used_weight=0):
+                body = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("x-mbx-used-weight-1m", str(used_weight))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _params(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    body = self.rfile.read(length).decode("utf-8")
+                    params.update({key: values[-1] for key, values in parse_qs(body).items()})
+                return url.path.split("/api/v3/", 1)[-1].rstrip("/"), params
+
+            def _handle(self, method):
+                endpoint, params = self._params()
+                used_weight = server.use_weight(WEIGHTS.get(ENDPOINT_METHODS.get((method, endpoint)), 1))
+                time.sleep(server.sample_latency("order" if endpoint == "order" else "default"))
+                if server.should_fail():
+                    with server._lock:
+                        server.errors += 1
+                    self._send_json(503, {"code": -1001, "msg": "Erro simulado."}, used_weight)
+                    return
+                try:
+                    status, payload = route(method, endpoint, params, self.headers.get("X-MBX-APIKEY", ""))
+                except SimulatedOrderError as e:
+                    status, payload = 400, {"code": e.code, "msg": e.message}
+                self._send_json(status, payload, used_weight)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        def route(method, endpoint, params, api_key):
+            if endpoint in ("ping", "userDataStream") and method != "POST":
+                return 200, {}
+            if endpoint == "userDataStream":
+                return 200, {"listenKey": f"fake-{api_key}"}
+            if endpoint == "time":
+                return 200, {"serverTime": int(time.time() * 1000)}
+            if endpoint == "exchangeInfo":
+                prices = exchange.get_prices(list(DEFAULT_PRICES) + list(exchange._prices))
+                return 200, {"timezone": "UTC", "symbols": [symbol_info(symbol, price) for symbol, price in prices.items()]}
+            if endpoint == "ticker/price":
+                if "symbol" in params:
+                    price = exchange.get_price(params["symbol"])
+                    if price is None:
+                        return 400, {"code": -1121, "msg": "Invalid symbol."}
+                    return 200, {"symbol": params["symbol"], "price": format_decimal(Decimal(str(price)))}
+                prices = exchange.get_prices(list(exchange._prices))
+                return 200, [{"symbol": symbol, "price": format_decimal(Decimal(str(price)))} for symbol, price in prices.items()]
+            if endpoint == "account":
+                balances = exchange.balances(api_key)
+                return 200, {"canTrade": True, "balances": [
+                    {"asset": asset, "free": format_decimal(Decimal(str(free))), "locked": format_decimal(Decimal(str(locked)))}
+                    for asset, (free, locked) in balances.items()
+                ]}
+            if endpoint == "order" and method == "POST":
+                order = exchange.market_order(api_key, params.get("side"), params.get("symbol"),
+                                              params.get("quantity"), params.get("newClientOrderId"))
+                return 200, order
+            if endpoint == "order" and method == "GET":
+                order = exchange.get_order(api_key, params.get("symbol"), params.get("origClientOrderId"))
+                if order is None:
+                    return 400, {"code": -2013, "msg": "Order does not exist."}
+                return 200, order
+            if endpoint == "myTrades":
+                return 200, exchange.get_order_fills(api_key, params.get("symbol"), int(params.get("orderId", 0)))
+            return 404, {"code": -1, "msg": f"Endpoint {method} {endpoint} não simulado."}
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor falso da API REST da Binance Spot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração das requisições que retornam HTTP 503.")
+    parser.add_argument("--latency", action="append", default=[], metavar="TIPO=MEDIANA:SIGMA",
+                        help="Latência lognormal de um tipo de endpoint (order ou default), ex: order=0.05:0.5 (pode repetir).")
+    parser.add_argument("--volatility", type=float, default=0.001, help="Desvio do passeio aleatório dos preços a cada segundo.")
+    args = parser.parse_args()
+
+    latency = dict(DEFAULT_LATENCY)
+    for spec in args.latency:
+        kind, values = spec.split("=", 1)
+        median, sigma = values.split(":", 1)
+        latency[kind] = (float(median), float(sigma))
+
+    fake = FakeBinanceServer(args.host, args.port, latency, args.error_rate)
+    fake.exchange.start_random_walk(volatility=args.volatility)
+    print(f"Servidor falso da Binance em {fake.api_url} (Ctrl+C para sair)")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,170 @@
+# fake_openai_server.py
+# Servidor local que imita POST /v1/chat/completions do OpenAI, para testar latência, hedge e falhas
+# sem gastar créditos. Uso: python fake_openai_server.py --port 8099 --error-rate 0.05
+# e configure "OPENAI_BASE_URL": "http://127.0.0.1:8099/v1" no config.json.
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latência lognormal por modelo: (mediana em segundos, sigma)
+DEFAULT_LATENCY = {
+    "gpt-4o": (4.0, 0.6),
+    "gpt-4o-mini": (1.5, 0.4),
+}
+DEFAULT_RESPONSE = '[{"action": "BUY", "symbol": "BTCUSDT", "reason": "Resposta simulada."}]'
+
+
+class FakeOpenAIServer:
+    """Servidor HTTP em thread própria; `latency`, `error_rate` e `response` podem ser alterados em tempo de execução."""
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_rate=0.0, response=DEFAULT_RESPONSE, seed=None,
+                 chunk_size=8):
+        self.latency = dict(latency or DEFAULT_LATENCY)
+        self.error_rate = error_rate
+        self.response = response
+        self.chunk_size = chunk_size # Caracteres por pedaço nas respostas em streaming
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def sample_latency(self, model):
+        median, sigma = self.latency.get(model, (1.0, 0.5))
+        with self._lock:
+            return self._random.lognormvariate(math.log(median), sigma)
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass # Silencioso: os testes geram muitas requisições
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # O cliente desistiu (timeout ou hedge vencedor)
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                model = request.get("model", "gpt-4o")
+                with server._lock:
+                    server.requests += 1
+                latency = server.sample_latency(model)
+                if request.get("stream"):
+                    # Primeiro pedaço após 20% da latência; o restante é distribuído até o total
+                    time.sleep(latency * 0.2)
+                else:
+                    time.sleep(latency)
+                if server.should_fail():
+                    with server._lock:
+                        server.errors += 1
+                    self._send_json(500, {"error": {"message": "Erro simulado", "type": "server_error"}})
+                    return
+                if request.get("stream"):
+                    self._send_stream(model, latency * 0.8)
+                    return
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": server.response},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                })
+
+            def _send_stream(self, model, duration):
+                """Envia a resposta como server-sent events, no formato de chat.completion.chunk."""
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                pieces = [server.response[i:i + server.chunk_size] for i in range(0, len(server.response), server.chunk_size)]
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Cache-Control", "no-cache")
+                    self.end_headers()
+                    for index, piece in enumerate(pieces + [None]):
+                        chunk = {
+                            "id": completion_id,
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"content": piece} if piece is not None else {},
+                                "finish_reason": None if piece is not None else "stop"
+                            }]
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        if piece is not None and index < len(pieces) - 1:
+                            time.sleep(duration / max(1, len(pieces) - 1))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                self.close_connection = True # Sem Content-Length: o fim da conexão delimita a resposta
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor falso da API de chat completions do OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração das requisições que retornam HTTP 500.")
+    parser.add_argument("--latency", action="append", default=[], metavar="MODELO=MEDIANA:SIGMA",
+                        help="Latência lognormal de um modelo, ex: gpt-4o=4:0.6 (pode repetir).")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="Conteúdo retornado pelo assistente.")
+    args = parser.parse_args()
+
+    latency = dict(DEFAULT_LATENCY)
+    for spec in args.latency:
+        model, values = spec.split("=", 1)
+        median, sigma = values.split(":", 1)
+        latency[model] = (float(median), float(sigma))
+
+    fake = FakeOpenAIServer(args.host, args.port, latency, args.error_rate, args.response)
+    print(f"Servidor falso do OpenAI em {fake.base_url} (Ctrl+C para sair)")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,200 @@
+# http_pool.py
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ConnectionStats:
+    """Contadores de um upstream: conexões abertas (e o tempo de TCP+TLS) e espera por uma conexão livre no pool."""
+    def __init__(self):
+        self.requests = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.max_connect_seconds = 0.0
+        self.pool_waits = 0 # Requisições que esperaram mais de 1 ms por uma conexão
+        self.pool_wait_seconds = 0.0
+        self.max_pool_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_connect(self, seconds):
+        with self._lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+            self.max_connect_seconds = max(self.max_connect_seconds, seconds)
+
+    def record_checkout(self, wait_seconds):
+        with self._lock:
+            self.requests += 1
+            if wait_seconds > 0.001:
+                self.pool_waits += 1
+                self.pool_wait_seconds += wait_seconds
+                self.max_pool_wait_seconds = max(self.max_pool_wait_seconds, wait_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connects": self.connects,
+                "reuse_rate": round(1 - self.connects / self.requests, 3) if self.requests else 0.0,
+                "avg_connect_ms": round(1000 * self.connect_seconds / self.connects, 1) if self.connects else 0.0,
+                "max_connect_ms": round(1000 * self.max_connect_seconds, 1),
+                "pool_waits": self.pool_waits,
+                "avg_pool_wait_ms": round(1000 * self.pool_wait_seconds / self.pool_waits, 1) if self.pool_waits else 0.0,
+                "max_pool_wait_ms": round(1000 * self.max_pool_wait_seconds, 1)
+            }
+
+
+def _timed_pool_classes(stats):
+    """Cria pools do urllib3 que medem o tempo de conexão (TCP+TLS) e a espera por uma conexão livre."""
+    class TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            started_at = time.perf_counter()
+            super().connect()
+            stats.record_connect(time.perf_counter() - started_at)
+
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            started_at = time.perf_counter()
+            super().connect()
+            stats.record_connect(time.perf_counter() - started_at)
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+        def _get_conn(self, timeout=None):
+            started_at = time.perf_counter()
+            conn = super()._get_conn(timeout)
+            stats.record_checkout(time.perf_counter() - started_at)
+            return conn
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+        def _get_conn(self, timeout=None):
+            started_at = time.perf_counter()
+            conn = super()._get_conn(timeout)
+            stats.record_checkout(time.perf_counter() - started_at)
+            return conn
+
+    return {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter do requests cujo pool registra as estatísticas em `stats`."""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self.stats)
+
+
+class TimedHTTPTransport(httpx.HTTPTransport):
+    """
+    Transporte do httpx que mede, pelos eventos de trace do httpcore, a espera por uma conexão
+    do pool (até a conexão ser aberta ou a requisição começar a ser enviada) e o tempo de TCP+TLS.
+    """
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def handle_request(self, request):
+        started_at = time.perf_counter()
+        marks = {}
+
+        def trace(event_name, info):
+            now = time.perf_counter()
+            if event_name == "connection.connect_tcp.started":
+                marks["connect"] = now
+                self.stats.record_checkout(now - started_at)
+            elif event_name in ("connection.start_tls.complete", "connection.connect_tcp.complete"):
+                if "connect" in marks:
+                    marks["connected"] = now
+            elif event_name.endswith("send_request_headers.started") and "sent" not in marks:
+                marks["sent"] = now
+                if "connect" in marks:
+                    self.stats.record_connect(marks.get("connected", now) - marks["connect"])
+                else:
+                    self.stats.record_checkout(now - started_at) # Conexão reaproveitada do pool
+
+        request.extensions["trace"] = trace
+        return super().handle_request(request)
+
+
+class HttpPool:
+    """
+    Pools de conexões keep-alive compartilhados por todos os bots, um por upstream:
+    - binance: um único HTTPAdapter montado na sessão de cada Client (as chaves de API ficam nos
+      cabeçalhos da sessão de cada usuário, mas as conexões TCP/TLS com api.binance.com são as mesmas);
+    - openai: um único httpx.Client usado pelo OpenAIAPI de todos os usuários;
+    - dashboard: uma requests.Session para o transporte HTTP do dashboard.
+    Tamanhos e timeouts vêm da configuração global (main.py) e valem a partir da primeira criação.
+    """
+    def __init__(self, pool_maxsize=32, pool_block=True, connect_timeout=5.0, read_timeout=15.0,
+                 llm_read_timeout=60.0, keepalive_seconds=90.0):
+        self.pool_maxsize = pool_maxsize # Conexões por host
+        self.pool_block = pool_block # Com pool cheio, espera uma conexão em vez de abrir uma descartável
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.llm_read_timeout = llm_read_timeout
+        self.keepalive_seconds = keepalive_seconds
+        self.stats = {"binance": ConnectionStats(), "openai": ConnectionStats(), "dashboard": ConnectionStats()}
+        self._binance_adapter = None
+        self._openai_client = None
+        self._dashboard_session = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """Timeout (conexão, leitura) para as chamadas feitas com requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _adapter(self, name):
+        return TimedHTTPAdapter(self.stats[name], pool_connections=4, pool_maxsize=self.pool_maxsize,
+                                pool_block=self.pool_block, max_retries=0)
+
+    def mount_binance(self, session):
+        """Faz a sessão de um binance.Client usar o pool compartilhado."""
+        with self._lock:
+            if self._binance_adapter is None:
+                self._binance_adapter = self._adapter("binance")
+        session.mount("https://", self._binance_adapter)
+        session.mount("http://", self._binance_adapter)
+        return session
+
+    def openai_client(self):
+        """httpx.Client compartilhado para o OpenAI (o timeout por requisição ainda pode ser passado na chamada)."""
+        with self._lock:
+            if self._openai_client is None:
+                self._openai_client = httpx.Client(
+                    transport=TimedHTTPTransport(self.stats["openai"], limits=httpx.Limits(
+                        max_connections=self.pool_maxsize,
+                        max_keepalive_connections=self.pool_maxsize,
+                        keepalive_expiry=self.keepalive_seconds
+                    )),
+                    timeout=httpx.Timeout(self.llm_read_timeout, connect=self.connect_timeout)
+                )
+            return self._openai_client
+
+    def dashboard_session(self):
+        with self._lock:
+            if self._dashboard_session is None:
+                session = requests.Session()
+                adapter = self._adapter("dashboard")
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._dashboard_session = session
+            return self._dashboard_session
+
+    def metrics(self):
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+# Instância única do processo, compartilhada por todos os bots
+http_pool = HttpPool()
@@ -0,0 +1,196 @@
+# logging_setup.py
+import contextlib
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+ROOT_LOGGER = "bot" # Todos os componentes registram em "bot.<componente>" (ex: bot.trade, bot.binance)
+
+# Atributos padrão de um LogRecord; o que não estiver aqui veio de extra= e vai como campo do JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def get_logger(component):
+    """Logger de um componente (ex: "trade", "binance", "llm", "dashboard"), com nível configurável por componente."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{component}")
+
+
+class Lazy:
+    """
+    Payload calculado só quando o registro é escrito, na thread do listener: se o nível estiver
+    desligado ou o registro for descartado pelos filtros, func nunca roda. func não deve depender
+    de estado que o bot ainda vai alterar.
+    """
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        return self.func()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Uma linha JSON por registro: ts, level, component, msg, os campos de extra= e a exceção, se houver."""
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "component": record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample":
+                entry[key] = value() if isinstance(value, Lazy) else value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita cada mensagem (logger + modelo da mensagem, sem os argumentos) a `per_minute` registros por
+    minuto, com rajada de até `per_minute`; o próximo registro aceito leva em "suppressed" quantos
+    foram descartados. Registros com extra={"sample": p} passam só com probabilidade p, e os de DEBUG
+    com probabilidade `debug_sample_rate`. Roda na thread de quem registra, antes da fila: é barato.
+    """
+    def __init__(self, per_minute=600, debug_sample_rate=1.0):
+        super().__init__()
+        self.per_minute = per_minute
+        self.debug_sample_rate = debug_sample_rate
+        self._buckets = {} # {(logger, mensagem): [tokens, último instante, descartados]}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        sample = getattr(record, "sample", None)
+        if sample is None and record.levelno <= logging.DEBUG:
+            sample = self.debug_sample_rate
+        if sample is not None and sample < 1.0 and random.random() >= sample:
+            return False
+        if not self.per_minute:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= 10000: # Mensagens montadas com f-string não se repetem: não acumula chaves
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.per_minute), now, 0]
+            bucket[0] = min(float(self.per_minute), bucket[0] + (now - bucket[1]) * self.per_minute / 60.0)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro com a mensagem já montada e cópias rasas dos campos de extra=, porque quem
+    registra pode continuar alterando os objetos (ex: a ação que o lote de ordens vai completando).
+    O JSON e os payloads Lazy continuam sendo montados pelo listener.
+    Com a fila cheia (escrita mais lenta que os bots), descarta e conta em vez de bloquear quem registra.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and isinstance(value, (dict, list, set)):
+                record.__dict__[key] = value.copy() # Lazy fica como está: é calculado no listener de propósito
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Logging estruturado do processo: loggers "bot.*" -> filtro de taxa/amostragem -> fila ->
+    thread de escrita (QueueListener) -> JSON lines no stdout ou em um arquivo.
+    Os bots só pagam a checagem de nível, o filtro e um put na fila; o I/O fica na thread do listener.
+    """
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self.filter = None
+
+    def configure(self, level="INFO", component_levels=None, path=None, queue_size=10000,
+                  rate_limit_per_minute=600, debug_sample_rate=1.0):
+        """
+        `level` vale para todos os componentes; `component_levels` ({"dashboard": "DEBUG"}) sobrescreve
+        por componente. `path` None escreve no stdout.
+        """
+        self.stop()
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.propagate = False
+        for component, component_level in (component_levels or {}).items():
+            get_logger(component).setLevel(component_level)
+
+        if path:
+            output = logging.handlers.WatchedFileHandler(path, encoding="utf-8") # Compatível com logrotate
+        else:
+            output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonLinesFormatter())
+
+        self.filter = RateLimitFilter(rate_limit_per_minute, debug_sample_rate)
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.handler.addFilter(self.filter)
+        root.handlers = [self.handler]
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+        self.listener.start()
+
+    def stop(self):
+        """Escreve o que ainda está na fila e para a thread de escrita."""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def metrics(self):
+        return {
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+            "dropped": self.handler.dropped if self.handler else 0
+        }
+
+
+@contextlib.contextmanager
+def quiet_logs(level=logging.ERROR):
+    """Sobe temporariamente o nível de todos os componentes (ex: replays do backtest)."""
+    root = logging.getLogger(ROOT_LOGGER)
+    previous = root.level
+    overridden = {
+        name: logger.level for name, logger in logging.root.manager.loggerDict.items()
+        if isinstance(logger, logging.Logger) and name.startswith(ROOT_LOGGER + ".") and logger.level
+    }
+    root.setLevel(level)
+    for name in overridden:
+        logging.getLogger(name).setLevel(max(level, overridden[name]))
+    try:
+        yield
+    finally:
+        root.setLevel(previous)
+        for name, logger_level in overridden.items():
+            logging.getLogger(name).setLevel(logger_level)
+
+
+# Instância única do processo, configurada pelo main.py
+log_pipeline = LogPipeline()
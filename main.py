@@ -42,14 +42,29 @@ ensure_flask_secret_key()
 load_dotenv()
 
 # Importar diretamente o objeto 'app' e variáveis globais do app.py
-from app import app, run_flask_app, dashboard_data_by_user, bot_threads, bot_stop_events
+from app import app, run_flask_app, bot_threads, update_dashboard_data
 
 # Importar módulos auxiliares (auth e db)
 from auth import init_app as init_auth_app, get_user_broker_configs
-from db import init_app as init_db_app, init_db
+from db import init_app as init_db_app, init_db, connection_pool
 
 # Importar a lógica do bot
 import trade_logic
+from bot_engine import BotEngine
+from dashboard_bus import dashboard_bus, HttpDashboardTransport, FLASK_DASHBOARD_URL
+from price_cache import price_snapshot
+from market_data import market_data_hub
+from risk_engine import risk_engine
+from binance_api import get_public_client
+from exchange_info import exchange_info
+from rate_limiter import weight_governor, governed_call, PRIORITY_MARKET
+from http_pool import http_pool
+from trade_ledger import trade_ledger
+from equity_series import equity_store
+from sim_exchange import sim_exchange
+from metrics import metrics, bot_profilers
+from logging_setup import log_pipeline, get_logger
+from dashboard_store import dashboard_store
 
 # Inicializa os Blueprints e comandos CLI para a aplicação Flask
 init_db_app(app)
@@ -59,8 +74,65 @@ init_auth_app(app)
 def load_global_config():
     config = {
         "TRADE_INTERVAL_SECONDS": 300, # 5 minutos
-        "MAX_TRADES_PER_CYCLE": 1,
+        "MAX_TRADES_PER_CYCLE": 1, # Ordens executadas por ciclo (recusadas ou não executadas não contam)
         "QUANTITY_PER_TRADE_USDT": 10,
+        "PRICE_CACHE_TTL_SECONDS": 2, # Validade do snapshot de preços compartilhado entre os bots
+        "MARKET_DATA_STREAM": True, # Usa um único WebSocket da Binance para os preços de todos os bots
+        "MARKET_DATA_STREAM_TYPE": "bookTicker", # "bookTicker", "ticker" ou "miniTicker"
+        # Opcional: abre um WebSocket (e uma thread) por bot em execução; sem ele, os saldos vêm do REST
+        "USER_DATA_STREAM": False, # Mantém os saldos em memória via user-data stream da Binance
+        "ACCOUNT_RECONCILE_SECONDS": 300, # Intervalo da reconciliação dos saldos com o REST
+        "MAX_CONCURRENT_EXCHANGE_CALLS": 32, # Chamadas simultâneas à Binance, somando todos os bots
+        "MAX_CONCURRENT_LLM_CALLS": 8, # Chamadas simultâneas ao OpenAI, somando todos os bots
+        "DASHBOARD_TRANSPORT": "inprocess", # "inprocess" (barramento direto) ou "http" (bots em outro processo)
+        "DASHBOARD_URL": FLASK_DASHBOARD_URL, # Usado apenas com DASHBOARD_TRANSPORT = "http"
+        "DASHBOARD_HISTORY_LIMIT": 20, # Entradas de histórico mantidas no dashboard de cada usuário
+        "DASHBOARD_STATE_DIR": "dashboard", # Onde o estado dos dashboards ociosos é gravado ao sair da memória (None = descarta)
+        "DASHBOARD_IDLE_SECONDS": 1800, # Dashboards sem leitura nem atualização por este tempo saem da memória
+        "DASHBOARD_MAX_USERS_IN_MEMORY": 1000, # Acima disso, os dashboards acessados há mais tempo saem da memória
+        "EXCHANGE_INFO_REFRESH_SECONDS": 3600, # Recarga dos filtros (stepSize, tickSize, minNotional)
+        "BINANCE_WEIGHT_LIMIT_PER_MINUTE": 6000, # Limite REQUEST_WEIGHT por IP da Binance Spot
+        "BINANCE_WEIGHT_HEADROOM": 0.8, # Fração do limite que os bots podem usar (o resto é margem)
+        "BINANCE_MARKET_RESERVE": 0.3, # Leituras de preço são descartadas abaixo desta fração do orçamento
+        "BINANCE_ACCOUNT_RESERVE": 0.1, # Leituras de conta esperam abaixo desta fração; ordens usam tudo
+        "HTTP_POOL_MAXSIZE": 32, # Conexões keep-alive por host (Binance, OpenAI, dashboard), somando todos os bots
+        "HTTP_CONNECT_TIMEOUT_SECONDS": 5, # Timeout para abrir uma conexão (TCP+TLS)
+        "HTTP_READ_TIMEOUT_SECONDS": 15, # Timeout de leitura das chamadas à Binance
+        "HTTP_KEEPALIVE_SECONDS": 90, # Tempo que uma conexão ociosa com o OpenAI fica no pool
+        "DECISION_CACHE_ENABLED": True, # Pula o OpenAI quando o portfólio não mudou materialmente
+        "DECISION_CACHE_PRICE_TOLERANCE": 0.005, # Variação relativa de preço tratada como "sem mudança"
+        "DECISION_CACHE_BALANCE_TOLERANCE": 0.01, # Variação relativa de saldo tratada como "sem mudança"
+        "DECISION_CACHE_TTL_SECONDS": 900, # Idade máxima de uma decisão reutilizada
+        "DECISION_CACHE_MAX_ENTRIES": 128, # Estados distintos lembrados por usuário (LRU)
+        "LLM_PRIMARY_MODEL": "gpt-4o", # Modelo consultado primeiro a cada ciclo
+        "LLM_HEDGE_MODEL": "gpt-4o-mini", # Modelo mais rápido do hedge; None desativa o hedge
+        "LLM_DEADLINE_SECONDS": 45, # Prazo total da decisão do LLM por ciclo, incluindo novas tentativas
+        "LLM_HEDGE_PERCENTILE": 0.9, # O hedge é disparado após este percentil da latência do modelo principal
+        "LLM_MAX_RETRIES": 2, # Novas tentativas por modelo (backoff exponencial com jitter)
+        "LLM_STREAMING": True, # Recebe a resposta em streaming e executa cada ação assim que ela fica completa
+        "EQUITY_SERIES_DIR": "equity", # Diretório das séries de patrimônio por usuário (.npz)
+        "EQUITY_SERIES_CAPACITY": 525600, # Pontos guardados por usuário (525600 = 1 ano de pontos por minuto)
+        "EQUITY_PERSIST_SECONDS": 60, # Intervalo de gravação das séries alteradas no disco
+        "PROMPT_TOKEN_BUDGET": 300, # Tokens máximos da parte dinâmica do prompt (saldo e tabela do portfólio)
+        "EXCHANGE_BACKEND": "binance", # "binance" (ordens reais) ou "simulated" (exchange local, paper trading)
+        "SIM_LATENCY_SECONDS": 0.05, # Latência simulada de cada ordem na exchange local
+        "SIM_FEE_RATE": 0.001, # Taxa por execução na exchange local
+        "SIM_SLIPPAGE": 0.0005, # Fração do preço contra quem negocia na exchange local
+        "SIM_INITIAL_USDT": 1000, # Saldo inicial de cada conta simulada
+        "OPENAI_BASE_URL": None, # Servidor compatível com a API do OpenAI (None = api.openai.com)
+        "METRICS_PER_USER": True, # Rótulo de usuário nas métricas do /metrics (False agrega todos em "all")
+        "LOG_LEVEL": "INFO", # Nível dos logs estruturados (JSON lines) de todos os componentes
+        "LOG_LEVELS": {}, # Nível por componente, ex: {"trade": "DEBUG", "dashboard": "WARNING"} (DEBUG inclui prompts e respostas)
+        "LOG_FILE": None, # Arquivo dos logs (None = stdout)
+        "LOG_QUEUE_SIZE": 10000, # Registros aguardando a thread de escrita; com a fila cheia, os novos são descartados
+        "LOG_RATE_LIMIT_PER_MINUTE": 600, # Registros por minuto de cada mensagem (0 desativa o limite)
+        "LOG_DEBUG_SAMPLE_RATE": 1.0, # Fração dos registros de DEBUG que é escrita
+        # Motor de risco (opcional): com RISK_ENGINE_ENABLED = True e algum percentual abaixo maior que 0,
+        # o bot passa a VENDER SOZINHO, a mercado e com dinheiro real, as compras que atingirem as regras
+        "RISK_ENGINE_ENABLED": False, # Avalia stop-loss/take-profit a cada preço do stream (requer MARKET_DATA_STREAM)
+        "STOP_LOSS_PCT": 0, # Vende se o preço cair esta fração abaixo do preço de compra, ex: 0.05 (0 desativa)
+        "TAKE_PROFIT_PCT": 0, # Vende se o preço subir esta fração acima do preço de compra, ex: 0.10 (0 desativa)
+        "TRAILING_STOP_PCT": 0, # Vende se o preço cair esta fração abaixo do maior preço desde a compra (0 desativa)
         "symbols_to_watch": ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "DOGEUSDT", "LINKUSDT", "ADAUSDT", "FETUSDT", "AVAXUSDT", "OMUSDT", "RNDRUSDT", "TRUMPUSDT"] # Padrão, pode ser sobrescrito por config.json
     }
     if os.path.exists('config.json'):
@@ -78,22 +150,120 @@ def load_global_config():
 
 global_bot_config = load_global_config()
 
-# --- Funções do Bot e Threads ---
+# Logs estruturados: os bots só enfileiram, uma thread formata e escreve
+log_pipeline.configure(
+    level=global_bot_config["LOG_LEVEL"],
+    component_levels=global_bot_config["LOG_LEVELS"],
+    path=global_bot_config["LOG_FILE"],
+    queue_size=global_bot_config["LOG_QUEUE_SIZE"],
+    rate_limit_per_minute=global_bot_config["LOG_RATE_LIMIT_PER_MINUTE"],
+    debug_sample_rate=global_bot_config["LOG_DEBUG_SAMPLE_RATE"]
+)
+main_log = get_logger("main") # Partida e desligamento; antes do pipeline configurado, as mensagens usam print
+
+# O snapshot de preços é único no processo, então sua validade vem da configuração global
+price_snapshot.ttl = global_bot_config["PRICE_CACHE_TTL_SECONDS"]
+
+# O hub de streaming usa o snapshot REST para preencher preços após (re)conexões
+market_data_hub.stream_type = global_bot_config["MARKET_DATA_STREAM_TYPE"]
+market_data_hub.backfill = lambda symbols: price_snapshot.get_prices(get_public_client(), symbols)
+
+# Regras de stop-loss/take-profit avaliadas a cada preço recebido pelo hub
+if global_bot_config["RISK_ENGINE_ENABLED"]:
+    market_data_hub.add_listener(risk_engine.on_price)
+
+# Exchange local (paper trading): segue os preços reais do stream ou, sem ele, um passeio aleatório
+if global_bot_config["EXCHANGE_BACKEND"] == "simulated":
+    sim_exchange.latency = global_bot_config["SIM_LATENCY_SECONDS"]
+    sim_exchange.fee_rate = global_bot_config["SIM_FEE_RATE"]
+    sim_exchange.slippage = global_bot_config["SIM_SLIPPAGE"]
+    sim_exchange.initial_balances = {"USDT": global_bot_config["SIM_INITIAL_USDT"]}
+    if global_bot_config["MARKET_DATA_STREAM"]:
+        sim_exchange.quote_source = market_data_hub.get_quote
+        market_data_hub.add_listener(sim_exchange.on_price)
+    else:
+        if global_bot_config["RISK_ENGINE_ENABLED"]:
+            sim_exchange.add_listener(risk_engine.on_price)
+        sim_exchange.start_random_walk()
+
+# As negociações são gravadas em lote no mesmo banco do Flask
+trade_ledger.path = app.config['DATABASE']
+
+# Séries de patrimônio por usuário, gravadas em segundo plano
+equity_store.directory = global_bot_config["EQUITY_SERIES_DIR"]
+equity_store.capacity = global_bot_config["EQUITY_SERIES_CAPACITY"]
+equity_store.persist_interval = global_bot_config["EQUITY_PERSIST_SECONDS"]
+
+# Pools de conexões keep-alive compartilhados; configurados antes de qualquer cliente ser criado
+http_pool.pool_maxsize = global_bot_config["HTTP_POOL_MAXSIZE"]
+http_pool.connect_timeout = global_bot_config["HTTP_CONNECT_TIMEOUT_SECONDS"]
+http_pool.read_timeout = global_bot_config["HTTP_READ_TIMEOUT_SECONDS"]
+http_pool.keepalive_seconds = global_bot_config["HTTP_KEEPALIVE_SECONDS"]
+
+# Orçamento de peso da Binance compartilhado por todos os bots (o limite é por IP)
+weight_governor.limit_per_minute = global_bot_config["BINANCE_WEIGHT_LIMIT_PER_MINUTE"]
+weight_governor.headroom = global_bot_config["BINANCE_WEIGHT_HEADROOM"]
+weight_governor.market_reserve = global_bot_config["BINANCE_MARKET_RESERVE"]
+weight_governor.account_reserve = global_bot_config["BINANCE_ACCOUNT_RESERVE"]
+
+# Filtros de todos os símbolos, carregados uma vez e recarregados em segundo plano
+exchange_info.loader = lambda: governed_call(get_public_client(), PRIORITY_MARKET, "get_exchange_info")
+exchange_info.refresh_interval = global_bot_config["EXCHANGE_INFO_REFRESH_SECONDS"]
+
+# Estado dos dashboards: limitado em memória, os ociosos vão para o disco
+dashboard_store.history_limit = global_bot_config["DASHBOARD_HISTORY_LIMIT"]
+dashboard_store.directory = global_bot_config["DASHBOARD_STATE_DIR"]
+dashboard_store.idle_seconds = global_bot_config["DASHBOARD_IDLE_SECONDS"]
+dashboard_store.max_users = global_bot_config["DASHBOARD_MAX_USERS_IN_MEMORY"]
+
+# Os bots publicam no barramento em processo; o dashboard consome direto da memória,
+# ou via HTTP quando os bots rodam em um processo separado do Flask
+if global_bot_config["DASHBOARD_TRANSPORT"] == "http":
+    dashboard_bus.subscribe(HttpDashboardTransport(global_bot_config["DASHBOARD_URL"]))
+else:
+    dashboard_bus.subscribe(update_dashboard_data)
+
+# Todos os bots rodam como corrotinas em um único event loop
+bot_engine = BotEngine(
+    max_exchange_calls=global_bot_config["MAX_CONCURRENT_EXCHANGE_CALLS"],
+    max_llm_calls=global_bot_config["MAX_CONCURRENT_LLM_CALLS"]
+)
+
+# Métricas do /metrics e o profiler por bot, ligado em tempo de execução pelo /profile
+metrics.per_user = global_bot_config["METRICS_PER_USER"]
+bot_profilers.engine = bot_engine
+metrics.gauge("bots_running", "Bots em execução no processo.",
+              lambda: sum(1 for handle in list(bot_threads.values()) if handle.is_alive()))
+metrics.gauge("threads", "Threads ativas no processo.", threading.active_count)
+metrics.gauge("binance_used_weight_1m", "Peso usado no minuto corrente, informado pela Binance.",
+              lambda: weight_governor.used_weight_1m)
+metrics.gauge("binance_weight_tokens_available", "Peso ainda disponível no orçamento compartilhado dos bots.",
+              lambda: weight_governor.metrics()["tokens_available"])
+metrics.gauge("dashboard_updates_published", "Atualizações publicadas no barramento do dashboard desde o início.",
+              lambda: dashboard_bus.published)
+metrics.gauge("log_records_dropped", "Registros de log descartados com a fila de escrita cheia.",
+              lambda: log_pipeline.metrics()["dropped"])
+metrics.gauge("dashboard_users_in_memory", "Usuários com o estado do dashboard em memória.",
+              lambda: dashboard_store.metrics()["users_in_memory"])
+
+# --- Funções do Bot ---
 # Estas são as funções reais que iniciarão/pararão o bot
-def bot_runner(user_id, api_key, secret_key, openai_key, config, stop_event):
+def bot_runner(user_id, api_key, secret_key, openai_key, config, limits):
     user_config_for_bot = config.copy()
     user_config_for_bot["OPENAI_API_KEY"] = openai_key
     user_config_for_bot["BINANCE_API_KEY"] = api_key
     user_config_for_bot["BINANCE_SECRET_KEY"] = secret_key
 
-    trade_logic.run_bot(user_id, api_key, secret_key, user_config_for_bot, stop_event, dashboard_data_by_user)
+    return trade_logic.run_bot(user_id, api_key, secret_key, user_config_for_bot, limits)
+
+log = get_logger("bots")
 
 def start_bot_for_user(user_id):
-    global bot_threads, bot_stop_events, global_bot_config # These are references from app.py
+    global bot_threads, global_bot_config # These are references from app.py
 
     broker_configs = get_user_broker_configs(user_id)
     if not broker_configs:
-        print(f"Nenhuma configuração de corretora encontrada para o usuário {user_id}. O bot não pode iniciar.")
+        log.warning("Nenhuma configuração de corretora encontrada. O bot não pode iniciar.", extra={"user_id": user_id})
         return False
 
     broker_config = broker_configs[0] # Assumindo a primeira configuração
@@ -102,36 +272,36 @@ def start_bot_for_user(user_id):
     openai_key = broker_config['openai_api_key'] # Obtém a chave da OpenAI do DB
 
     if not api_key or not secret_key or not openai_key:
-        print(f"Chaves de API (Binance ou OpenAI) inválidas ou ausentes no banco de dados para o usuário {user_id}. O bot não pode iniciar.")
+        log.warning("Chaves de API (Binance ou OpenAI) inválidas ou ausentes no banco de dados. O bot não pode iniciar.",
+                    extra={"user_id": user_id})
         return False
 
     if user_id in bot_threads and bot_threads[user_id].is_alive():
-        print(f"Bot para o usuário {user_id} já está rodando.")
+        log.info("Bot já está rodando.", extra={"user_id": user_id})
         return False
 
-    stop_event = threading.Event()
-    bot_stop_events[user_id] = stop_event
-    
-    bot_thread = threading.Thread(target=bot_runner, args=(user_id, api_key, secret_key, openai_key, global_bot_config, stop_event))
-    bot_threads[user_id] = bot_thread
-    bot_thread.start()
-    print(f"Bot para o usuário {user_id} iniciado.")
+    # bot_threads guarda um BotHandle, que expõe is_alive()/join() como uma Thread
+    bot_threads[user_id] = bot_engine.start(
+        user_id,
+        lambda limits: bot_runner(user_id, api_key, secret_key, openai_key, global_bot_config, limits)
+    )
+    log.info("Bot iniciado.", extra={"user_id": user_id})
     return True
 
 def stop_bot_for_user(user_id):
-    global bot_threads, bot_stop_events # These are references from app.py
-    if user_id in bot_stop_events and not bot_stop_events[user_id].is_set():
-        print(f"Parando bot para o usuário {user_id}...")
-        bot_stop_events[user_id].set()
-        if user_id in bot_threads:
-            bot_threads[user_id].join(timeout=5)
-            if bot_threads[user_id].is_alive():
-                print(f"Aviso: Bot para o usuário {user_id} não terminou a tempo.")
-            del bot_threads[user_id]
-        del bot_stop_events[user_id]
-        print(f"Bot para o usuário {user_id} parado.")
+    global bot_threads # These are references from app.py
+    if user_id in bot_threads and bot_threads[user_id].is_alive():
+        log.info("Parando bot...", extra={"user_id": user_id})
+        bot_threads[user_id].stop()
+        bot_threads[user_id].join(timeout=5)
+        if bot_threads[user_id].is_alive():
+            log.warning("Bot não terminou a tempo.", extra={"user_id": user_id})
+        del bot_threads[user_id]
+        bot_profilers.discard(user_id)
+        metrics.forget_user(user_id) # Usuários parados não acumulam séries no /metrics
+        log.info("Bot parado.", extra={"user_id": user_id})
         return True
-    print(f"Bot para o usuário {user_id} não está rodando ou já parado.")
+    log.info("Bot não está rodando ou já parado.", extra={"user_id": user_id})
     return False
 
 # Conecta as funções de iniciar/parar bot do main.py com o app.py
@@ -143,26 +313,38 @@ if __name__ == '__main__':
     with app.app_context():
         # Inicializa o banco de dados se não existir
         if not os.path.exists(app.config['DATABASE']):
-            print("Banco de dados não encontrado. Inicializando...")
+            main_log.info("Banco de dados não encontrado. Inicializando...")
             init_db()
-            print("Banco de dados inicializado.")
+            main_log.info("Banco de dados inicializado.")
         else:
-            print("Banco de dados 'database.db' já existe. Pulando inicialização.")
+            main_log.info("Banco de dados '%s' já existe. Pulando inicialização.", app.config['DATABASE'])
             
     # Inicia o Flask app em uma thread separada
     flask_thread = threading.Thread(target=run_flask_app)
     flask_thread.daemon = True
     flask_thread.start()
-    print("Flask app iniciado na thread separada e pronto para autenticação.")
-    print("Acesse: http://127.0.0.1:5000")
+    main_log.info("Flask app iniciado na thread separada e pronto para autenticação.")
+
+    exchange_info.start()
+
+    if global_bot_config["MARKET_DATA_STREAM"]:
+        market_data_hub.start()
+        main_log.info("Hub de dados de mercado (WebSocket) iniciado.")
+    main_log.info("Acesse: http://127.0.0.1:5000")
 
     try:
-        # Mantém a thread principal ativa para que as threads do bot e do Flask continuem
+        # Mantém a thread principal ativa para que o engine dos bots e o Flask continuem
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\nDesligando a aplicação...")
+        main_log.info("Desligando a aplicação...")
         # Parar todos os bots ativos antes de sair
         for user_id in list(bot_threads.keys()):
             stop_bot_for_user(user_id)
-        print("Aplicação encerrada.")
+        market_data_hub.stop()
+        trade_ledger.stop() # Grava as negociações ainda na fila
+        equity_store.stop() # Grava as séries de patrimônio alteradas
+        dashboard_store.stop() # Grava o estado dos dashboards, para as versões continuarem após reiniciar
+        connection_pool.close_all()
+        main_log.info("Aplicação encerrada.")
+        log_pipeline.stop() # Escreve os logs ainda na fila
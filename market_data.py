@@ -0,0 +1,347 @@
+# market_data.py
+import json
+import random
+import threading
+import time
+
+from logging_setup import get_logger
+
+log = get_logger("market")
+
+# Endpoint de streams combinados da Binance. As inscrições são feitas via mensagens SUBSCRIBE,
+# então uma única conexão atende a união dos símbolos de todos os bots.
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream"
+
+# Limites da Binance: no máximo 1024 streams por conexão e 5 mensagens recebidas por segundo
+MAX_STREAMS_PER_CONNECTION = 1024
+MAX_PARAMS_PER_MESSAGE = 200
+MIN_SECONDS_BETWEEN_MESSAGES = 0.25
+
+
+class _WebSocketConnection:
+    """Adaptador sobre o websocket-client que converte timeouts de leitura em TimeoutError."""
+    def __init__(self, url, timeout):
+        import websocket # websocket-client, importado só quando o stream real é usado
+        self._websocket = websocket
+        self._conn = websocket.create_connection(url, timeout=timeout)
+
+    def send(self, message):
+        self._conn.send(message)
+
+    def recv(self):
+        try:
+            return self._conn.recv()
+        except self._websocket.WebSocketTimeoutException:
+            raise TimeoutError()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect_websocket(url, timeout=1.0):
+    """Abre uma conexão WebSocket real com a Binance."""
+    return _WebSocketConnection(url, timeout)
+
+
+class ReplayConnection:
+    """
+    Substituto local do servidor de streams da Binance, para testes offline.
+    Reproduz frames gravados (no formato de streams combinados) apenas para os streams inscritos,
+    responde às mensagens SUBSCRIBE/UNSUBSCRIBE e pode derrubar a conexão após N frames
+    para exercitar a lógica de reconexão.
+    """
+    def __init__(self, frames, interval=0.0, close_after=None):
+        self._frames = list(frames)
+        self._position = 0
+        self._interval = interval
+        self._close_after = close_after
+        self._delivered = 0
+        self._streams = set()
+        self._replies = []
+        self._closed = False
+        self.sent = [] # Mensagens recebidas do cliente, úteis para asserções
+
+    def send(self, message):
+        if self._closed:
+            raise ConnectionError("Conexão de replay fechada.")
+        self.sent.append(message)
+        request = json.loads(message)
+        if request.get("method") == "SUBSCRIBE":
+            self._streams.update(request["params"])
+        elif request.get("method") == "UNSUBSCRIBE":
+            self._streams.difference_update(request["params"])
+        self._replies.append(json.dumps({"result": None, "id": request.get("id")}))
+
+    def recv(self):
+        if self._closed:
+            raise ConnectionError("Conexão de replay fechada.")
+        if self._replies:
+            return self._replies.pop(0)
+        if self._close_after is not None and self._delivered >= self._close_after:
+            self._closed = True
+            raise ConnectionError("Conexão de replay encerrada pelo servidor.")
+        while self._position < len(self._frames):
+            frame = self._frames[self._position]
+            self._position += 1
+            if frame.get("stream") in self._streams:
+                if self._interval:
+                    time.sleep(self._interval)
+                self._delivered += 1
+                return json.dumps(frame)
+        # Sem mais frames: comporta-se como um stream ocioso
+        time.sleep(min(self._interval or 0.05, 0.05))
+        raise TimeoutError()
+
+    def close(self):
+        self._closed = True
+
+
+def load_replay_frames(path):
+    """Carrega frames gravados de um arquivo JSON lines (um frame de stream combinado por linha)."""
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_connector(frames, **kwargs):
+    """Retorna uma função de conexão que abre um novo ReplayConnection a cada (re)conexão."""
+    def connect(url):
+        return ReplayConnection(frames, **kwargs)
+    return connect
+
+
+def parse_stream_price(data):
+    """
+    Extrai (símbolo, preço, bid, ask) de um evento ticker/miniTicker/bookTicker.
+    Para bookTicker o preço é o ponto médio entre o melhor bid e o melhor ask.
+    """
+    symbol = data.get("s")
+    if not symbol:
+        return None
+    if "c" in data: # ticker / miniTicker: último preço negociado
+        bid = float(data["b"]) if "b" in data else None
+        ask = float(data["a"]) if "a" in data else None
+        return symbol, float(data["c"]), bid, ask
+    if "b" in data and "a" in data: # bookTicker
+        bid = float(data["b"])
+        ask = float(data["a"])
+        return symbol, (bid + ask) / 2, bid, ask
+    return None
+
+
+class MarketDataHub:
+    """
+    Hub de dados de mercado alimentado por uma única conexão WebSocket.
+    Mantém a inscrição na união dos `symbols_to_watch` de todos os bots em execução
+    e uma tabela em memória com o último preço, que qualquer thread lê em O(1).
+    """
+    def __init__(self, url=BINANCE_STREAM_URL, connect=connect_websocket, backfill=None,
+                 stream_type="bookTicker", stale_after=10.0, max_backoff=30.0):
+        self.url = url
+        self.connect = connect
+        self.backfill = backfill # Função symbols -> {símbolo: preço} usada após (re)conexões
+        self.stream_type = stream_type
+        self.stale_after = stale_after # Preços mais antigos que isso (s) são ignorados pelos leitores
+        self.max_backoff = max_backoff
+        self._prices = {} # {símbolo: (preço, bid, ask, instante monotônico)}
+        self._owners = {} # {dono (ex: user_id): set(símbolos)}
+        self._refcounts = {} # {símbolo: número de donos interessados}
+        self._subscribed = set() # Streams inscritos na conexão atual
+        self._listeners = () # Funções listener(símbolo, preço) chamadas a cada atualização do stream
+        self._lock = threading.Lock()
+        self._dirty = threading.Event() # Sinaliza que a união de símbolos mudou
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._request_id = 0
+        self._last_message_at = 0.0
+        self.reconnects = 0
+
+    # --- Inscrições ---
+
+    def register(self, owner, symbols):
+        """Registra (ou substitui) os símbolos de interesse de um dono, tipicamente um bot de usuário."""
+        with self._lock:
+            self._release(owner)
+            self._owners[owner] = set(symbols)
+            for symbol in self._owners[owner]:
+                self._refcounts[symbol] = self._refcounts.get(symbol, 0) + 1
+        self._dirty.set()
+
+    def unregister(self, owner):
+        """Remove os símbolos de um dono; streams que ninguém mais usa são cancelados."""
+        with self._lock:
+            self._release(owner)
+        self._dirty.set()
+
+    def _release(self, owner):
+        for symbol in self._owners.pop(owner, ()):
+            self._refcounts[symbol] -= 1
+            if self._refcounts[symbol] <= 0:
+                del self._refcounts[symbol]
+
+    def add_listener(self, listener):
+        """
+        Registra listener(símbolo, preço), chamado na thread do hub a cada preço recebido.
+        Deve ser rápido e não bloquear: trabalho pesado vai para outra thread.
+        """
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners = tuple(l for l in self._listeners if l is not listener)
+
+    def watched_symbols(self):
+        """Retorna a união dos símbolos registrados por todos os donos."""
+        with self._lock:
+            return set(self._refcounts)
+
+    # --- Leitura ---
+
+    def get_price(self, symbol):
+        """Retorna o último preço conhecido do símbolo, ou None se não houver preço recente."""
+        entry = self._prices.get(symbol)
+        if entry is None or time.monotonic() - entry[3] > self.stale_after:
+            return None
+        return entry[0]
+
+    def get_prices(self, symbols):
+        """Retorna {símbolo: preço} para os símbolos com preço recente na tabela."""
+        now = time.monotonic()
+        prices = {}
+        for symbol in symbols:
+            entry = self._prices.get(symbol)
+            if entry is not None and now - entry[3] <= self.stale_after:
+                prices[symbol] = entry[0]
+        return prices
+
+    def get_quote(self, symbol):
+        """Retorna (bid, ask) do símbolo quando o stream os fornece."""
+        entry = self._prices.get(symbol)
+        return (entry[1], entry[2]) if entry else (None, None)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="market-data-hub", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._dirty.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self.connect(self.url)
+                self._subscribed = set()
+                self._sync_subscriptions(conn)
+                # Preenche a tabela via REST para cobrir o intervalo em que estivemos desconectados
+                self._backfill(self._symbols_of(self._subscribed))
+                backoff = 1.0
+                self._read_loop(conn)
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                self.reconnects += 1
+                delay = min(backoff, self.max_backoff) * random.uniform(0.5, 1.0)
+                log.warning("Stream de preços: conexão perdida (%s). Reconectando em %.1fs...", e, delay)
+                self._stop_event.wait(delay)
+                backoff *= 2
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _read_loop(self, conn):
+        while not self._stop_event.is_set():
+            if self._dirty.is_set():
+                added = self._sync_subscriptions(conn)
+                if added:
+                    self._backfill(added)
+            try:
+                message = conn.recv()
+            except TimeoutError:
+                continue
+            self._handle_message(message)
+
+    def _handle_message(self, message):
+        payload = json.loads(message)
+        data = payload.get("data")
+        if data is None: # Respostas de SUBSCRIBE/UNSUBSCRIBE
+            return
+        parsed = parse_stream_price(data)
+        if parsed is None:
+            return
+        symbol, price, bid, ask = parsed
+        self._last_message_at = time.monotonic()
+        self._prices[symbol] = (price, bid, ask, self._last_message_at)
+        for listener in self._listeners:
+            try:
+                listener(symbol, price)
+            except Exception as e:
+                log.exception("Erro em listener de preço para %s: %s", symbol, e)
+
+    # --- Inscrições na conexão ---
+
+    def _stream_name(self, symbol):
+        return f"{symbol.lower()}@{self.stream_type}"
+
+    def _symbols_of(self, streams):
+        return [stream.split("@", 1)[0].upper() for stream in streams]
+
+    def _sync_subscriptions(self, conn):
+        """Envia SUBSCRIBE/UNSUBSCRIBE para alinhar a conexão à união atual de símbolos."""
+        self._dirty.clear()
+        wanted = {self._stream_name(symbol) for symbol in self.watched_symbols()}
+        if len(wanted) > MAX_STREAMS_PER_CONNECTION:
+            log.warning("%d streams pedidos; apenas %d serão inscritos.", len(wanted), MAX_STREAMS_PER_CONNECTION)
+            wanted = set(sorted(wanted)[:MAX_STREAMS_PER_CONNECTION])
+        to_add = sorted(wanted - self._subscribed)
+        to_remove = sorted(self._subscribed - wanted)
+        self._send_in_batches(conn, "UNSUBSCRIBE", to_remove)
+        self._send_in_batches(conn, "SUBSCRIBE", to_add)
+        self._subscribed = wanted
+        return self._symbols_of(to_add)
+
+    def _send_in_batches(self, conn, method, streams):
+        for start in range(0, len(streams), MAX_PARAMS_PER_MESSAGE):
+            self._request_id += 1
+            conn.send(json.dumps({
+                "method": method,
+                "params": streams[start:start + MAX_PARAMS_PER_MESSAGE],
+                "id": self._request_id
+            }))
+            if start + MAX_PARAMS_PER_MESSAGE < len(streams):
+                time.sleep(MIN_SECONDS_BETWEEN_MESSAGES)
+
+    def _backfill(self, symbols):
+        if not self.backfill or not symbols:
+            return
+        try:
+            prices = self.backfill(symbols)
+        except Exception as e:
+            log.warning("Falha no backfill de preços via REST: %s", e)
+            return
+        now = time.monotonic()
+        for symbol, price in prices.items():
+            # Não sobrescreve um preço do stream que chegou depois do pedido de backfill
+            entry = self._prices.get(symbol)
+            if entry is None or now - entry[3] > self.stale_after:
+                self._prices[symbol] = (price, None, None, now)
+
+
+# Instância única do processo, compartilhada por todos os bots
+market_data_hub = MarketDataHub()
@@ -0,0 +1,326 @@
+# metrics.py
+import bisect
+import collections
+import sys
+import threading
+import time
+
+from logging_setup import get_logger
+
+log = get_logger("metrics")
+
+# Limites superiores (segundos) das faixas dos histogramas de duração: de chamadas em memória (ms) ao LLM (dezenas de s)
+SPAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Família de histogramas com rótulos (ex: estágio e usuário). Cada combinação de rótulos é só uma
+    lista de contagens por faixa mais soma e total: observe() é um bisect e três somas sob um lock.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=SPAN_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._children = {} # {valores dos rótulos: [contagens por faixa..., soma, total]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            child[index] += 1
+            child[-2] += value
+            child[-1] += 1
+
+    def time(self, *labels):
+        """Span: `with histogram.time("llm", user):` observa a duração do bloco em segundos."""
+        return Span(self, labels)
+
+    def remove(self, *labels):
+        with self._lock:
+            self._children.pop(labels, None)
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(child) for labels, child in self._children.items()}
+
+    def render(self, lines):
+        for labels, child in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child[:-2]):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_number(child[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {child[-1]}")
+
+
+class Counter:
+    """Família de contadores com rótulos (ex: requisições por upstream, método e resultado)."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = collections.defaultdict(int) # {valores dos rótulos: total}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def remove(self, *labels):
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, lines):
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}")
+
+
+class Gauge:
+    """Valor lido na hora da coleta: `read()` retorna um número ou {valores dos rótulos: número}."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.read = read
+
+    def render(self, lines):
+        try:
+            values = self.read()
+        except Exception as e:
+            log.error("Erro ao ler a métrica %s: %s", self.name, e)
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}")
+
+
+class Span:
+    """Mede a duração de um bloco `with` e a observa no histograma (também quando o bloco lança exceção)."""
+    __slots__ = ("histogram", "labels", "started_at")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at, *self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Métricas do processo, expostas em texto do Prometheus por render().
+    Com `per_user` desligado, o rótulo de usuário vira "all": o custo e o tamanho do /metrics
+    deixam de crescer com o número de usuários.
+    """
+    def __init__(self, per_user=True):
+        self.per_user = per_user
+        self._metrics = {} # {nome: Histogram | Counter | Gauge}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help_text, label_names=(), buckets=SPAN_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, read, label_names=()):
+        """Registra (ou substitui) um gauge calculado na coleta por read()."""
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, read, label_names)
+            return self._metrics[name]
+
+    def user_label(self, user_id):
+        return str(user_id) if self.per_user else "all"
+
+    def forget_user(self, user_id):
+        """Remove as séries de um usuário (ex: bot parado), para não acumular usuários inativos."""
+        label = self.user_label(user_id)
+        if label == "all":
+            return
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if isinstance(metric, Gauge) or "user" not in metric.label_names:
+                continue
+            position = metric.label_names.index("user")
+            for labels in list(metric.snapshot()):
+                if labels[position] == label:
+                    metric.remove(*labels)
+
+    def render(self):
+        """Todas as métricas no formato de texto do Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem: a cada `interval` segundos lê a pilha da thread `thread_id` e, se
+    `should_sample()` for verdadeiro (ex: a corrotina de um bot específico está executando),
+    conta a pilha. Não instrumenta nada: sem o profiler ligado, o custo é zero.
+    O resultado são pilhas "dobradas" (módulo:função;...), o formato de entrada dos flame graphs.
+    """
+    def __init__(self, thread_id, should_sample=None, interval=0.005, duration=30.0, max_depth=64):
+        self.thread_id = thread_id
+        self.should_sample = should_sample
+        self.interval = interval
+        self.duration = duration
+        self.max_depth = max_depth
+        self.stacks = collections.Counter() # {"mod:func;mod:func": amostras}
+        self.samples = 0 # Amostras contadas
+        self.ticks = 0 # Leituras feitas (contadas ou não)
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.thread_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        deadline = time.monotonic() + self.duration
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            self.ticks += 1
+            if frame is None or (self.should_sample is not None and not self.should_sample()):
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, limit=20):
+        """Resumo: amostras, funções com mais tempo próprio e inclusivo, e as pilhas mais frequentes."""
+        stacks = self.stacks.copy()
+        own, inclusive = collections.Counter(), collections.Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "interval": self.interval,
+            "samples": self.samples,
+            "ticks": self.ticks,
+            "self": own.most_common(limit),
+            "inclusive": inclusive.most_common(limit),
+            "stacks": stacks.most_common(limit)
+        }
+
+    def folded(self):
+        """Texto "pilha contagem" por linha (flamegraph.pl, speedscope)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class BotProfilers:
+    """Profilers ligados em tempo de execução, no máximo um por bot (ex: pelo /profile do dashboard)."""
+    def __init__(self):
+        self.engine = None # BotEngine dos bots; configurado pelo main.py
+        self._profilers = {} # {user_id: SamplingProfiler}
+        self._lock = threading.Lock()
+
+    def start(self, user_id, duration=30.0, interval=0.005):
+        """Liga (ou reinicia) o profiler do bot do usuário; None se o bot não estiver rodando."""
+        if self.engine is None:
+            return None
+        profiler = self.engine.profile(user_id, duration, interval)
+        if profiler is None:
+            return None
+        with self._lock:
+            previous = self._profilers.get(user_id)
+            self._profilers[user_id] = profiler
+        if previous is not None:
+            previous.stop()
+        return profiler
+
+    def get(self, user_id):
+        with self._lock:
+            return self._profilers.get(user_id)
+
+    def discard(self, user_id):
+        with self._lock:
+            profiler = self._profilers.pop(user_id, None)
+        if profiler is not None:
+            profiler.stop()
+
+
+# Instâncias únicas do processo e as métricas dos bots
+metrics = MetricsRegistry()
+bot_profilers = BotProfilers()
+
+# Duração de cada estágio do ciclo: account, prices, portfolio, prompt, llm, parse, order_submit, dashboard_publish
+bot_stage_seconds = metrics.histogram(
+    "bot_stage_seconds", "Duração de cada estágio do ciclo de negociação, por usuário.", ("stage", "user"))
+bot_cycles_total = metrics.counter("bot_cycles_total", "Ciclos de negociação concluídos, por usuário.", ("user",))
+bot_orders_total = metrics.counter(
+    "bot_orders_total", "Ordens enviadas pelos bots, por usuário, lado e resultado.", ("user", "side", "outcome"))
+# Chamadas a serviços externos: binance (por método do python-binance) e openai (por modelo)
+upstream_request_seconds = metrics.histogram(
+    "upstream_request_seconds", "Duração das chamadas aos serviços externos.", ("upstream", "method"))
+upstream_requests_total = metrics.counter(
+    "upstream_requests_total", "Chamadas aos serviços externos, por resultado.", ("upstream", "method", "outcome"))
@@ -0,0 +1,69 @@
+# price_cache.py
+import threading
+import time
+
+from rate_limiter import governed_call, PRIORITY_MARKET
+from logging_setup import get_logger
+
+log = get_logger("market")
+
+class PriceSnapshot:
+    """
+    Snapshot de preços de todos os tickers da Binance, compartilhado por todas as threads de bot.
+    Uma única chamada em lote (ticker/price sem símbolo) abastece o cache durante `ttl` segundos,
+    então o custo por ciclo não cresce com o número de usuários nem de símbolos observados.
+    """
+    def __init__(self, ttl=2.0, max_stale=30.0):
+        self.ttl = ttl # Tempo (s) em que o snapshot é considerado atual
+        self.max_stale = max_stale # Idade máxima (s) aceitável se a atualização falhar
+        self._prices = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def age(self):
+        """Retorna a idade do snapshot atual em segundos."""
+        return time.monotonic() - self._fetched_at
+
+    def get_prices(self, client, symbols):
+        """
+        Retorna {símbolo: preço} para os símbolos pedidos, atualizando o snapshot se necessário.
+        Símbolos que não existem na Binance são simplesmente omitidos.
+        """
+        self._ensure_fresh(client)
+        prices = self._prices # Referência local: o dicionário é trocado por inteiro, nunca alterado
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    def get_price(self, client, symbol):
+        """Retorna o preço de um único símbolo a partir do snapshot, ou None."""
+        return self.get_prices(client, [symbol]).get(symbol)
+
+    def _usable(self):
+        """O snapshot atual, mesmo vencido, ainda pode ser servido (idade < max_stale)."""
+        return bool(self._prices) and self.age() < self.max_stale
+
+    def _ensure_fresh(self, client):
+        if self.age() < self.ttl:
+            return
+        # Só uma thread atualiza por vez. As demais devolvem o snapshot vencido enquanto ele for
+        # aceitável, em vez de esperar a chamada REST; só esperam se não houver nada para servir.
+        if not self._lock.acquire(blocking=not self._usable()):
+            return
+        try:
+            # Outra thread pode ter atualizado o snapshot enquanto esperávamos o lock
+            if self.age() < self.ttl:
+                return
+            try:
+                tickers = governed_call(client, PRIORITY_MARKET, "get_all_tickers")
+            except Exception:
+                # Mantém o snapshot antigo se ele ainda for aceitável, senão propaga o erro
+                if self._usable():
+                    log.warning("Falha ao atualizar snapshot de preços. Usando dados de %.1fs atrás.", self.age())
+                    return
+                raise
+            self._prices = {ticker['symbol']: float(ticker['price']) for ticker in tickers}
+            self._fetched_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+# Instância única do processo, compartilhada por todos os bots
+price_snapshot = PriceSnapshot()
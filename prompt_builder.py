@@ -0,0 +1,148 @@
+# prompt_builder.py
+import math
+import threading
+from decimal import Decimal
+
+from exchange_info import format_decimal
+from logging_setup import get_logger
+
+try:
+    import tiktoken # Opcional: contagem exata de tokens; sem ele, usa uma estimativa conservadora
+except ImportError:
+    tiktoken = None
+
+log = get_logger("llm")
+
+# Instruções fixas, sempre no início e idênticas byte a byte em todos os ciclos e usuários,
+# para que o provedor possa reaproveitar o prefixo em cache. Nada que muda por ciclo entra aqui.
+PROMPT_PREFIX = (
+    "Você é um agente de negociação de criptomoedas. "
+    "Seu objetivo é maximizar os lucros em um mercado de criptomoedas volátil. "
+    "Analise o mercado atual com base nas informações do portfólio, que vêm no final desta mensagem. "
+    "Você deve retornar APENAS uma ação de negociação no formato JSON, como uma lista de objetos. "
+    "Se nenhuma ação for necessária, retorne uma lista vazia `[]`. "
+    "As ações disponíveis são 'BUY' ou 'SELL'. "
+    "Para 'BUY', inclua 'symbol' (ex: 'BTCUSDT') e 'usdt_amount' (valor em USDT para gastar), "
+    "sem ultrapassar o saldo de USDT disponível nem o máximo por compra informados. "
+    "Para 'SELL', inclua 'symbol' (ex: 'BTCUSDT') e 'quantity' (quantidade da criptomoeda para vender). "
+    "Não tente comprar ou vender USDT diretamente. "
+    "Exemplos de formato de saída:\n"
+    "Para comprar: `[{\"action\": \"BUY\", \"symbol\": \"BTCUSDT\", \"usdt_amount\": 10}]`\n"
+    "Para vender: `[{\"action\": \"SELL\", \"symbol\": \"ETHUSDT\", \"quantity\": 0.05}]`\n"
+    "Para manter: `[]`\n"
+    "O portfólio é uma tabela 'ativo|quantidade|preco_usdt'; se houver ativos omitidos, são os de menor valor.\n"
+)
+
+
+def compact_number(value):
+    """Formata até 8 casas decimais, sem zeros à direita nem notação científica (ex: 0.00001234, 65012.12)."""
+    return format_decimal(Decimal(f"{value:.8f}"))
+
+
+class TokenCounter:
+    """
+    Conta tokens localmente com o tokenizer do modelo (tiktoken) ou, sem ele, por uma estimativa.
+    O tokenizer só é carregado no primeiro count(): na primeira vez o tiktoken baixa o arquivo BPE,
+    e isso não pode acontecer (nem falhar) na importação. Se o download falhar, fica a estimativa.
+    """
+    CHARS_PER_TOKEN = 3 # Estimativa conservadora para português e números
+
+    def __init__(self, model="gpt-4o"):
+        self.model = model
+        self.exact = False
+        self._encoding = None
+        self._resolved = tiktoken is None
+        self._lock = threading.Lock()
+
+    def _load_encoding(self):
+        with self._lock:
+            if self._resolved:
+                return
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                log.warning("Tokenizer do tiktoken indisponível (%s); usando a estimativa de %d caracteres por token.",
+                            e, self.CHARS_PER_TOKEN)
+            else:
+                self._encoding = encoding
+                self.exact = True
+            self._resolved = True
+
+    def count(self, text):
+        if not self._resolved:
+            self._load_encoding()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / self.CHARS_PER_TOKEN)
+
+
+class PromptBuilder:
+    """
+    Monta o prompt do LLM como prefixo fixo (PROMPT_PREFIX, contado uma única vez) seguido
+    da parte dinâmica: saldo, limite por compra e o portfólio em tabela compacta.
+    A parte dinâmica respeita `token_budget`: os ativos entram em ordem de valor em USDT
+    e os menores são omitidos quando o orçamento acaba.
+    """
+    def __init__(self, model="gpt-4o", token_budget=300):
+        self.token_budget = token_budget
+        self.counter = TokenCounter(model)
+        self._prefix_tokens = None
+
+    @property
+    def prefix_tokens(self):
+        """Tokens do prefixo fixo, contados no primeiro uso (não na importação)."""
+        if self._prefix_tokens is None:
+            self._prefix_tokens = self.counter.count(PROMPT_PREFIX)
+        return self._prefix_tokens
+
+    def build(self, usdt_balance, portfolio_data, max_trade_usdt, token_budget=None):
+        """Retorna (prompt, contagens) onde contagens traz os tokens do prefixo, da parte dinâmica e do total."""
+        token_budget = token_budget or self.token_budget
+        header = (
+            "Portfólio atual:\n"
+            f"USDT disponível: {usdt_balance:.2f}\n"
+            f"Máximo por compra: {max_trade_usdt} USDT\n"
+            "ativo|quantidade|preco_usdt\n"
+        )
+        used_tokens = self.counter.count(header)
+
+        holdings = sorted(
+            ((symbol, data) for symbol, data in portfolio_data.items() if symbol != "USDT"),
+            key=lambda item: item[1]['amount'] * item[1]['current_price'],
+            reverse=True
+        )
+        # Espaço reservado para a nota de ativos omitidos, caso nem todos caibam
+        note_tokens = self.counter.count(f"(+{len(holdings)} ativos de menor valor omitidos)\n")
+        rows = []
+        for index, (symbol, data) in enumerate(holdings):
+            row = f"{symbol.replace('USDT', '')}|{compact_number(data['amount'])}|{compact_number(data['current_price'])}\n"
+            row_tokens = self.counter.count(row)
+            reserved = note_tokens if index < len(holdings) - 1 else 0
+            if used_tokens + row_tokens + reserved > token_budget:
+                break
+            rows.append(row)
+            used_tokens += row_tokens
+
+        dynamic = header + "".join(rows)
+        omitted = len(holdings) - len(rows)
+        if omitted:
+            dynamic += f"(+{omitted} ativos de menor valor omitidos)\n"
+
+        prompt = PROMPT_PREFIX + dynamic
+        dynamic_tokens = self.counter.count(dynamic)
+        counts = {
+            "prefix_tokens": self.prefix_tokens,
+            "dynamic_tokens": dynamic_tokens,
+            "total_tokens": self.prefix_tokens + dynamic_tokens,
+            "rows": len(rows),
+            "omitted": omitted,
+            "exact": self.counter.exact
+        }
+        return prompt, counts
+
+
+# Instância única do processo: o prefixo é contado uma vez para todos os bots
+prompt_builder = PromptBuilder()
@@ -0,0 +1,191 @@
+# rate_limiter.py
+import threading
+import time
+
+from metrics import upstream_request_seconds, upstream_requests_total
+from logging_setup import get_logger
+
+log = get_logger("binance")
+
+# Prioridades das chamadas à Binance (menor número = mais importante)
+PRIORITY_ORDER = 0 # Envio e consulta de ordens
+PRIORITY_ACCOUNT = 1 # Saldos, execuções, listen key
+PRIORITY_MARKET = 2 # Preços e exchange info (têm alternativas em cache)
+PRIORITY_NAMES = {PRIORITY_ORDER: "order", PRIORITY_ACCOUNT: "account", PRIORITY_MARKET: "market"}
+
+# Peso (REQUEST_WEIGHT) dos endpoints usados pelo bot, conforme a documentação da Binance Spot
+WEIGHTS = {
+    "get_account": 20,
+    "get_symbol_ticker": 2,
+    "get_all_tickers": 4,
+    "get_exchange_info": 20,
+    "order_market_buy": 1,
+    "order_market_sell": 1,
+    "get_order": 4,
+    "get_my_trades": 20,
+    "stream_get_listen_key": 2,
+    "stream_keepalive": 2,
+    "stream_close": 2,
+}
+
+
+class RequestShed(Exception):
+    """Chamada de baixa prioridade descartada porque o orçamento de peso está sob pressão."""
+
+
+class WeightGovernor:
+    """
+    Orçamento de peso de requisições à Binance, único no processo (o limite é por IP).
+    Um token bucket com `limit_per_minute * headroom` tokens, reabastecido continuamente,
+    mede as chamadas antes de enviá-las; o peso usado informado pela Binance nos cabeçalhos
+    (x-mbx-used-weight-1m) corrige o bucket, cobrindo chamadas que não passaram por aqui.
+    Ordens podem usar o bucket inteiro; leituras de conta só acima de `account_reserve` e
+    leituras de mercado só acima de `market_reserve`. Abaixo disso, leituras de mercado são
+    descartadas (RequestShed) e quem chamou usa dados em cache; as demais esperam até `max_wait`.
+    """
+    def __init__(self, limit_per_minute=6000, headroom=0.8, account_reserve=0.1, market_reserve=0.3, max_wait=10.0):
+        self.limit_per_minute = limit_per_minute
+        self.headroom = headroom
+        self.account_reserve = account_reserve
+        self.market_reserve = market_reserve
+        self.max_wait = max_wait
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0 # Após HTTP 429/418, nada é enviado até este instante
+        self._condition = threading.Condition()
+        self.used_weight_1m = 0 # Último valor informado pela Binance
+        self.order_count_10s = 0
+        self.requests = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.shed = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0 # Respostas 429/418 recebidas
+
+    @property
+    def capacity(self):
+        return self.limit_per_minute * self.headroom
+
+    def _refill(self, now):
+        rate = self.capacity / 60.0
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * rate)
+        self._updated_at = now
+
+    def _floor(self, priority):
+        """Nível mínimo do bucket que precisa sobrar depois de uma chamada desta prioridade."""
+        if priority == PRIORITY_MARKET:
+            return self.capacity * self.market_reserve
+        if priority == PRIORITY_ACCOUNT:
+            return self.capacity * self.account_reserve
+        return 0.0
+
+    def acquire(self, weight, priority=PRIORITY_MARKET):
+        """Reserva `weight` tokens, esperando se preciso; lança RequestShed se não for possível."""
+        deadline = time.monotonic() + self.max_wait
+        waited_from = None
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens - weight >= self._floor(priority):
+                    self._tokens -= weight
+                    self.requests[PRIORITY_NAMES[priority]] += 1
+                    if waited_from is not None:
+                        self.waits += 1
+                        self.wait_seconds += now - waited_from
+                    return
+                if priority == PRIORITY_MARKET or now >= deadline:
+                    self.shed += 1
+                    raise RequestShed(f"Orçamento de peso da Binance sob pressão ({self._tokens:.0f}/{self.capacity:.0f}); chamada {PRIORITY_NAMES[priority]} descartada.")
+                if waited_from is None:
+                    waited_from = now
+                needed = weight + self._floor(priority) - self._tokens
+                delay = max(self._blocked_until - now, needed / (self.capacity / 60.0), 0.01)
+                self._condition.wait(min(delay, deadline - now))
+
+    def observe(self, headers):
+        """Ajusta o bucket ao peso usado informado pela Binance nos cabeçalhos da última resposta."""
+        if not headers:
+            return
+        used = headers.get("x-mbx-used-weight-1m")
+        orders = headers.get("x-mbx-order-count-10s")
+        with self._condition:
+            if orders is not None:
+                self.order_count_10s = int(orders)
+            if used is None:
+                return
+            self.used_weight_1m = int(used)
+            # O servidor conta chamadas de outros processos no mesmo IP: nunca acredite em mais folga que ele
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, self.capacity - self.used_weight_1m)
+
+    def back_off(self, retry_after):
+        """Bloqueia todas as chamadas após um 429/418 da Binance, pelo tempo do Retry-After."""
+        with self._condition:
+            self.throttled += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+        log.warning("Binance pediu para aguardar %gs. Chamadas suspensas.", retry_after)
+
+    def metrics(self):
+        """Uso atual do orçamento, para o dashboard e logs."""
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                "limit_per_minute": self.limit_per_minute,
+                "capacity": round(self.capacity),
+                "tokens_available": round(self._tokens, 1),
+                "budget_used_pct": round(100 * (1 - self._tokens / self.capacity), 1) if self.capacity else 0.0,
+                "used_weight_1m": self.used_weight_1m,
+                "order_count_10s": self.order_count_10s,
+                "requests": dict(self.requests),
+                "shed": self.shed,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "throttled": self.throttled,
+                "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 1)
+            }
+
+
+def _observe_response(response, *args, **kwargs):
+    weight_governor.observe(response.headers)
+
+
+def observe_responses(session):
+    """
+    Registra um hook na requests.Session de um Client: os cabeçalhos de peso de cada resposta vão
+    para o governor no momento em que ela chega. Ler client.response depois da chamada não serve,
+    porque o Client (ex: o público) é compartilhado por várias threads e guarda só a última resposta.
+    """
+    if _observe_response not in session.hooks["response"]:
+        session.hooks["response"].append(_observe_response)
+    return session
+
+
+def governed_call(client, priority, method, **params):
+    """
+    Chama client.<method>(**params) passando pelo governor: reserva o peso antes e respeita o
+    Retry-After de respostas 429/418. Os cabeçalhos de peso chegam pelo hook de observe_responses.
+    """
+    try:
+        weight_governor.acquire(WEIGHTS.get(method, 1), priority)
+    except RequestShed:
+        upstream_requests_total.inc("binance", method, "shed")
+        raise
+    started_at = time.perf_counter()
+    try:
+        result = getattr(client, method)(**params)
+    except Exception as e:
+        upstream_request_seconds.observe(time.perf_counter() - started_at, "binance", method)
+        upstream_requests_total.inc("binance", method, "error")
+        response = getattr(e, "response", None)
+        if getattr(e, "status_code", None) in (418, 429):
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            weight_governor.back_off(float(retry_after or 60))
+        raise
+    upstream_request_seconds.observe(time.perf_counter() - started_at, "binance", method)
+    upstream_requests_total.inc("binance", method, "ok")
+    return result
+
+
+# Instância única do processo: o limite de peso da Binance é por IP
+weight_governor = WeightGovernor()
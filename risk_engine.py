@@ -0,0 +1,300 @@
+# risk_engine.py
+import bisect
+import concurrent.futures
+import itertools
+import threading
+import time
+from datetime import datetime
+
+from dashboard_bus import dashboard_bus
+from exchange_info import exchange_info, format_decimal
+from execution_engine import aggregate_fills, client_order_id, resolve_unknown_order
+from trade_ledger import trade_ledger
+from logging_setup import get_logger
+
+log = get_logger("risk")
+
+
+class ProtectedPosition:
+    """Uma posição comprada pelo bot e suas regras de saída (OCO: a primeira que disparar cancela as outras)."""
+    __slots__ = ("position_id", "owner", "symbol", "quantity", "entry_price", "exchange",
+                 "stop_loss", "take_profit", "trailing_pct", "fired")
+
+    def __init__(self, position_id, owner, symbol, quantity, entry_price, exchange,
+                 stop_loss=None, take_profit=None, trailing_pct=None):
+        self.position_id = position_id
+        self.owner = owner
+        self.symbol = symbol
+        self.quantity = quantity
+        self.entry_price = entry_price
+        self.exchange = exchange # BinanceAPI (ou SimulatedBinanceAPI) do usuário, usada na venda de saída
+        self.stop_loss = stop_loss # Preço absoluto
+        self.take_profit = take_profit # Preço absoluto
+        self.trailing_pct = trailing_pct # Fração abaixo do maior preço desde a compra
+        self.fired = False
+
+
+class SortedLevels:
+    """Níveis de disparo de um símbolo em lista ordenada, com os ids das posições em paralelo."""
+    __slots__ = ("levels", "ids")
+
+    def __init__(self):
+        self.levels = []
+        self.ids = []
+
+    def add(self, level, position_id):
+        index = bisect.bisect_right(self.levels, level)
+        self.levels.insert(index, level)
+        self.ids.insert(index, position_id)
+
+    def remove(self, level, position_id):
+        index = bisect.bisect_left(self.levels, level)
+        while index < len(self.levels) and self.levels[index] == level:
+            if self.ids[index] == position_id:
+                del self.levels[index]
+                del self.ids[index]
+                return
+            index += 1
+
+    def at_or_above(self, price):
+        """Ids com nível >= price (stop-loss atingido quando o preço cai até o nível)."""
+        return self.ids[bisect.bisect_left(self.levels, price):]
+
+    def at_or_below(self, price):
+        """Ids com nível <= price (take-profit atingido quando o preço sobe até o nível)."""
+        return self.ids[:bisect.bisect_right(self.levels, price)]
+
+
+class TrailingGroup(set):
+    """Ids das posições que compartilham o mesmo pico."""
+    __slots__ = ("peak",)
+
+    def __init__(self, peak):
+        super().__init__()
+        self.peak = peak
+
+
+class TrailingCohort:
+    """
+    Trailing stops de um símbolo com o mesmo percentual. Cada grupo guarda um pico e as posições
+    que compartilham esse pico: quando o preço supera picos anteriores, esses grupos são fundidos
+    em um só no novo pico (o máximo desde a compra passa a ser o mesmo para todos). Assim o custo
+    por tick é uma busca binária mais as fusões, amortizadas pelas inserções. As fusões despejam os
+    grupos menores no maior, então cada id muda de grupo O(log n) vezes no total.
+    """
+    __slots__ = ("pct", "peaks", "groups", "_group_of")
+
+    def __init__(self, pct):
+        self.pct = pct
+        self.peaks = [] # Picos em ordem crescente (sem repetição)
+        self.groups = [] # TrailingGroup, paralelos a peaks
+        self._group_of = {} # {position_id: TrailingGroup}, para remover sem percorrer os grupos
+
+    def add(self, peak, position_id):
+        index = bisect.bisect_left(self.peaks, peak)
+        if index < len(self.peaks) and self.peaks[index] == peak:
+            group = self.groups[index]
+        else:
+            group = TrailingGroup(peak)
+            self.peaks.insert(index, peak)
+            self.groups.insert(index, group)
+        group.add(position_id)
+        self._group_of[position_id] = group
+
+    def remove(self, position_id):
+        group = self._group_of.pop(position_id, None)
+        if group is None:
+            return
+        group.discard(position_id)
+        if not group:
+            index = bisect.bisect_left(self.peaks, group.peak)
+            del self.peaks[index]
+            del self.groups[index]
+
+    def on_price(self, price):
+        """Atualiza os picos com o novo preço e retorna os ids cujo trailing stop foi atingido."""
+        # Picos até o preço atual passam a ser ele: os grupos afetados são o início da lista
+        raised = bisect.bisect_right(self.peaks, price)
+        if raised:
+            merged = max(self.groups[:raised], key=len)
+            for group in self.groups[:raised]:
+                if group is not merged:
+                    merged |= group
+                    for position_id in group:
+                        self._group_of[position_id] = merged
+            merged.peak = price
+            del self.peaks[:raised]
+            del self.groups[:raised]
+            self.peaks.insert(0, price)
+            self.groups.insert(0, merged)
+        # Dispara quando price <= pico * (1 - pct), ou seja, pico >= price / (1 - pct)
+        first = bisect.bisect_left(self.peaks, price / (1 - self.pct))
+        fired = []
+        for group in self.groups[first:]:
+            fired.extend(group)
+        return fired
+
+
+class RiskEngine:
+    """
+    Avalia stop-loss, take-profit e trailing stop das posições de todos os usuários a cada preço
+    recebido do stream (market_data_hub.add_listener), sem esperar o próximo ciclo nem o LLM.
+    Os níveis de cada símbolo ficam em listas ordenadas, então um tick custa O(log n) no total
+    de posições do símbolo; remover uma posição (disparo, venda, cancelamento) é uma busca binária
+    por regra mais o deslocamento da lista (memmove), sem percorrer as outras posições. Quando uma regra dispara, a posição sai do índice (cancelando as
+    regras irmãs) e a venda a mercado é enviada por um pool de threads, fora da thread do stream.
+    """
+    def __init__(self, max_workers=8):
+        self._positions = {} # {position_id: ProtectedPosition}
+        self._stops = {} # {símbolo: SortedLevels}
+        self._takes = {} # {símbolo: SortedLevels}
+        self._trailing = {} # {símbolo: {pct: TrailingCohort}}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="risk-exit")
+        self.fired = 0
+
+    def protect(self, owner, symbol, quantity, entry_price, exchange,
+                stop_loss_pct=None, take_profit_pct=None, trailing_pct=None):
+        """
+        Cria as regras de saída de uma compra. Percentuais são frações do preço de entrada
+        (ex: 0.05 = 5%); None ou 0 desativa a regra. Retorna o id da posição, ou None sem regras.
+        """
+        if not (stop_loss_pct or take_profit_pct or trailing_pct) or quantity <= 0 or entry_price <= 0:
+            return None
+        with self._lock:
+            position = ProtectedPosition(
+                next(self._ids), owner, symbol, quantity, entry_price, exchange,
+                stop_loss=entry_price * (1 - stop_loss_pct) if stop_loss_pct else None,
+                take_profit=entry_price * (1 + take_profit_pct) if take_profit_pct else None,
+                trailing_pct=trailing_pct or None
+            )
+            self._positions[position.position_id] = position
+            if position.stop_loss is not None:
+                self._stops.setdefault(symbol, SortedLevels()).add(position.stop_loss, position.position_id)
+            if position.take_profit is not None:
+                self._takes.setdefault(symbol, SortedLevels()).add(position.take_profit, position.position_id)
+            if position.trailing_pct is not None:
+                cohorts = self._trailing.setdefault(symbol, {})
+                cohorts.setdefault(position.trailing_pct, TrailingCohort(position.trailing_pct)).add(entry_price, position.position_id)
+        return position.position_id
+
+    def _unindex(self, position):
+        """Remove todas as regras da posição dos índices. Chamar com o lock."""
+        self._positions.pop(position.position_id, None)
+        if position.stop_loss is not None:
+            self._stops[position.symbol].remove(position.stop_loss, position.position_id)
+        if position.take_profit is not None:
+            self._takes[position.symbol].remove(position.take_profit, position.position_id)
+        if position.trailing_pct is not None:
+            self._trailing[position.symbol][position.trailing_pct].remove(position.position_id)
+
+    def cancel(self, position_id):
+        with self._lock:
+            position = self._positions.get(position_id)
+            if position is not None:
+                self._unindex(position)
+
+    def remove_owner(self, owner):
+        """Remove as posições de um usuário (ex: quando o bot dele é parado)."""
+        with self._lock:
+            for position in [p for p in self._positions.values() if p.owner == owner]:
+                self._unindex(position)
+
+    def reduce(self, owner, symbol, quantity):
+        """
+        Desconta uma venda feita fora do motor (ex: pelo LLM) das posições protegidas do usuário
+        no símbolo, das mais antigas para as mais novas, para não vender depois o que já foi vendido.
+        """
+        with self._lock:
+            for position in sorted((p for p in self._positions.values() if p.owner == owner and p.symbol == symbol),
+                                   key=lambda p: p.position_id):
+                if quantity <= 0:
+                    break
+                taken = min(quantity, position.quantity)
+                position.quantity -= taken
+                quantity -= taken
+                if position.quantity <= 1e-12:
+                    self._unindex(position)
+
+    def positions(self, owner=None):
+        """Retorna {id: (símbolo, quantidade, entrada, stop, alvo, trailing)} para o dashboard/logs."""
+        with self._lock:
+            return {
+                p.position_id: (p.symbol, p.quantity, p.entry_price, p.stop_loss, p.take_profit, p.trailing_pct)
+                for p in self._positions.values() if owner is None or p.owner == owner
+            }
+
+    def on_price(self, symbol, price):
+        """Listener do market_data_hub: avalia as regras do símbolo para o novo preço."""
+        stops = self._stops.get(symbol)
+        takes = self._takes.get(symbol)
+        cohorts = self._trailing.get(symbol)
+        if stops is None and takes is None and cohorts is None:
+            return
+        with self._lock:
+            fired = {}
+            if stops is not None:
+                for position_id in stops.at_or_above(price):
+                    fired.setdefault(position_id, "stop_loss")
+            if takes is not None:
+                for position_id in takes.at_or_below(price):
+                    fired.setdefault(position_id, "take_profit")
+            if cohorts is not None:
+                for cohort in cohorts.values():
+                    for position_id in cohort.on_price(price):
+                        fired.setdefault(position_id, "trailing_stop")
+            triggered = []
+            for position_id, reason in fired.items():
+                position = self._positions.get(position_id)
+                if position is None or position.fired:
+                    continue
+                position.fired = True
+                self._unindex(position)
+                triggered.append((position, reason))
+        for position, reason in triggered:
+            self.fired += 1
+            self._executor.submit(self._exit, position, reason, price)
+
+    def _exit(self, position, reason, price):
+        """Envia a venda a mercado da posição (na thread do pool) e registra o resultado no dashboard."""
+        log.warning("%s de %s a %s (entrada %s). Vendendo %s.", reason, position.symbol, price,
+                    position.entry_price, position.quantity, extra={"user_id": position.owner})
+        quantity = exchange_info.quantize_quantity(position.symbol, position.quantity)
+        if quantity is None:
+            quantity = str(round(position.quantity, 5))
+        else:
+            valid, detail = exchange_info.validate_order(position.symbol, quantity, price)
+            if not valid:
+                log.error("Venda de %s não atende aos filtros da Binance: %s", position.symbol, detail,
+                          extra={"user_id": position.owner})
+                return
+            quantity = format_decimal(quantity)
+        # Id próprio da venda: se ela ficar em situação desconhecida (timeout), é consultada, nunca reenviada
+        order_id = client_order_id(position.owner, int(time.time()), position.position_id,
+                                   {"reason": reason, "symbol": position.symbol, "quantity": quantity})
+        order, status = position.exchange.submit_market_order("SELL", position.symbol, quantity, order_id)
+        if status == "unknown":
+            order = resolve_unknown_order(position.exchange, position.symbol, order_id)
+        if not order:
+            log.error("Falha na venda de proteção de %s.", position.symbol, extra={"user_id": position.owner})
+            return
+        fills = aggregate_fills(order)
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "type": "SELL",
+            "symbol": position.symbol,
+            "quantity": order.get('executedQty'),
+            "price": fills["avg_price"] if fills["avg_price"] is not None else 'N/A',
+            "reason": reason
+        }
+        trade_ledger.record(position.owner, entry["timestamp"], "SELL", position.symbol, entry["quantity"], entry["price"],
+                            fills["commission"], order.get('orderId'), order.get('clientOrderId'), source=reason)
+        dashboard_bus.publish(position.owner, {
+            "history": [entry],
+            "status": f"Regra de {reason} executada para {position.symbol}."
+        })
+
+
+# Instância única do processo, compartilhada por todos os bots
+risk_engine = RiskEngine()
@@ -1,5 +1,6 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS broker_configs;
+DROP TABLE IF EXISTS trades;
 
 CREATE TABLE users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,4 +20,23 @@ CREATE TABLE broker_configs (
 );
 
 -- Adicione um índice para garantir unicidade por user_id e broker_name
-CREATE UNIQUE INDEX idx_user_broker ON broker_configs (user_id, broker_name);
\ No newline at end of file
+CREATE UNIQUE INDEX idx_user_broker ON broker_configs (user_id, broker_name);
+
+-- Histórico persistente de negociações (gravado em lotes por trade_ledger.py)
+CREATE TABLE trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    price REAL,
+    commission TEXT,
+    order_id INTEGER,
+    client_order_id TEXT,
+    source TEXT NOT NULL DEFAULT 'llm',
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- Consultas do histórico por usuário, em ordem de tempo (paginação por cursor)
+CREATE INDEX idx_trades_user_time ON trades (user_id, timestamp, id);
\ No newline at end of file
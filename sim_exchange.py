@@ -0,0 +1,320 @@
+# sim_exchange.py
+import itertools
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from exchange_info import exchange_info, format_decimal, to_decimal
+from logging_setup import get_logger
+
+log = get_logger("sim")
+
+# Preços iniciais aproximados para rodar sem rede (passeio aleatório); com o stream ativo, valem os preços reais
+DEFAULT_PRICES = {
+    "BTCUSDT": 60000.0, "ETHUSDT": 3000.0, "SOLUSDT": 150.0, "BNBUSDT": 550.0, "DOGEUSDT": 0.12,
+    "LINKUSDT": 14.0, "ADAUSDT": 0.45, "FETUSDT": 1.3, "AVAXUSDT": 30.0, "OMUSDT": 0.8,
+    "RNDRUSDT": 7.0, "RENDERUSDT": 7.0, "TRUMPUSDT": 10.0
+}
+
+
+def decimal_text(value):
+    """Número como string decimal exata, sem notação científica (como a Binance responde)."""
+    return format_decimal(to_decimal(value))
+
+
+class SimulatedOrderError(Exception):
+    """Ordem recusada pela exchange simulada (mesmos códigos da Binance)."""
+    def __init__(self, code, message):
+        super().__init__(f"APIError(code={code}): {message}")
+        self.code = code
+        self.message = message
+
+
+class SimAccount:
+    """Saldos e ordens de uma conta simulada. Cada conta tem seu lock: contas diferentes nunca disputam."""
+    __slots__ = ("balances", "orders", "fills", "lock")
+
+    def __init__(self, balances):
+        self.balances = {asset: float(amount) for asset, amount in balances.items()} # {ativo: livre}
+        self.orders = OrderedDict() # {client order id: ordem}, as mais recentes no fim
+        self.fills = {} # {order id: [execuções]}
+        self.lock = threading.Lock()
+
+
+class SimulatedExchange:
+    """
+    Exchange local para paper trading e testes de carga, com milhares de contas em um processo.
+    Os preços vêm de `on_price` (ligado ao market_data_hub, para seguir o mercado real) ou de um
+    passeio aleatório próprio (`start_random_walk`, sem rede). Ordens a mercado são executadas no
+    preço atual (no ask/bid quando `quote_source` os fornece), com slippage, taxa e uma latência
+    configurável que simula a ida e volta à Binance.
+    """
+    def __init__(self, latency=0.05, latency_jitter=0.02, fee_rate=0.001, slippage=0.0005,
+                 initial_balances=None, max_orders_per_account=1000, seed=None):
+        self.latency = latency # Segundos por chamada de ordem
+        self.latency_jitter = latency_jitter
+        self.fee_rate = fee_rate # Taxa por execução (0.001 = 0,1%, a taxa padrão da Binance Spot)
+        self.slippage = slippage # Fração do preço contra quem negocia
+        self.initial_balances = dict(initial_balances or {"USDT": 1000.0})
+        self.max_orders_per_account = max_orders_per_account
+        self.quote_source = None # Função símbolo -> (bid, ask) ou None, ex: market_data_hub.get_quote
+        self._prices = {} # {símbolo: preço}
+        self._accounts = {} # {api_key: SimAccount}
+        self._accounts_lock = threading.Lock()
+        self._listeners = ()
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._walk_stop = threading.Event()
+        self._walk_thread = None
+        self.orders_filled = 0
+        self.orders_rejected = 0
+        self._counters_lock = threading.Lock() # As ordens chegam de muitas threads ao mesmo tempo
+
+    # --- Preços ---
+
+    def on_price(self, symbol, price):
+        """Listener do market_data_hub: acompanha os preços reais do stream."""
+        self._prices[symbol] = price
+        for listener in self._listeners:
+            listener(symbol, price)
+
+    def set_prices(self, prices):
+        for symbol, price in prices.items():
+            self.on_price(symbol, float(price))
+
+    def get_price(self, symbol):
+        return self._prices.get(symbol)
+
+    def get_prices(self, symbols):
+        return {symbol: self._prices[symbol] for symbol in symbols if symbol in self._prices}
+
+    def add_listener(self, listener):
+        """Registra listener(símbolo, preço) para os preços do passeio aleatório (ex: risk_engine.on_price)."""
+        self._listeners = self._listeners + (listener,)
+
+    def start_random_walk(self, prices=None, interval=1.0, volatility=0.001):
+        """Move os preços a cada `interval` segundos por um passeio aleatório geométrico (desvio `volatility`)."""
+        self.set_prices({symbol: price for symbol, price in (prices or DEFAULT_PRICES).items() if symbol not in self._prices})
+        if self._walk_thread is not None and self._walk_thread.is_alive():
+            return
+        self._walk_stop.clear()
+
+        def walk():
+            while not self._walk_stop.wait(interval):
+                for symbol, price in list(self._prices.items()):
+                    self.on_price(symbol, price * math.exp(self._random.gauss(0.0, volatility)))
+
+        self._walk_thread = threading.Thread(target=walk, name="sim-exchange-prices", daemon=True)
+        self._walk_thread.start()
+
+    def stop(self):
+        self._walk_stop.set()
+
+    # --- Contas ---
+
+    def account(self, api_key):
+        """Conta da chave de API, criada com `initial_balances` no primeiro acesso."""
+        account = self._accounts.get(api_key)
+        if account is None:
+            with self._accounts_lock:
+                account = self._accounts.get(api_key)
+                if account is None:
+                    account = SimAccount(self.initial_balances)
+                    self._accounts[api_key] = account
+        return account
+
+    def balances(self, api_key):
+        """{ativo: (livre, bloqueado)} com os saldos não nulos, como get_balances."""
+        account = self.account(api_key)
+        with account.lock:
+            return {asset: (amount, 0.0) for asset, amount in account.balances.items() if amount > 0}
+
+    # --- Ordens ---
+
+    def _wait_latency(self):
+        delay = self.latency + self._random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _fill_price(self, symbol, side):
+        quote = self.quote_source(symbol) if self.quote_source is not None else None
+        if quote and quote[0] and quote[1]:
+            price = quote[1] if side == "BUY" else quote[0]
+        else:
+            price = self._prices.get(symbol)
+        if price is None:
+            return None
+        return price * (1 + self.slippage) if side == "BUY" else price * (1 - self.slippage)
+
+    def market_order(self, api_key, side, symbol, quantity, client_order_id=None):
+        """
+        Executa uma ordem a mercado e retorna a resposta no formato FULL da Binance (com fills).
+        Lança SimulatedOrderError nas mesmas situações em que a Binance recusaria a ordem.
+        """
+        self._wait_latency()
+        base_asset = symbol[:-4] if symbol.endswith("USDT") else None
+        price = self._fill_price(symbol, side)
+        if base_asset is None or price is None:
+            raise self._rejected(-1121, "Invalid symbol.")
+        quantity = float(quantity)
+        # Com os filtros carregados, recusa o que a Binance recusaria; sem eles, só quantidades não positivas
+        if exchange_info.get(symbol) is not None:
+            valid, reason = exchange_info.validate_order(symbol, quantity, price)
+        else:
+            valid, reason = quantity > 0, "Quantidade deve ser positiva."
+        if not valid:
+            raise self._rejected(-1013, f"Filter failure: {reason}")
+        account = self.account(api_key)
+        notional = quantity * price
+        with account.lock:
+            if client_order_id and client_order_id in account.orders:
+                raise self._rejected(-2010, "Duplicate order sent.")
+            balances = account.balances
+            if side == "BUY":
+                if balances.get("USDT", 0.0) < notional:
+                    raise self._rejected(-2010, "Account has insufficient balance for requested action.")
+                # Como na Binance sem BNB: a taxa da compra sai do ativo comprado, a da venda sai do USDT
+                commission, commission_asset = quantity * self.fee_rate, base_asset
+                balances["USDT"] -= notional
+                balances[base_asset] = balances.get(base_asset, 0.0) + quantity - commission
+            else:
+                if balances.get(base_asset, 0.0) < quantity:
+                    raise self._rejected(-2010, "Account has insufficient balance for requested action.")
+                commission, commission_asset = notional * self.fee_rate, "USDT"
+                balances[base_asset] -= quantity
+                balances["USDT"] = balances.get("USDT", 0.0) + notional - commission
+            # Saldos com 8 casas decimais, como na Binance (sem resíduos de ponto flutuante)
+            balances["USDT"] = round(balances["USDT"], 8)
+            balances[base_asset] = round(balances[base_asset], 8)
+            order_id = next(self._order_ids)
+            fill = {
+                "price": decimal_text(price),
+                "qty": decimal_text(quantity),
+                "commission": decimal_text(commission),
+                "commissionAsset": commission_asset,
+                "tradeId": next(self._trade_ids)
+            }
+            order = {
+                "symbol": symbol,
+                "orderId": order_id,
+                "clientOrderId": client_order_id or f"sim-{order_id}",
+                "transactTime": int(time.time() * 1000),
+                "price": "0",
+                "origQty": decimal_text(quantity),
+                "executedQty": decimal_text(quantity),
+                "cummulativeQuoteQty": decimal_text(notional),
+                "status": "FILLED",
+                "type": "MARKET",
+                "side": side,
+                "fills": [fill]
+            }
+            account.orders[order["clientOrderId"]] = order
+            account.fills[order_id] = [dict(fill, orderId=order_id, symbol=symbol)]
+            if len(account.orders) > self.max_orders_per_account:
+                _, oldest = account.orders.popitem(last=False)
+                account.fills.pop(oldest["orderId"], None)
+        with self._counters_lock:
+            self.orders_filled += 1
+        return order
+
+    def _rejected(self, code, message):
+        """Conta a recusa e retorna o erro a lançar."""
+        with self._counters_lock:
+            self.orders_rejected += 1
+        return SimulatedOrderError(code, message)
+
+    def get_order(self, api_key, symbol, client_order_id):
+        """Ordem pelo client order id, ou None se a conta não a conhece."""
+        self._wait_latency()
+        account = self.account(api_key)
+        with account.lock:
+            order = account.orders.get(client_order_id)
+            return dict(order) if order is not None and order["symbol"] == symbol else None
+
+    def get_order_fills(self, api_key, symbol, order_id):
+        account = self.account(api_key)
+        with account.lock:
+            return [dict(fill) for fill in account.fills.get(order_id, []) if fill["symbol"] == symbol]
+
+    def metrics(self):
+        return {
+            "accounts": len(self._accounts),
+            "symbols": len(self._prices),
+            "orders_filled": self.orders_filled,
+            "orders_rejected": self.orders_rejected
+        }
+
+
+class SimulatedBinanceAPI:
+    """
+    Substituto do BinanceAPI (mesmos métodos e retornos) que negocia na exchange simulada.
+    Selecionado com EXCHANGE_BACKEND = "simulated"; a chave de API identifica a conta simulada.
+    """
+    def __init__(self, api_key, api_secret, exchange=None):
+        self.api_key = api_key
+        self.exchange = exchange or sim_exchange
+        self.account_state = None # Os saldos já estão em memória: não há user-data stream
+
+    def start_account_stream(self, reconcile_interval=300):
+        pass
+
+    def stop_account_stream(self):
+        pass
+
+    def get_account_info(self):
+        """Retorna a conta no formato de get_account da Binance."""
+        return {
+            "canTrade": True,
+            "balances": [
+                {"asset": asset, "free": decimal_text(free), "locked": decimal_text(locked)}
+                for asset, (free, locked) in self.exchange.balances(self.api_key).items()
+            ]
+        }
+
+    def get_balances(self):
+        return self.exchange.balances(self.api_key)
+
+    def get_current_price(self, symbol):
+        price = self.exchange.get_price(symbol)
+        if price is None:
+            log.error("Erro inesperado ao obter preço para %s: símbolo sem preço na exchange simulada.", symbol)
+        return price
+
+    def get_prices(self, symbols):
+        return self.exchange.get_prices(symbols)
+
+    def submit_market_order(self, side, symbol, quantity, client_order_id=None):
+        try:
+            order = self.exchange.market_order(self.api_key, side, symbol, quantity, client_order_id)
+            log.debug("Ordem %s a mercado de %s %s executada (simulada).", side, quantity, symbol, extra={"order_id": order['orderId']})
+            return order, "filled"
+        except SimulatedOrderError as e:
+            log.warning("Erro da exchange simulada ao executar %s de %s: %s", side, symbol, e.message, extra={"code": e.code})
+            return None, "rejected"
+
+    def buy_market(self, symbol, quantity, client_order_id=None):
+        """Executa uma ordem de compra a mercado."""
+        order, _ = self.submit_market_order("BUY", symbol, quantity, client_order_id)
+        return order
+
+    def sell_market(self, symbol, quantity, client_order_id=None):
+        """Executa uma ordem de venda a mercado."""
+        order, _ = self.submit_market_order("SELL", symbol, quantity, client_order_id)
+        return order
+
+    def get_order(self, symbol, client_order_id):
+        order = self.exchange.get_order(self.api_key, symbol, client_order_id)
+        return (order, "found") if order is not None else (None, "missing")
+
+    def get_order_fills(self, symbol, order_id):
+        return self.exchange.get_order_fills(self.api_key, symbol, order_id)
+
+    def get_price(self, symbol):
+        return self.get_current_price(symbol)
+
+
+# Instância única do processo, compartilhada por todas as contas simuladas
+sim_exchange = SimulatedExchange()
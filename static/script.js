@@ -1,99 +1,201 @@
 const portfolioChartContext = document.getElementById('portfolioChart').getContext('2d');
 let portfolioChart;
+const equityChartContext = document.getElementById('equityChart').getContext('2d');
+let equityChart;
+let equityRequest = null; // Evita buscas simultâneas da série de patrimônio
 
-const updateDashboard = async () => {
-    try {
-        const response = await fetch('/data');
-        if (response.status === 401) { // Unauthorized, means not logged in
-            window.location.href = '/login'; // Redirect to login page
-            return;
-        }
-        const data = await response.json();
-
-        // Update Status
-        document.getElementById('status-message').textContent = data.status;
+// Estado local do dashboard, atualizado por deltas versionados vindos do servidor
+let dashboardVersion = 0;
+const dashboardState = { portfolio: {}, history: [] };
+const HISTORY_LIMIT = 20;
 
-        // Update USDT Balance
-        document.getElementById('usdt-balance').textContent = parseFloat(data.usdt).toFixed(2);
+// Emojis for crypto assets - extend as needed
+const cryptoEmojis = {
+    'BTCUSDT': '₿', 'ETHUSDT': 'Ξ', 'SOLUSDT': ' Solana', 'BNBUSDT': ' BNB',
+    'DOGEUSDT': '🐕', 'LINKUSDT': '🔗', 'ADAUSDT': ' Cardano', 'FETUSDT': '🤖',
+    'AVAXUSDT': '❄️', 'OMUSDT': '☸️', 'RNDRUSDT': '💡', 'TRUMPUSDT': '🏛️'
+};
 
-        // Update Next Cycle Time
-        const nextCycleTimeElement = document.getElementById('next-cycle-time');
-        if (data.next_cycle_time && data.next_cycle_time > 0) {
-            const date = new Date(data.next_cycle_time * 1000); // Convert to milliseconds
-            nextCycleTimeElement.textContent = date.toLocaleString(); // Format to local time string
-        } else {
-            nextCycleTimeElement.textContent = 'Aguardando...';
-        }
+const setNextCycleTime = (nextCycleTime) => {
+    const nextCycleTimeElement = document.getElementById('next-cycle-time');
+    if (nextCycleTime && nextCycleTime > 0) {
+        const date = new Date(nextCycleTime * 1000); // Convert to milliseconds
+        nextCycleTimeElement.textContent = date.toLocaleString(); // Format to local time string
+    } else {
+        nextCycleTimeElement.textContent = 'Aguardando...';
+    }
+};
 
-        // Update Portfolio
-        const portfolioList = document.getElementById('portfolio-list');
-        portfolioList.innerHTML = ''; // Clear previous items
-        let totalPortfolioValue = 0;
-
-        // Emojis for crypto assets - extend as needed
-        const cryptoEmojis = {
-            'BTCUSDT': '₿', 'ETHUSDT': 'Ξ', 'SOLUSDT': ' Solana', 'BNBUSDT': ' BNB',
-            'DOGEUSDT': '🐕', 'LINKUSDT': '🔗', 'ADAUSDT': ' Cardano', 'FETUSDT': '🤖',
-            'AVAXUSDT': '❄️', 'OMUSDT': '☸️', 'RNDRUSDT': '💡', 'TRUMPUSDT': '🏛️'
-        };
-
-        for (const symbol_pair in data.portfolio) {
-            const item = data.portfolio[symbol_pair];
-            const asset = symbol_pair.replace('USDT', '');
-            const currentPrice = item.current_price;
-            const amount = item.amount;
-            const emoji = cryptoEmojis[symbol_pair] || '💎'; // Default emoji
-
-            let valueUsdt = amount * currentPrice;
-            if (symbol_pair === "USDT") {
-                valueUsdt = amount; // USDT value is its amount
-                totalPortfolioValue += valueUsdt; // Add USDT cash to total portfolio
-                // Don't create a separate card for USDT cash, it's shown in usdt-balance
-                continue; 
-            }
-            totalPortfolioValue += valueUsdt;
-
-            const portfolioItem = `
-                <div class="bg-gray-700 rounded-lg p-4 shadow-md flex items-center justify-between">
-                    <div>
-                        <h3 class="text-xl font-semibold">${asset} ${emoji}</h3>
-                        <p class="text-gray-400">Preço: $${currentPrice ? parseFloat(currentPrice).toFixed(4) : 'N/A'}</p>
-                        <p class="text-gray-400">Quantidade: ${parseFloat(amount).toFixed(4)}</p>
-                    </div>
-                    <div class="text-right">
-                        <p class="text-green-300 text-lg font-bold">Valor: $${valueUsdt.toFixed(2)}</p>
-                    </div>
+// Cria (uma única vez) o card de um ativo; depois apenas os textos são atualizados
+const getPortfolioCard = (symbol_pair) => {
+    const cardId = `portfolio-${symbol_pair}`;
+    let card = document.getElementById(cardId);
+    if (!card) {
+        const asset = symbol_pair.replace('USDT', '');
+        const emoji = cryptoEmojis[symbol_pair] || '💎'; // Default emoji
+        const portfolioItem = `
+            <div id="${cardId}" class="bg-gray-700 rounded-lg p-4 shadow-md flex items-center justify-between">
+                <div>
+                    <h3 class="text-xl font-semibold">${asset} ${emoji}</h3>
+                    <p class="text-gray-400">Preço: $<span data-field="price"></span></p>
+                    <p class="text-gray-400">Quantidade: <span data-field="amount"></span></p>
                 </div>
-            `;
-            portfolioList.insertAdjacentHTML('beforeend', portfolioItem);
-        }
+                <div class="text-right">
+                    <p class="text-green-300 text-lg font-bold">Valor: $<span data-field="value"></span></p>
+                </div>
+            </div>
+        `;
+        document.getElementById('portfolio-list').insertAdjacentHTML('beforeend', portfolioItem);
+        card = document.getElementById(cardId);
+    }
+    return card;
+};
 
-        // Update Total Performance Chart
-        updatePortfolioChart(totalPortfolioValue);
-
-
-        // Update History
-        const historyList = document.getElementById('history-list');
-        historyList.innerHTML = ''; // Clear previous items
-        if (data.history && data.history.length > 0) {
-            data.history.forEach(trade => {
-                const tradeTypeClass = trade.type === 'BUY' ? 'text-green-400' : 'text-red-400';
-                const tradeEntry = `
-                    <div class="bg-gray-700 rounded-lg p-3 shadow-md">
-                        <p class="text-sm text-gray-400">${new Date(trade.timestamp).toLocaleString()}</p>
-                        <p class="${tradeTypeClass} font-semibold">${trade.type}: ${parseFloat(trade.quantity).toFixed(4)} ${trade.symbol.replace('USDT', '')} @ $${parseFloat(trade.price).toFixed(4)}</p>
-                    </div>
-                `;
-                historyList.insertAdjacentHTML('afterbegin', tradeEntry); // Add to top
-            });
-        } else {
-            historyList.innerHTML = '<p class="text-gray-500 text-center">Nenhum histórico de operações ainda.</p>';
+const renderPortfolioItem = (symbol_pair, item) => {
+    // Don't create a separate card for USDT cash, it's shown in usdt-balance
+    if (symbol_pair === "USDT") {
+        return;
+    }
+    const card = getPortfolioCard(symbol_pair);
+    const currentPrice = item.current_price;
+    card.querySelector('[data-field="price"]').textContent = currentPrice ? parseFloat(currentPrice).toFixed(4) : 'N/A';
+    card.querySelector('[data-field="amount"]').textContent = parseFloat(item.amount).toFixed(4);
+    card.querySelector('[data-field="value"]').textContent = (item.amount * currentPrice).toFixed(2);
+};
+
+const getTotalPortfolioValue = () => {
+    let totalPortfolioValue = 0;
+    for (const symbol_pair in dashboardState.portfolio) {
+        const item = dashboardState.portfolio[symbol_pair];
+        // USDT value is its amount
+        totalPortfolioValue += symbol_pair === "USDT" ? item.amount : item.amount * item.current_price;
+    }
+    return totalPortfolioValue;
+};
+
+const renderHistoryEntries = (entries) => {
+    const historyList = document.getElementById('history-list');
+    const placeholder = document.getElementById('history-empty');
+    if (placeholder && entries.length > 0) {
+        placeholder.remove();
+    }
+    entries.forEach(trade => {
+        const tradeTypeClass = trade.type === 'BUY' ? 'text-green-400' : 'text-red-400';
+        const tradeEntry = `
+            <div class="bg-gray-700 rounded-lg p-3 shadow-md">
+                <p class="text-sm text-gray-400">${new Date(trade.timestamp).toLocaleString()}</p>
+                <p class="${tradeTypeClass} font-semibold">${trade.type}: ${parseFloat(trade.quantity).toFixed(4)} ${trade.symbol.replace('USDT', '')} @ $${parseFloat(trade.price).toFixed(4)}</p>
+            </div>
+        `;
+        historyList.insertAdjacentHTML('afterbegin', tradeEntry); // Add to top
+    });
+    // Mantém no DOM apenas as entradas mais recentes, como o servidor
+    while (historyList.children.length > HISTORY_LIMIT) {
+        historyList.lastElementChild.remove();
+    }
+    if (historyList.children.length === 0) {
+        historyList.innerHTML = '<p id="history-empty" class="text-gray-500 text-center">Nenhum histórico de operações ainda.</p>';
+    }
+};
+
+// Aplica um delta do servidor no estado local e altera apenas os elementos afetados
+const applyDashboardDelta = (delta) => {
+    if (delta.full) {
+        dashboardState.portfolio = {};
+        dashboardState.history = [];
+        document.getElementById('portfolio-list').innerHTML = '';
+        document.getElementById('history-list').innerHTML = '';
+    }
+
+    // Update Status
+    if ('status' in delta) {
+        document.getElementById('status-message').textContent = delta.status;
+    }
+
+    // Update USDT Balance
+    if ('usdt' in delta) {
+        document.getElementById('usdt-balance').textContent = parseFloat(delta.usdt).toFixed(2);
+    }
+
+    // Update Next Cycle Time
+    if ('next_cycle_time' in delta) {
+        setNextCycleTime(delta.next_cycle_time);
+    }
+
+    // Update Portfolio
+    let portfolioChanged = false;
+    if (delta.portfolio) {
+        for (const symbol_pair in delta.portfolio) {
+            dashboardState.portfolio[symbol_pair] = delta.portfolio[symbol_pair];
+            renderPortfolioItem(symbol_pair, delta.portfolio[symbol_pair]);
         }
+        portfolioChanged = true;
+    }
+    if (delta.portfolio_removed) {
+        delta.portfolio_removed.forEach(symbol_pair => {
+            delete dashboardState.portfolio[symbol_pair];
+            const card = document.getElementById(`portfolio-${symbol_pair}`);
+            if (card) {
+                card.remove();
+            }
+        });
+        portfolioChanged = true;
+    }
+
+    // Update Total Performance Chart
+    if (portfolioChanged || delta.full) {
+        updatePortfolioChart(getTotalPortfolioValue());
+        updateEquityChart(); // O ciclo que atualizou o portfólio registrou um novo ponto de patrimônio
+    }
+
+    // Update History
+    if (delta.history) {
+        dashboardState.history = dashboardState.history.concat(delta.history).slice(-HISTORY_LIMIT);
+        renderHistoryEntries(delta.history);
+    } else if (delta.full) {
+        renderHistoryEntries([]);
+    }
+
+    dashboardVersion = delta.version;
+};
 
+// Polling incremental (long-poll), usado se o navegador não suportar EventSource
+const updateDashboard = async () => {
+    try {
+        const response = await fetch(`/data?since=${dashboardVersion}&wait=25`);
+        if (response.status === 401) { // Unauthorized, means not logged in
+            window.location.href = '/login'; // Redirect to login page
+            return;
+        }
+        applyDashboardDelta(await response.json());
     } catch (error) {
         console.error('Erro ao buscar dados do dashboard:', error);
         // Pode adicionar uma mensagem de erro na UI
+        await new Promise(resolve => setTimeout(resolve, 5000));
+    }
+    updateDashboard();
+};
+
+// Recebe os deltas por Server-Sent Events; o navegador reconecta sozinho enviando o último id
+const connectDashboardStream = () => {
+    if (!window.EventSource) {
+        updateDashboard();
+        return;
     }
+    const source = new EventSource(`/stream?since=${dashboardVersion}`);
+    source.onmessage = (event) => applyDashboardDelta(JSON.parse(event.data));
+    source.onerror = async () => {
+        // O EventSource não expõe o status HTTP; confirma se a sessão expirou
+        try {
+            const response = await fetch(`/data?since=${dashboardVersion}`);
+            if (response.status === 401) {
+                source.close();
+                window.location.href = '/login';
+            }
+        } catch (error) {
+            console.error('Erro ao buscar dados do dashboard:', error);
+        }
+    };
 };
 
 const updatePortfolioChart = (totalValue) => {
@@ -144,6 +246,60 @@ const updatePortfolioChart = (totalValue) => {
     }
 };
 
+// Evolução do patrimônio: o servidor já reduz a série (LTTB) para a largura do gráfico em pixels
+const updateEquityChart = () => {
+    if (equityRequest) {
+        return equityRequest;
+    }
+    const width = Math.max(100, Math.round(equityChartContext.canvas.clientWidth || 800));
+    equityRequest = fetch(`/equity?width=${width}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(series => {
+            if (!series) {
+                return;
+            }
+            const labels = series.points.map(([timestamp]) => new Date(timestamp * 1000).toLocaleString());
+            const values = series.points.map(([, value]) => value);
+            if (equityChart) {
+                equityChart.data.labels = labels;
+                equityChart.data.datasets[0].data = values;
+                equityChart.update('none');
+                return;
+            }
+            equityChart = new Chart(equityChartContext, {
+                type: 'line',
+                data: {
+                    labels: labels,
+                    datasets: [{
+                        label: 'Patrimônio (USDT)',
+                        data: values,
+                        borderColor: '#60A5FA',
+                        backgroundColor: 'rgba(96, 165, 250, 0.15)',
+                        fill: true,
+                        pointRadius: 0,
+                        borderWidth: 2,
+                        tension: 0
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    animation: false,
+                    scales: {
+                        x: { ticks: { color: '#9CA3AF', maxTicksLimit: 8, maxRotation: 0 } },
+                        y: { ticks: { color: '#9CA3AF' } }
+                    },
+                    plugins: {
+                        legend: { labels: { color: '#e2e8f0' } }
+                    }
+                }
+            });
+        })
+        .catch(error => console.error('Erro ao buscar a evolução do patrimônio:', error))
+        .finally(() => { equityRequest = null; });
+    return equityRequest;
+};
+
 
 // --- Animações e Botões ---
 const welcomeSection = document.getElementById('welcome-section');
@@ -192,8 +348,7 @@ const revealSections = () => {
 
 // Initial calls and event listeners
 document.addEventListener('DOMContentLoaded', () => {
-    updateDashboard(); // Initial data load
-    setInterval(updateDashboard, 5000); // Update dashboard every 5 seconds
+    connectDashboardStream(); // Carga inicial e atualizações em tempo real
 
     revealSections(); // Initial reveal check
     window.addEventListener('scroll', revealSections); // Reveal sections on scroll
@@ -0,0 +1,99 @@
+# test_account_state.py
+import time
+
+from account_state import AccountStateCache, LocalUserDataStream, balances_from_account
+
+
+class FakeClient:
+    """Cliente Binance mínimo: devolve um snapshot fixo em get_account."""
+    def __init__(self, balances, update_time):
+        self.account = {"balances": [{"asset": asset, "free": str(free), "locked": str(locked)}
+                                     for asset, (free, locked) in balances.items()],
+                        "updateTime": update_time}
+
+    def get_account(self):
+        return self.account
+
+    def stream_get_listen_key(self):
+        return "local"
+
+    def stream_keepalive(self, listenKey):
+        pass
+
+    def stream_close(self, listenKey):
+        pass
+
+
+def seeded_cache(balances=None, update_time=1000):
+    cache = AccountStateCache(FakeClient(balances or {"USDT": (100.0, 0.0)}, update_time))
+    cache.reconcile()
+    return cache
+
+
+def balance_update(asset, delta, event_time):
+    return {"e": "balanceUpdate", "a": asset, "d": str(delta), "T": event_time, "E": event_time}
+
+
+def account_position(event_time, **balances):
+    return {"e": "outboundAccountPosition", "u": event_time, "E": event_time,
+            "B": [{"a": asset, "f": str(free), "l": str(locked)} for asset, (free, locked) in balances.items()]}
+
+
+def test_balances_from_account_drops_empty_assets():
+    account = FakeClient({"USDT": (5.0, 1.0), "BTC": (0.0, 0.0)}, 1).get_account()
+    assert balances_from_account(account) == {"USDT": (5.0, 1.0)}
+
+
+def test_balance_update_already_in_snapshot_is_not_counted_twice():
+    cache = seeded_cache(update_time=1000)
+    cache.apply_event(balance_update("USDT", 50, 1000))
+    cache.apply_event(balance_update("USDT", 50, 900))
+    assert cache.balances()["USDT"] == (100.0, 0.0)
+
+
+def test_balance_update_after_snapshot_is_applied_once():
+    cache = seeded_cache(update_time=1000)
+    event = balance_update("USDT", 25, 1001)
+    cache.apply_event(event)
+    cache.apply_event(event) # Reentrega do mesmo evento
+    assert cache.balances()["USDT"] == (125.0, 0.0)
+
+
+def test_withdrawal_that_empties_asset_removes_it():
+    cache = seeded_cache(update_time=1000)
+    cache.apply_event(balance_update("USDT", -100, 1001))
+    assert "USDT" not in cache.balances()
+
+
+def test_older_account_position_is_ignored():
+    cache = seeded_cache(update_time=1000)
+    cache.apply_event(account_position(2000, USDT=(80.0, 20.0), BTC=(0.5, 0.0)))
+    cache.apply_event(account_position(1500, USDT=(10.0, 0.0)))
+    assert cache.balances() == {"USDT": (80.0, 20.0), "BTC": (0.5, 0.0)}
+
+
+def test_reconcile_keeps_balances_newer_than_snapshot():
+    cache = seeded_cache(update_time=1000)
+    cache.apply_event(account_position(3000, BTC=(0.5, 0.0)))
+    cache.reconcile() # O snapshot (updateTime 1000) ainda não conhece o BTC
+    assert cache.balances() == {"USDT": (100.0, 0.0), "BTC": (0.5, 0.0)}
+    assert cache.drift_corrections == 0
+
+
+def test_stream_events_reach_the_cache():
+    stream = LocalUserDataStream()
+    cache = AccountStateCache(FakeClient({"USDT": (100.0, 0.0)}, 1000), connect=lambda url: stream)
+    cache.start()
+    try:
+        assert cache._ready.wait(2)
+        stream.push(balance_update("USDT", 10, 1001))
+        stream.push({"e": "executionReport", "s": "BTCUSDT", "E": 1002})
+        for _ in range(100):
+            if cache.recent_executions:
+                break
+            time.sleep(0.01)
+        assert cache.balances()["USDT"] == (110.0, 0.0)
+        assert cache.recent_executions[-1]["s"] == "BTCUSDT"
+    finally:
+        cache.stop()
+    assert not cache.is_ready()
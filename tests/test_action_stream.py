@@ -0,0 +1,89 @@
+# test_action_stream.py
+import json
+
+from action_stream import IncrementalActionParser
+
+BUY = {"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10}
+SELL = {"action": "SELL", "symbol": "ETHUSDT", "quantity": 0.05}
+
+
+def feed_chunks(text, size):
+    """Alimenta o parser em pedaços de `size` caracteres; retorna o parser e as ações de cada pedaço."""
+    parser = IncrementalActionParser()
+    emitted = [parser.feed(text[start:start + size]) for start in range(0, len(text), size)]
+    return parser, emitted
+
+
+def test_complete_list_in_one_chunk():
+    parser = IncrementalActionParser()
+    assert parser.feed(json.dumps([BUY, SELL])) == [BUY, SELL]
+    assert parser.valid and parser.actions == [BUY, SELL]
+
+
+def test_empty_list_is_valid():
+    parser = IncrementalActionParser()
+    assert parser.feed("[]") == []
+    assert parser.valid
+
+
+def test_braces_and_brackets_inside_strings():
+    action = dict(BUY, reason="sinal } forte ] com { e [ no texto")
+    parser, _ = feed_chunks(json.dumps([action, SELL]), 3)
+    assert parser.actions == [action, SELL]
+    assert parser.valid
+
+
+def test_escaped_quotes_inside_strings():
+    action = dict(BUY, reason='ele disse "}]" e \\ saiu')
+    text = json.dumps([action])
+    assert '\\"}]\\"' in text
+    parser, _ = feed_chunks(text, 1)
+    assert parser.actions == [action]
+    assert parser.valid
+
+
+def test_json_fence_is_ignored():
+    text = "```json\n" + json.dumps([BUY], indent=2) + "\n```"
+    parser, _ = feed_chunks(text, 4)
+    assert parser.actions == [BUY]
+    assert parser.valid and parser.finished
+
+
+def test_object_split_across_many_chunks_is_emitted_once_complete():
+    text = json.dumps([BUY, SELL])
+    first_end = text.index("}") + 1
+    parser, emitted = feed_chunks(text, 1)
+    assert [index for index, actions in enumerate(emitted) if actions] == [first_end - 1, text.rindex("}")]
+    assert emitted[first_end - 1] == [BUY]
+    assert parser.valid
+
+
+def test_malformed_element_does_not_block_the_next_one():
+    text = '[{"action": "BUY", "symbol": }, ' + json.dumps(SELL) + ']'
+    parser, _ = feed_chunks(text, 5)
+    assert parser.actions == [SELL]
+    assert parser.finished and not parser.valid
+    assert len(parser.errors) == 1
+
+
+def test_non_object_elements_are_errors():
+    parser = IncrementalActionParser()
+    parser.feed('["BUY", [1, 2], ' + json.dumps(BUY) + ']')
+    assert parser.actions == [BUY]
+    assert not parser.valid and len(parser.errors) == 2
+
+
+def test_truncated_stream_is_not_valid():
+    text = json.dumps([BUY, SELL])
+    parser, _ = feed_chunks(text[:text.index("ETHUSDT")], 7)
+    assert parser.actions == [BUY] # O que já estava completo foi emitido
+    assert not parser.finished and not parser.valid
+    parser, _ = feed_chunks(text[:-1], 7) # Falta só o ']'
+    assert parser.actions == [BUY, SELL] and not parser.valid
+
+
+def test_text_after_the_list_is_ignored():
+    parser = IncrementalActionParser()
+    parser.feed(json.dumps([BUY]) + "\n```\nObs: [" + json.dumps(SELL) + "]")
+    assert parser.actions == [BUY]
+    assert parser.valid
@@ -0,0 +1,84 @@
+# test_dashboard_bus.py
+import threading
+
+from dashboard_bus import DashboardBus, merge_updates
+
+
+class Collector:
+    """Assinante que guarda as entregas e avisa quando chegou o número esperado."""
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = []
+        self.done = threading.Event()
+
+    def __call__(self, user_id, data):
+        self.received.append((user_id, data))
+        if len(self.received) >= self.expected:
+            self.done.set()
+
+
+def update(cycle, *history):
+    return {"cycle": cycle, "usdt_balance": 100 + cycle, "history": list(history)}
+
+
+def test_merge_keeps_newest_fields_and_all_history():
+    merged = merge_updates(update(1, "a"), update(2, "b", "c"))
+    assert merged == {"cycle": 2, "usdt_balance": 102, "history": ["a", "b", "c"]}
+    assert merge_updates({"cycle": 1, "history": ["a"]}, {"cycle": 2}) == {"cycle": 2, "history": ["a"]}
+
+
+def test_full_queue_coalesces_instead_of_dropping():
+    bus = DashboardBus(max_queue_per_user=2)
+    for cycle in range(5): # Sem assinantes a entrega não começa, então a fila enche
+        bus.publish(1, update(cycle, f"h{cycle}"))
+    assert bus._thread is None
+    assert bus.published == 5
+    assert bus.coalesced == 3
+    queue = list(bus._queues[1])
+    assert len(queue) == 2
+    assert queue[0]["cycle"] == 3 and queue[0]["history"] == ["h0", "h1", "h2", "h3"]
+    assert queue[1]["cycle"] == 4 and queue[1]["history"] == ["h4"]
+
+
+def test_published_data_is_not_mutated_by_coalescing():
+    bus = DashboardBus(max_queue_per_user=1)
+    first, second = update(1, "a"), update(2, "b")
+    bus.publish(1, first)
+    bus.publish(1, second)
+    bus.publish(1, update(3, "c"))
+    assert first["history"] == ["a"] and second["history"] == ["b"]
+    assert list(bus._queues[1]) == [update(3, "a", "b", "c")] # Fila de uma posição também combina
+    assert bus.coalesced == 2
+
+
+def test_coalesced_updates_are_delivered_in_order_per_user():
+    bus = DashboardBus(max_queue_per_user=2)
+    for cycle in range(4):
+        bus.publish(1, update(cycle, f"u1-{cycle}"))
+    bus.publish(2, update(0, "u2-0"))
+    collector = Collector(expected=3)
+    bus.subscribe(collector)
+    try:
+        assert collector.done.wait(2)
+    finally:
+        bus.stop()
+    assert [user_id for user_id, _ in collector.received] == [1, 1, 2]
+    history = [entry for user_id, data in collector.received if user_id == 1 for entry in data["history"]]
+    assert history == ["u1-0", "u1-1", "u1-2", "u1-3"]
+
+
+def test_failing_subscriber_does_not_block_the_others():
+    bus = DashboardBus()
+    collector = Collector(expected=1)
+
+    def broken(user_id, data):
+        raise RuntimeError("dashboard fora do ar")
+
+    bus.subscribe(broken)
+    bus.subscribe(collector)
+    try:
+        bus.publish(7, update(1))
+        assert collector.done.wait(2)
+    finally:
+        bus.stop()
+    assert collector.received == [(7, update(1))]
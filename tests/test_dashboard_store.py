@@ -0,0 +1,137 @@
+# test_dashboard_store.py
+import threading
+import time
+
+import pytest
+
+from dashboard_store import DEFAULT_FIELDS, DashboardStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DashboardStore(directory=str(tmp_path / "dashboard"), history_limit=3, sweep_interval=3600)
+    yield store
+    store.stop()
+
+
+def btc(amount, price=100.0):
+    return {"BTCUSDT": {"amount": amount, "current_price": price}}
+
+
+def test_new_user_starts_with_defaults(store):
+    data = store.delta(1)
+    assert data["full"] is True and data["version"] == 0
+    assert {field: data[field] for field in DEFAULT_FIELDS} == DEFAULT_FIELDS
+    assert data["portfolio"] == {} and data["history"] == []
+
+
+def test_delta_returns_only_what_changed(store):
+    store.update(1, {"status": "Rodando", "usdt": 50, "portfolio": btc(1.0)})
+    store.update(1, {"usdt": 40, "history": [{"type": "BUY"}]})
+    store.update(1, {"portfolio": btc(1.0, 110.0)})
+    assert store.delta(1, 1) == {"version": 3, "usdt": 40, "history": [{"type": "BUY"}],
+                                 "portfolio": {"BTCUSDT": {"amount": 1.0, "current_price": 110.0}}}
+    assert store.delta(1, 2) == {"version": 3, "portfolio": {"BTCUSDT": {"amount": 1.0, "current_price": 110.0}}}
+    assert store.delta(1, 3) == {"version": 3}
+
+
+def test_unchanged_update_does_not_bump_version(store):
+    store.update(1, {"usdt": 50, "portfolio": btc(1.0)})
+    store.update(1, {"usdt": 50, "portfolio": btc(1.0)})
+    assert store.get(1).version == 1
+
+
+def test_removed_symbols_are_reported(store):
+    store.update(1, {"portfolio": btc(1.0)})
+    store.update(1, {"portfolio": {"ETHUSDT": {"amount": 1.0, "current_price": 10.0}, **btc(0.0)}})
+    store.update(1, {"portfolio": {"ETHUSDT": {"amount": 1.0, "current_price": 10.0}}})
+    delta = store.delta(1, 2)
+    assert delta["portfolio_removed"] == ["BTCUSDT"]
+    assert "USDT" in store.delta(1)["portfolio"] # USDT está sempre presente
+
+
+@pytest.mark.parametrize("since", [0, -5, 99])
+def test_unknown_versions_get_the_full_state(store, since):
+    store.update(1, {"status": "Rodando", "history": [{"type": "BUY"}]})
+    data = store.delta(1, since)
+    assert data["full"] is True and data["version"] == 1
+    assert data["status"] == "Rodando" and data["history"] == [{"type": "BUY"}]
+
+
+def test_history_is_limited(store):
+    for index in range(5):
+        store.update(1, {"history": [{"index": index}]})
+    assert store.delta(1)["history"] == [{"index": 2}, {"index": 3}, {"index": 4}]
+    assert store.delta(1, 4)["history"] == [{"index": 4}]
+
+
+def test_snapshots_are_not_changed_by_later_updates(store):
+    store.update(1, {"usdt": 50, "portfolio": btc(1.0)})
+    old = store.get(1)
+    store.update(1, {"usdt": 40, "portfolio": btc(2.0)})
+    assert old.view()["usdt"] == 50 and old.view()["portfolio"]["BTCUSDT"]["amount"] == 1.0
+
+
+def test_evicted_user_reloads_from_json_with_same_versions(store, tmp_path):
+    store.update(1, {"status": "Rodando", "portfolio": btc(1.0), "history": [{"type": "BUY"}]})
+    store.update(1, {"usdt": 40})
+    store.idle_seconds = 0
+    store.sweep()
+    assert store.metrics()["users_in_memory"] == 0
+    assert (tmp_path / "dashboard" / "dashboard_1.json").exists()
+    assert store.delta(1, 1) == {"version": 2, "usdt": 40} # Continua das mesmas versões
+    assert store.loaded == 1
+    assert not (tmp_path / "dashboard" / "dashboard_1.json").exists() # A memória volta a ser a fonte
+    assert store.delta(1)["history"] == [{"type": "BUY"}]
+
+
+def test_failed_spill_raises_the_version_floor(tmp_path):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("não é um diretório")
+    store = DashboardStore(directory=str(blocker), sweep_interval=3600)
+    try:
+        for index in range(3):
+            store.update(1, {"usdt": index + 1})
+        store._evict(1, store._users[1]) # A gravação falha: o estado é só descartado
+        assert store._version_floor == 4
+        data = store.delta(1, 3) # Versão do cliente é de um estado que se perdeu
+        assert data["full"] is True and data["version"] == 4 and data["usdt"] == 0
+        store.update(1, {"usdt": 7})
+        assert store.delta(1, 4) == {"version": 5, "usdt": 7}
+    finally:
+        store.directory = None
+        store.stop()
+
+
+def test_max_users_evicts_least_recently_used(store):
+    store.max_users = 10
+    for user_id in range(11):
+        store.update(user_id, {"usdt": user_id})
+    assert store.metrics()["users_in_memory"] == 9
+    assert 0 not in store._users and 1 not in store._users and 10 in store._users
+    assert store.delta(1)["usdt"] == 1 # Volta do disco no próximo acesso
+
+
+def test_long_poll_waiter_is_woken_by_an_update(store):
+    store.update(1, {"usdt": 1})
+    woke = []
+
+    def waiter():
+        started_at = time.monotonic()
+        store.wait_for_change(1, since=1, timeout=5)
+        woke.append(time.monotonic() - started_at)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    store.update(1, {"usdt": 2})
+    thread.join(2)
+    assert woke and woke[0] < 1
+    assert store.delta(1, 1) == {"version": 2, "usdt": 2}
+
+
+def test_long_poll_times_out_without_changes(store):
+    store.update(1, {"usdt": 1})
+    started_at = time.monotonic()
+    store.wait_for_change(1, since=1, timeout=0.1)
+    assert 0.09 <= time.monotonic() - started_at < 1
@@ -0,0 +1,126 @@
+# test_decision_client.py
+import json
+import threading
+import time
+
+from decision_client import DecisionClient, LatencyHistogram
+
+BUY = [{"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10}]
+
+
+def parse(response):
+    try:
+        return json.loads(response), True
+    except (TypeError, ValueError):
+        return [], False
+
+
+class FakeOpenAI:
+    """OpenAIAPI de teste: cada modelo tem uma latência e uma fila de respostas (exceções são levantadas)."""
+    def __init__(self, latency=None, responses=None, chunks=None):
+        self.latency = latency or {}
+        self.responses = {model: list(items) for model, items in (responses or {}).items()}
+        self.chunks = chunks or []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, model="gpt-4o", temperature=0, timeout=None):
+        with self._lock:
+            self.calls.append(model)
+            queue = self.responses.get(model, [])
+            response = queue.pop(0) if len(queue) > 1 else (queue[0] if queue else json.dumps(BUY))
+        latency = self.latency.get(model, 0.0)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Request timed out.")
+        time.sleep(latency)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def stream_completion(self, prompt, model="gpt-4o", temperature=0, timeout=None):
+        self.calls.append(model)
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def client(api, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("default_hedge_delay", 0.05)
+    kwargs.setdefault("min_hedge_delay", 0.0)
+    return DecisionClient(api, parse, **kwargs)
+
+
+def test_histogram_percentile_uses_bucket_upper_bound():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.9) is None
+    for seconds in [0.2] * 9 + [3.5]:
+        histogram.record(seconds)
+    assert histogram.percentile(0.5) == 0.25
+    assert histogram.percentile(1.0) == 4
+    histogram.record(500)
+    assert histogram.percentile(1.0) == float("inf")
+
+
+def test_fast_primary_needs_no_hedge():
+    api = FakeOpenAI()
+    actions, valid, info = client(api).decide("prompt")
+    assert (actions, valid) == (BUY, True)
+    assert info["model"] == "gpt-4o" and not info["hedged"]
+    assert api.calls == ["gpt-4o"]
+
+
+def test_slow_primary_is_hedged():
+    api = FakeOpenAI(latency={"gpt-4o": 1.0})
+    decisions = client(api)
+    actions, valid, info = decisions.decide("prompt", deadline=2)
+    assert valid and info["model"] == "gpt-4o-mini" and info["hedged"]
+    assert info["latency"] < 0.9
+    assert (decisions.hedges_sent, decisions.hedges_won) == (1, 1)
+
+
+def test_invalid_responses_are_retried():
+    api = FakeOpenAI(responses={"gpt-4o": [ConnectionError("reset"), "Manter portfolio atual.", json.dumps(BUY)]})
+    decisions = client(api, hedge_model=None)
+    actions, valid, info = decisions.decide("prompt")
+    assert (actions, valid) == (BUY, True)
+    assert api.calls == ["gpt-4o"] * 3
+    assert decisions.errors == {"gpt-4o": 2}
+
+
+def test_deadline_bounds_the_decision():
+    api = FakeOpenAI(latency={"gpt-4o": 2.0, "gpt-4o-mini": 2.0})
+    started_at = time.monotonic()
+    actions, valid, info = client(api).decide("prompt", deadline=0.3)
+    assert (actions, valid) == ([], False)
+    assert time.monotonic() - started_at < 1.0
+
+
+def test_hedge_delay_follows_primary_latency():
+    decisions = client(FakeOpenAI(), min_samples=10, default_hedge_delay=8.0, min_hedge_delay=1.0)
+    assert decisions.hedge_delay() == 8.0 # Sem amostras suficientes
+    for _ in range(10):
+        decisions._histogram("gpt-4o").record(2.5)
+    assert decisions.hedge_delay() == 3
+
+
+def test_streaming_emits_actions_before_the_list_closes():
+    text = json.dumps(BUY + [{"action": "SELL", "symbol": "ETHUSDT", "quantity": 1}])
+    emitted = []
+    api = FakeOpenAI(chunks=[text[:len(text) // 2 + 10], text[len(text) // 2 + 10:]])
+    actions, valid, info = client(api).decide_streaming("prompt", emitted.append)
+    assert valid and info["streamed"]
+    assert emitted == actions and len(actions) == 2
+    assert info["first_action_latency"] is not None
+
+
+def test_streaming_is_not_retried_after_an_action_was_emitted():
+    text = json.dumps(BUY + BUY)
+    api = FakeOpenAI(chunks=[text[:len(text) - 20], ConnectionError("reset")])
+    emitted = []
+    actions, valid, info = client(api).decide_streaming("prompt", emitted.append)
+    assert not valid
+    assert emitted == BUY
+    assert api.calls == ["gpt-4o"] # Repetir poderia duplicar a ordem já emitida
@@ -0,0 +1,77 @@
+# test_equity_series.py
+import numpy as np
+
+from equity_series import EquitySeries, EquityStore, lttb, minmax_downsample
+
+
+def spiky_series(n=10000, seed=7):
+    """Passeio aleatório com um pico e um vale isolados, que a redução não pode perder."""
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=np.float64)
+    y = 1000 + np.cumsum(rng.normal(0, 1, n))
+    y[n // 3] += 500
+    y[2 * n // 3] -= 500
+    return x, y
+
+
+def test_lttb_keeps_endpoints_and_size():
+    x, y = spiky_series()
+    sx, sy = lttb(x, y, 500)
+    assert len(sx) == len(sy) == 500
+    assert (sx[0], sx[-1]) == (x[0], x[-1])
+    assert (sy[0], sy[-1]) == (y[0], y[-1])
+    assert np.all(np.diff(sx) > 0) # Pontos distintos, em ordem de tempo
+
+
+def test_lttb_keeps_extremes():
+    x, y = spiky_series()
+    _, sy = lttb(x, y, 200)
+    assert sy.max() == y.max()
+    assert sy.min() == y.min()
+
+
+def test_lttb_returns_short_series_unchanged():
+    x, y = spiky_series(100)
+    sx, sy = lttb(x, y, 100)
+    assert sx is x and sy is y
+    assert lttb(x, y, 2)[0] is x
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    x, y = spiky_series()
+    sx, sy = minmax_downsample(x, y, 250)
+    assert len(sx) <= 500
+    assert np.all(np.diff(sx) > 0)
+    assert sy.max() == y.max()
+    assert sy.min() == y.min()
+    for bucket_x, bucket_y in zip(np.array_split(x, 250), np.array_split(y, 250)):
+        inside = (sx >= bucket_x[0]) & (sx <= bucket_x[-1])
+        assert sy[inside].max() == bucket_y.max()
+        assert sy[inside].min() == bucket_y.min()
+
+
+def test_minmax_returns_short_series_unchanged():
+    x, y = spiky_series(100)
+    assert minmax_downsample(x, y, 50)[0] is x
+
+
+def test_series_wraps_around_at_capacity():
+    series = EquitySeries(capacity=5, initial=2)
+    for i in range(8):
+        series.append(float(i), float(i * 10))
+    timestamps, values = series.arrays()
+    assert timestamps.tolist() == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert values.tolist() == [30.0, 40.0, 50.0, 60.0, 70.0]
+    assert series.arrays(start=4.5, end=6.0)[0].tolist() == [5.0, 6.0]
+
+
+def test_store_persists_and_reloads(tmp_path):
+    store = EquityStore(directory=str(tmp_path), capacity=100, persist_interval=3600)
+    for i in range(10):
+        store.record(1, 100 + i, timestamp=float(i))
+    store.stop()
+    reloaded = EquityStore(directory=str(tmp_path), capacity=100)
+    result = reloaded.query(1, width=800)
+    assert result["total_points"] == 10
+    assert result["points"][-1] == [9.0, 109.0]
+    assert reloaded.query(1, width=4, method="minmax")["method"] == "minmax"
@@ -0,0 +1,108 @@
+# test_exchange_info.py
+from decimal import Decimal
+
+from exchange_info import ExchangeInfoCache, format_decimal
+from fake_binance_server import symbol_info
+
+
+def btc_info(min_qty="0.00015", step="0.0001", min_notional="5", status="TRADING"):
+    """exchangeInfo com um único BTCUSDT; minQty fora da grade do stepSize, como em alguns símbolos reais."""
+    return {"symbols": [{
+        "symbol": "BTCUSDT",
+        "status": status,
+        "filters": [
+            {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000", "tickSize": "0.01"},
+            {"filterType": "LOT_SIZE", "minQty": min_qty, "maxQty": "100", "stepSize": step},
+            {"filterType": "MARKET_LOT_SIZE", "minQty": "0", "maxQty": "0", "stepSize": "0"},
+            {"filterType": "NOTIONAL", "minNotional": min_notional, "applyMinToMarket": True,
+             "maxNotional": "0", "applyMaxToMarket": False},
+        ],
+    }]}
+
+
+def loaded_cache(**kwargs):
+    cache = ExchangeInfoCache()
+    cache.load(btc_info(**kwargs))
+    return cache
+
+
+def test_unknown_or_unloaded_symbol():
+    cache = ExchangeInfoCache()
+    assert cache.get("BTCUSDT") is None
+    assert cache.quantize_quantity("BTCUSDT", 1) is None
+    assert cache.validate_order("BTCUSDT", 1, 100)[0] is False
+
+
+def test_quantize_floors_to_min_qty_plus_step_grid():
+    cache = loaded_cache()
+    assert cache.quantize_quantity("BTCUSDT", 0.12349) == Decimal("0.12345")
+    assert cache.quantize_quantity("BTCUSDT", "0.00015") == Decimal("0.00015")
+    assert cache.quantize_quantity("BTCUSDT", 0.00024) == Decimal("0.00015") # Nunca arredonda para cima
+    assert cache.quantize_quantity("BTCUSDT", 0) == Decimal("0")
+
+
+def test_quantized_quantity_always_passes_lot_size():
+    cache = loaded_cache()
+    for raw in ("0.00015", "0.0002", "0.123456789", "1.99999", "37.5"):
+        quantity = cache.quantize_quantity("BTCUSDT", raw)
+        assert quantity <= Decimal(raw)
+        assert cache.validate_order("BTCUSDT", quantity, None) == (True, None)
+
+
+def test_quantize_uses_float_text_not_binary_value():
+    cache = loaded_cache(min_qty="0.001", step="0.001")
+    assert cache.quantize_quantity("BTCUSDT", 0.3) == Decimal("0.3") # Decimal(0.3) seria 0.2999...
+
+
+def test_validate_rejects_each_filter():
+    cache = loaded_cache()
+    ok, reason = cache.validate_order("BTCUSDT", "0.0001", None)
+    assert not ok and "mínimo" in reason
+    ok, reason = cache.validate_order("BTCUSDT", "0.00021", None)
+    assert not ok and "stepSize" in reason
+    ok, reason = cache.validate_order("BTCUSDT", "101.00015", None)
+    assert not ok and "máximo" in reason
+    ok, reason = cache.validate_order("BTCUSDT", "0.00015", 1000)
+    assert not ok and "Valor da ordem" in reason # 0,15 USDT < minNotional de 5
+    assert cache.validate_order("BTCUSDT", "0.01015", 1000) == (True, None)
+
+
+def test_limit_orders_check_tick_size():
+    cache = loaded_cache()
+    ok, reason = cache.validate_order("BTCUSDT", "0.01015", "1000.005", market=False)
+    assert not ok and "tickSize" in reason
+    assert cache.quantize_price("BTCUSDT", "1000.005") == Decimal("1000.01")
+
+
+def test_symbol_not_trading_is_rejected():
+    cache = loaded_cache(status="BREAK")
+    ok, reason = cache.validate_order("BTCUSDT", "0.01015", 1000)
+    assert not ok and "BREAK" in reason
+
+
+def test_fake_server_filters_are_consistent():
+    cache = ExchangeInfoCache()
+    cache.load({"symbols": [symbol_info("ETHUSDT", 2500.0)]})
+    quantity = cache.quantize_quantity("ETHUSDT", 10 / 2500.0)
+    assert format_decimal(quantity) == "0.004"
+    assert cache.validate_order("ETHUSDT", quantity, 2500.0) == (True, None)
+
+
+def test_failed_load_retries_in_background_with_backoff():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("sem rede")
+        return btc_info()
+
+    cache = ExchangeInfoCache(loader=loader, retry_interval=0.01)
+    try:
+        cache.ensure_loaded(timeout=5)
+        assert cache.get("BTCUSDT") is not None
+        assert len(calls) == 3
+        assert cache.failures == 0
+        assert cache.failed_at is not None
+    finally:
+        cache.stop()
@@ -0,0 +1,145 @@
+# test_execution_engine.py
+import asyncio
+import time
+
+from bot_engine import IOLimits
+import execution_engine
+from execution_engine import ExecutionBatch, aggregate_fills, client_order_id
+
+
+class FakeExchange:
+    """BinanceAPI mínima: registra as ordens e responde com a situação pedida para cada símbolo."""
+    def __init__(self, statuses=None, delay=0.0):
+        self.statuses = statuses or {}
+        self.delay = delay
+        self.orders = [] # (lado, símbolo, quantidade, client order id)
+        self.queries = []
+
+    def submit_market_order(self, side, symbol, quantity, order_id=None):
+        time.sleep(self.delay)
+        self.orders.append((side, symbol, quantity, order_id))
+        status = self.statuses.get(symbol, "filled")
+        if status != "filled":
+            return None, status
+        return {"orderId": len(self.orders), "clientOrderId": order_id, "executedQty": quantity,
+                "fills": [{"price": "10", "qty": quantity, "commission": "0", "commissionAsset": "USDT"}]}, "filled"
+
+    def get_order(self, symbol, order_id):
+        self.queries.append((symbol, order_id))
+        return None, "missing"
+
+
+def plan(action, current_prices, usdt_available, user_config):
+    """Plano simplificado: compra `usdt_amount` ou vende `quantity`, se houver saldo reservável."""
+    if action["action"] == "BUY":
+        if action["usdt_amount"] > usdt_available:
+            return None
+        quantity = action["usdt_amount"] / current_prices[action["symbol"]]
+        return {"side": "BUY", "symbol": action["symbol"], "quantity": str(quantity), "usdt_amount": action["usdt_amount"]}
+    holding = user_config["portfolio_data"].get(action["symbol"], {}).get("amount", 0)
+    if action["quantity"] > holding:
+        return None
+    return {"side": "SELL", "symbol": action["symbol"], "quantity": str(action["quantity"])}
+
+
+def run_batch(actions, exchange, usdt=100.0, portfolio=None, max_orders=10):
+    async def scenario():
+        batch = ExecutionBatch(7, exchange, plan, {"BTCUSDT": 10.0, "ETHUSDT": 5.0}, usdt,
+                               {"portfolio_data": portfolio or {}}, IOLimits(), cycle_id=1234, max_orders=max_orders)
+        submitted = [batch.submit(action) for action in actions]
+        return batch, submitted, await batch.results()
+    return asyncio.run(scenario())
+
+
+def test_client_order_id_is_deterministic_and_fits_binance_limit():
+    action = {"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10}
+    first = client_order_id(7, 1234, 0, action)
+    assert first == client_order_id(7, 1234, 0, dict(action))
+    assert first != client_order_id(7, 1234, 1, action)
+    assert first != client_order_id(7, 1235, 0, action)
+    assert first != client_order_id(7, 1234, 0, dict(action, usdt_amount=11))
+    long_id = client_order_id(123456789, 1792356389.123456, 99, action)
+    assert len(long_id) <= 36
+    assert all(c.isalnum() or c in "-." for c in long_id)
+
+
+def test_buy_reservations_stop_overspending_within_the_cycle():
+    exchange = FakeExchange()
+    actions = [{"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 60},
+               {"action": "BUY", "symbol": "ETHUSDT", "usdt_amount": 60}]
+    batch, submitted, results = run_batch(actions, exchange, usdt=100.0)
+    assert submitted == [True, False] # A segunda compra não cabe no que sobrou da primeira
+    assert batch.usdt_available == 40.0
+    assert [order[1] for order in exchange.orders] == ["BTCUSDT"]
+    assert len(results) == 1
+
+
+def test_sell_reservations_use_a_private_copy_of_the_portfolio():
+    portfolio = {"BTCUSDT": {"amount": 1.0}}
+    exchange = FakeExchange()
+    actions = [{"action": "SELL", "symbol": "BTCUSDT", "quantity": 0.75},
+               {"action": "SELL", "symbol": "BTCUSDT", "quantity": 0.75}]
+    batch, submitted, _ = run_batch(actions, exchange, portfolio=portfolio)
+    assert submitted == [True, False]
+    assert batch.user_config["portfolio_data"]["BTCUSDT"]["amount"] == 0.25
+    assert portfolio["BTCUSDT"]["amount"] == 1.0 # O portfólio do ciclo não é alterado
+
+
+def test_orders_carry_distinct_deterministic_ids():
+    exchange = FakeExchange()
+    actions = [{"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10},
+               {"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10}]
+    run_batch(actions, exchange)
+    ids = [order[3] for order in exchange.orders]
+    assert ids == [client_order_id(7, 1234, index, action) for index, action in enumerate(actions)]
+    assert len(set(ids)) == 2 # Ações iguais em posições diferentes não são confundidas
+
+
+def test_failed_order_releases_its_slot_and_reservation():
+    exchange = FakeExchange(statuses={"BTCUSDT": "rejected"})
+
+    async def scenario():
+        batch = ExecutionBatch(7, exchange, plan, {"BTCUSDT": 10.0, "ETHUSDT": 5.0}, 100.0,
+                               {"portfolio_data": {}}, IOLimits(), cycle_id=1, max_orders=1)
+        assert batch.submit({"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10})
+        assert batch.full
+        assert await batch.wait_for_slot() # A ordem recusada devolve a vaga
+        assert batch.usdt_available == 100.0
+        assert batch.submit({"action": "BUY", "symbol": "ETHUSDT", "usdt_amount": 10})
+        assert not await batch.wait_for_slot() # Vaga ocupada por uma ordem executada
+        return await batch.results()
+
+    results = asyncio.run(scenario())
+    assert [(plan["symbol"], bool(order)) for plan, order in results] == [("BTCUSDT", False), ("ETHUSDT", True)]
+
+
+def test_unknown_order_is_queried_not_resent():
+    exchange = FakeExchange(statuses={"BTCUSDT": "unknown"})
+
+    async def scenario():
+        original = execution_engine.resolve_unknown_order
+        execution_engine.resolve_unknown_order = lambda api, symbol, order_id: original(api, symbol, order_id, delay=0)
+        try:
+            batch = ExecutionBatch(7, exchange, plan, {"BTCUSDT": 10.0}, 100.0, {"portfolio_data": {}},
+                                   IOLimits(), cycle_id=1, max_orders=1)
+            batch.submit({"action": "BUY", "symbol": "BTCUSDT", "usdt_amount": 10})
+            return await batch.results()
+        finally:
+            execution_engine.resolve_unknown_order = original
+
+    results = asyncio.run(scenario())
+    assert len(exchange.orders) == 1 # Nunca reenviada
+    assert exchange.queries and all(order_id == exchange.orders[0][3] for _, order_id in exchange.queries)
+    assert results[0][1] is None
+
+
+def test_aggregate_fills_weights_price_by_quantity():
+    order = {"fills": [
+        {"price": "10", "qty": "1", "commission": "0.001", "commissionAsset": "BTC"},
+        {"price": "20", "qty": "3", "commission": "0.003", "commissionAsset": "BTC"},
+    ]}
+    fills = aggregate_fills(order)
+    assert fills["executed_quantity"] == 4
+    assert fills["avg_price"] == 17.5
+    assert round(fills["commission"]["BTC"], 6) == 0.004
+    assert aggregate_fills({"executedQty": "2", "cummulativeQuoteQty": "30"})["avg_price"] == 15
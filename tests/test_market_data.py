@@ -0,0 +1,95 @@
+# test_market_data.py
+import json
+import time
+
+from market_data import MarketDataHub, ReplayConnection, parse_stream_price, replay_connector
+
+
+def book_frame(symbol, bid, ask):
+    return {"stream": f"{symbol.lower()}@bookTicker", "data": {"s": symbol, "b": str(bid), "a": str(ask)}}
+
+
+FRAMES = [
+    book_frame("BTCUSDT", 99, 101),
+    book_frame("DOGEUSDT", 0.1, 0.1),
+    book_frame("ETHUSDT", 9, 11),
+    book_frame("BTCUSDT", 199, 201),
+]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_parse_stream_price_formats():
+    assert parse_stream_price({"s": "BTCUSDT", "b": "99", "a": "101"}) == ("BTCUSDT", 100.0, 99.0, 101.0)
+    assert parse_stream_price({"s": "BTCUSDT", "c": "100.5"}) == ("BTCUSDT", 100.5, None, None)
+    assert parse_stream_price({"result": None}) is None
+
+
+def test_replay_only_delivers_subscribed_streams():
+    conn = ReplayConnection(FRAMES)
+    conn.send(json.dumps({"method": "SUBSCRIBE", "params": ["ethusdt@bookTicker"], "id": 1}))
+    assert json.loads(conn.recv()) == {"result": None, "id": 1}
+    assert json.loads(conn.recv())["data"]["s"] == "ETHUSDT"
+
+
+def test_hub_subscribes_to_union_of_bots_and_serves_prices():
+    connections = []
+
+    def connect(url):
+        connections.append(ReplayConnection(FRAMES))
+        return connections[-1]
+
+    hub = MarketDataHub(connect=connect)
+    hub.register(1, ["BTCUSDT", "ETHUSDT"])
+    hub.register(2, ["BTCUSDT"])
+    seen = []
+    hub.add_listener(lambda symbol, price: seen.append(symbol))
+    hub.start()
+    try:
+        assert wait_for(lambda: hub.get_price("BTCUSDT") == 200.0)
+        assert hub.get_prices(["BTCUSDT", "ETHUSDT", "DOGEUSDT"]) == {"BTCUSDT": 200.0, "ETHUSDT": 10.0}
+        assert hub.get_quote("ETHUSDT") == (9.0, 11.0)
+        subscribed = [json.loads(message) for message in connections[0].sent]
+        assert [(m["method"], m["params"]) for m in subscribed] == [
+            ("SUBSCRIBE", ["btcusdt@bookTicker", "ethusdt@bookTicker"])]
+        hub.unregister(1)
+        assert wait_for(lambda: len(connections[0].sent) == 2)
+        assert json.loads(connections[0].sent[1])["params"] == ["ethusdt@bookTicker"]
+        assert json.loads(connections[0].sent[1])["method"] == "UNSUBSCRIBE"
+    finally:
+        hub.stop()
+    assert "DOGEUSDT" not in seen
+    assert len(connections) == 1
+
+
+def test_hub_reconnects_and_backfills():
+    backfilled = []
+
+    def backfill(symbols):
+        backfilled.append(sorted(symbols))
+        return {symbol: 1.0 for symbol in symbols}
+
+    hub = MarketDataHub(connect=replay_connector(FRAMES[:1], close_after=1), backfill=backfill, max_backoff=0.05)
+    hub.register(1, ["BTCUSDT"])
+    hub.start()
+    try:
+        assert wait_for(lambda: hub.reconnects >= 2)
+    finally:
+        hub.stop()
+    assert backfilled[:2] == [["BTCUSDT"], ["BTCUSDT"]] # Um backfill por conexão
+    assert hub.get_price("BTCUSDT") == 100.0 # O preço do stream não é sobrescrito pelo backfill
+
+
+def test_stale_prices_are_not_served():
+    hub = MarketDataHub(stale_after=0.0)
+    hub._handle_message(json.dumps(book_frame("BTCUSDT", 99, 101)))
+    time.sleep(0.01)
+    assert hub.get_price("BTCUSDT") is None
+    assert hub.get_prices(["BTCUSDT"]) == {}
@@ -0,0 +1,83 @@
+# test_prompt_builder.py
+import pytest
+
+import prompt_builder
+from prompt_builder import PROMPT_PREFIX, PromptBuilder, TokenCounter, compact_number
+
+
+class BrokenTiktoken:
+    """tiktoken sem acesso ao CDN: o download do arquivo BPE falha."""
+    def __init__(self):
+        self.calls = 0
+
+    def encoding_for_model(self, model):
+        self.calls += 1
+        raise ConnectionError("CDN bloqueado")
+
+    def get_encoding(self, name):
+        self.calls += 1
+        raise ConnectionError("CDN bloqueado")
+
+
+@pytest.fixture
+def estimated(monkeypatch):
+    """Força a estimativa por caracteres, com ou sem tiktoken instalado."""
+    monkeypatch.setattr(prompt_builder, "tiktoken", None)
+
+
+def portfolio(count):
+    """Ativos com valor decrescente: o ativo i vale (count - i) * 10 USDT."""
+    return {f"COIN{i}USDT": {"amount": float(count - i), "current_price": 10.0} for i in range(count)}
+
+
+def test_compact_number():
+    assert compact_number(0.00001234) == "0.00001234"
+    assert compact_number(65012.12) == "65012.12"
+    assert compact_number(2.0) == "2"
+
+
+def test_builder_does_not_load_tokenizer_until_first_count(monkeypatch):
+    broken = BrokenTiktoken()
+    monkeypatch.setattr(prompt_builder, "tiktoken", broken)
+    builder = PromptBuilder()
+    assert broken.calls == 0 # Nada de rede na construção (nem na importação)
+    prompt, counts = builder.build(100.0, portfolio(2), 20)
+    assert broken.calls == 1 # Uma tentativa só: depois da falha fica a estimativa
+    assert counts["exact"] is False
+    assert counts["prefix_tokens"] == -(-len(PROMPT_PREFIX) // TokenCounter.CHARS_PER_TOKEN)
+    builder.build(100.0, portfolio(2), 20)
+    assert broken.calls == 1
+
+
+def test_all_holdings_fit_without_note(estimated):
+    prompt, counts = PromptBuilder(token_budget=1000).build(50.0, portfolio(3), 20)
+    assert prompt.startswith(PROMPT_PREFIX)
+    assert "USDT disponível: 50.00\n" in prompt and "Máximo por compra: 20 USDT\n" in prompt
+    assert (counts["rows"], counts["omitted"]) == (3, 0)
+    assert "omitidos" not in prompt[len(PROMPT_PREFIX):]
+    assert counts["total_tokens"] == counts["prefix_tokens"] + counts["dynamic_tokens"]
+
+
+def test_budget_keeps_most_valuable_holdings_and_notes_the_rest(estimated):
+    builder = PromptBuilder(token_budget=60)
+    prompt, counts = builder.build(50.0, portfolio(20), 20)
+    rows = prompt[len(PROMPT_PREFIX):].splitlines()[4:-1]
+    assert counts["rows"] == len(rows) and 0 < len(rows) < 20
+    assert rows == [f"COIN{i}|{20 - i}|10" for i in range(len(rows))] # Em ordem de valor
+    assert prompt.endswith(f"(+{counts['omitted']} ativos de menor valor omitidos)\n")
+    assert counts["rows"] + counts["omitted"] == 20
+    assert counts["dynamic_tokens"] <= 60 # A nota cabe no orçamento
+
+
+def test_last_row_does_not_reserve_room_for_the_note(estimated):
+    builder = PromptBuilder(token_budget=1000)
+    _, counts = builder.build(50.0, portfolio(1), 20)
+    exact_budget = counts["dynamic_tokens"]
+    _, counts = builder.build(50.0, portfolio(1), 20, token_budget=exact_budget)
+    assert (counts["rows"], counts["omitted"]) == (1, 0)
+
+
+def test_usdt_is_not_listed_as_a_holding(estimated):
+    holdings = dict(portfolio(1), USDT={"amount": 50.0, "current_price": 1.0})
+    prompt, counts = PromptBuilder().build(50.0, holdings, 20)
+    assert counts["rows"] == 1 and "\nUSDT|" not in prompt and "\n|" not in prompt
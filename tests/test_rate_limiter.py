@@ -0,0 +1,131 @@
+# test_rate_limiter.py
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import (PRIORITY_ACCOUNT, PRIORITY_MARKET, PRIORITY_ORDER, RequestShed, WeightGovernor,
+                          governed_call, observe_responses)
+
+
+def governor(limit_per_minute=1000, max_wait=0.05):
+    """Governor pequeno (headroom 1, capacidade = limite) para os níveis ficarem fáceis de conferir."""
+    return WeightGovernor(limit_per_minute=limit_per_minute, headroom=1.0, account_reserve=0.1,
+                          market_reserve=0.3, max_wait=max_wait)
+
+
+class ThrottledError(Exception):
+    """Como a BinanceAPIException de um 429/418: status_code e a resposta com os cabeçalhos."""
+    def __init__(self, status_code, retry_after):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"Retry-After": retry_after}})()
+
+
+class FakeClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def get_account(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {"balances": []}
+
+
+class FakeSession:
+    def __init__(self):
+        self.hooks = {"response": []}
+
+
+def test_priority_floors():
+    gov = governor()
+    gov.acquire(700, PRIORITY_MARKET) # Sobram 300: o piso do mercado (30%)
+    with pytest.raises(RequestShed):
+        gov.acquire(5, PRIORITY_MARKET)
+    gov.acquire(195, PRIORITY_ACCOUNT) # Conta pode descer até 10%
+    with pytest.raises(RequestShed):
+        gov.acquire(10, PRIORITY_ACCOUNT)
+    gov.acquire(100, PRIORITY_ORDER) # Ordens usam o bucket inteiro
+    assert gov.requests == {"order": 1, "account": 1, "market": 1}
+    assert gov.shed == 2
+
+
+def test_market_reads_are_shed_without_waiting():
+    gov = governor(max_wait=1.0)
+    gov.acquire(1000, PRIORITY_ORDER)
+    started_at = time.monotonic()
+    with pytest.raises(RequestShed):
+        gov.acquire(1, PRIORITY_MARKET)
+    assert time.monotonic() - started_at < 0.1
+    assert gov.waits == 0
+
+
+def test_account_reads_wait_up_to_max_wait():
+    gov = governor(limit_per_minute=60, max_wait=0.1) # 1 token por segundo: a espera não basta
+    gov.acquire(60, PRIORITY_ORDER)
+    started_at = time.monotonic()
+    with pytest.raises(RequestShed):
+        gov.acquire(10, PRIORITY_ACCOUNT)
+    assert 0.09 <= time.monotonic() - started_at < 0.5
+
+
+def test_orders_wait_for_refill():
+    gov = governor(limit_per_minute=6000, max_wait=1.0) # 100 tokens por segundo
+    gov.acquire(6000, PRIORITY_ORDER)
+    started_at = time.monotonic()
+    gov.acquire(5, PRIORITY_ORDER)
+    assert 0.03 <= time.monotonic() - started_at < 0.5
+    assert gov.waits == 1 and gov.wait_seconds > 0
+
+
+def test_observe_clamps_tokens_to_server_usage():
+    gov = governor()
+    gov.observe({"x-mbx-used-weight-1m": "900", "x-mbx-order-count-10s": "3"})
+    metrics = gov.metrics()
+    assert metrics["tokens_available"] <= 101
+    assert (metrics["used_weight_1m"], metrics["order_count_10s"]) == (900, 3)
+    gov.observe({"x-mbx-used-weight-1m": "10"}) # Menos uso no servidor não devolve tokens
+    assert gov.metrics()["tokens_available"] <= 101
+    gov.observe(None)
+    gov.observe({})
+    assert gov.metrics()["used_weight_1m"] == 10
+
+
+def test_response_hook_feeds_the_process_governor(monkeypatch):
+    gov = governor()
+    monkeypatch.setattr(rate_limiter, "weight_governor", gov)
+    session = FakeSession()
+    observe_responses(session)
+    observe_responses(session) # Registrado uma vez só
+    assert len(session.hooks["response"]) == 1
+    response = type("Response", (), {"headers": {"x-mbx-used-weight-1m": "400"}})()
+    session.hooks["response"][0](response)
+    assert gov.used_weight_1m == 400
+
+
+@pytest.mark.parametrize("status_code", [429, 418])
+def test_throttled_response_blocks_all_calls_for_retry_after(monkeypatch, status_code):
+    gov = governor(limit_per_minute=6000, max_wait=1.0) # O 429 zera o bucket: 100 tokens/s para reabastecer
+    monkeypatch.setattr(rate_limiter, "weight_governor", gov)
+    with pytest.raises(ThrottledError):
+        governed_call(FakeClient(ThrottledError(status_code, "0.2")), PRIORITY_ACCOUNT, "get_account")
+    assert gov.throttled == 1
+    assert 0 < gov.metrics()["blocked_for"] <= 0.2
+    with pytest.raises(RequestShed):
+        governed_call(FakeClient(), PRIORITY_MARKET, "get_account")
+    client = FakeClient()
+    started_at = time.monotonic()
+    assert governed_call(client, PRIORITY_ORDER, "get_account") == {"balances": []}
+    assert time.monotonic() - started_at >= 0.19
+    assert client.calls == 1
+
+
+def test_other_errors_do_not_back_off(monkeypatch):
+    gov = governor()
+    monkeypatch.setattr(rate_limiter, "weight_governor", gov)
+    with pytest.raises(ThrottledError):
+        governed_call(FakeClient(ThrottledError(500, None)), PRIORITY_ACCOUNT, "get_account")
+    assert gov.throttled == 0
+    assert gov.metrics()["blocked_for"] == 0
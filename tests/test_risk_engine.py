@@ -0,0 +1,210 @@
+# test_risk_engine.py
+import pytest
+
+import risk_engine
+from exchange_info import ExchangeInfoCache
+from fake_binance_server import symbol_info
+from risk_engine import RiskEngine, SortedLevels, TrailingCohort
+
+
+class FakeExchange:
+    """BinanceAPI mínima: registra as vendas e responde com a situação pedida."""
+    def __init__(self, status="filled"):
+        self.status = status
+        self.orders = [] # (lado, símbolo, quantidade, client order id)
+
+    def submit_market_order(self, side, symbol, quantity, order_id=None):
+        self.orders.append((side, symbol, quantity, order_id))
+        if self.status != "filled":
+            return None, self.status
+        return {"orderId": len(self.orders), "clientOrderId": order_id, "executedQty": quantity,
+                "fills": [{"price": "94", "qty": quantity, "commission": "0", "commissionAsset": "USDT"}]}, "filled"
+
+
+class Recorder:
+    """Substitui trade_ledger e dashboard_bus: guarda as chamadas."""
+    def __init__(self):
+        self.calls = []
+
+    def record(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+    def publish(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+
+class Engine(RiskEngine):
+    """RiskEngine que registra as saídas em vez de vender, para testar só os disparos."""
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.exits = []
+
+    def _exit(self, position, reason, price):
+        self.exits.append((position.position_id, reason, price))
+
+    def tick(self, symbol, price):
+        self.on_price(symbol, price)
+        self._executor.submit(lambda: None).result() # Espera as saídas já enfileiradas (um único worker)
+        return self.exits
+
+
+@pytest.fixture
+def sale(monkeypatch):
+    """Dependências globais de _exit trocadas por versões locais: filtros do BTCUSDT, ledger e dashboard."""
+    filters = ExchangeInfoCache()
+    filters.load({"symbols": [symbol_info("BTCUSDT", 100.0)]})
+    ledger, bus = Recorder(), Recorder()
+    monkeypatch.setattr(risk_engine, "exchange_info", filters)
+    monkeypatch.setattr(risk_engine, "trade_ledger", ledger)
+    monkeypatch.setattr(risk_engine, "dashboard_bus", bus)
+    return ledger, bus
+
+
+def test_sorted_levels_boundaries():
+    levels = SortedLevels()
+    for position_id, level in enumerate([90.0, 95.0, 95.0, 100.0]):
+        levels.add(level, position_id)
+    assert levels.at_or_above(95.0) == [1, 2, 3]
+    assert levels.at_or_below(95.0) == [0, 1, 2]
+    levels.remove(95.0, 2)
+    assert levels.levels == [90.0, 95.0, 100.0] and levels.ids == [0, 1, 3]
+
+
+def test_stop_loss_fires_at_the_boundary_price():
+    engine = Engine()
+    position_id = engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange(), stop_loss_pct=0.05)
+    stop = engine.positions()[position_id][3]
+    assert engine.tick("BTCUSDT", stop + 0.01) == []
+    assert engine.tick("BTCUSDT", stop) == [(position_id, "stop_loss", stop)]
+
+
+def test_take_profit_fires_at_the_boundary_price():
+    engine = Engine()
+    position_id = engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange(), take_profit_pct=0.1)
+    target = engine.positions()[position_id][4]
+    assert engine.tick("BTCUSDT", target - 0.01) == []
+    assert engine.tick("BTCUSDT", target) == [(position_id, "take_profit", target)]
+    assert engine.tick("ETHUSDT", 1e9) == [(position_id, "take_profit", target)] # Outro símbolo não dispara nada
+
+
+def test_trailing_peaks_are_raised_and_merged():
+    engine = Engine()
+    first = engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange(), trailing_pct=0.1)
+    second = engine.protect(2, "BTCUSDT", 1.0, 120.0, FakeExchange(), trailing_pct=0.1)
+    cohort = engine._trailing["BTCUSDT"][0.1]
+    assert cohort.peaks == [100.0, 120.0]
+    assert engine.tick("BTCUSDT", 110.0) == [] # Só o primeiro pico sobe
+    assert cohort.peaks == [110.0, 120.0]
+    assert engine.tick("BTCUSDT", 130.0) == []
+    assert cohort.peaks == [130.0] and cohort.groups == [{first, second}]
+    assert engine.tick("BTCUSDT", 117.01) == []
+    assert sorted(engine.tick("BTCUSDT", 117.0)) == [(first, "trailing_stop", 117.0), (second, "trailing_stop", 117.0)]
+    assert cohort.peaks == [] and cohort._group_of == {}
+
+
+def test_trailing_cohort_remove_keeps_other_groups():
+    cohort = TrailingCohort(0.1)
+    for position_id, peak in enumerate([100.0, 100.0, 120.0]):
+        cohort.add(peak, position_id)
+    cohort.on_price(105.0)
+    cohort.remove(0)
+    assert cohort.peaks == [105.0, 120.0]
+    cohort.remove(1)
+    cohort.remove(1) # Remover de novo não faz nada
+    assert cohort.peaks == [120.0] and cohort.groups == [{2}]
+
+
+def test_position_fires_once_when_several_rules_trigger():
+    engine = Engine()
+    position_id = engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange(),
+                                 stop_loss_pct=0.05, take_profit_pct=0.1, trailing_pct=0.03)
+    assert engine.tick("BTCUSDT", 94.0) == [(position_id, "stop_loss", 94.0)]
+    assert engine.tick("BTCUSDT", 90.0) == [(position_id, "stop_loss", 94.0)]
+    assert engine.fired == 1
+    assert engine.positions() == {}
+    assert engine._stops["BTCUSDT"].ids == [] and engine._takes["BTCUSDT"].ids == []
+
+
+def test_reduce_consumes_oldest_positions_first():
+    engine = Engine()
+    ids = [engine.protect(1, "BTCUSDT", quantity, 100.0, FakeExchange(), stop_loss_pct=0.05)
+           for quantity in (1.0, 2.0, 3.0)]
+    other = engine.protect(2, "BTCUSDT", 1.0, 100.0, FakeExchange(), stop_loss_pct=0.05)
+    engine.reduce(1, "BTCUSDT", 2.5)
+    positions = engine.positions()
+    assert ids[0] not in positions # Zerada: sai dos índices
+    assert positions[ids[1]][1] == 0.5 and positions[ids[2]][1] == 3.0
+    assert positions[other][1] == 1.0
+    assert ids[0] not in engine._stops["BTCUSDT"].ids
+    assert sorted(engine.tick("BTCUSDT", 90.0)) == [(i, "stop_loss", 90.0) for i in sorted(ids[1:] + [other])]
+
+
+def test_remove_owner_drops_only_that_users_positions():
+    engine = Engine()
+    engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange(), stop_loss_pct=0.05, trailing_pct=0.1)
+    kept = engine.protect(2, "BTCUSDT", 1.0, 100.0, FakeExchange(), stop_loss_pct=0.05)
+    engine.remove_owner(1)
+    assert list(engine.positions()) == [kept]
+    assert engine._trailing["BTCUSDT"][0.1].peaks == []
+    assert engine.tick("BTCUSDT", 50.0) == [(kept, "stop_loss", 50.0)]
+
+
+def test_protect_without_rules_is_ignored():
+    engine = Engine()
+    assert engine.protect(1, "BTCUSDT", 1.0, 100.0, FakeExchange()) is None
+    assert engine.protect(1, "BTCUSDT", 0.0, 100.0, FakeExchange(), stop_loss_pct=0.05) is None
+    assert engine.positions() == {}
+
+
+def test_exit_sells_quantized_quantity_and_records_it(sale):
+    ledger, bus = sale
+    exchange = FakeExchange()
+    engine = RiskEngine(max_workers=1)
+    engine.protect(1, "BTCUSDT", 0.123456, 100.0, exchange, stop_loss_pct=0.05)
+    position = next(iter(engine._positions.values()))
+    engine._exit(position, "stop_loss", 94.0)
+    assert [order[:3] for order in exchange.orders] == [("SELL", "BTCUSDT", "0.12")]
+    assert exchange.orders[0][3] # Client order id próprio da venda
+    (args, kwargs), = ledger.calls
+    assert args[2:6] == ("SELL", "BTCUSDT", "0.12", 94.0) and kwargs == {"source": "stop_loss"}
+    assert bus.calls[0][0][1]["history"][0]["reason"] == "stop_loss"
+
+
+def test_exit_below_filters_sends_nothing(sale):
+    ledger, bus = sale
+    exchange = FakeExchange()
+    engine = RiskEngine(max_workers=1)
+    engine.protect(1, "BTCUSDT", 0.01, 100.0, exchange, stop_loss_pct=0.05)
+    position = next(iter(engine._positions.values()))
+    engine._exit(position, "stop_loss", 94.0) # 0,94 USDT abaixo do minNotional de 5
+    assert exchange.orders == [] and ledger.calls == [] and bus.calls == []
+
+
+def test_exit_with_unknown_status_is_resolved_not_resent(sale, monkeypatch):
+    ledger, _ = sale
+    exchange = FakeExchange(status="unknown")
+    resolved = []
+
+    def resolve(api, symbol, order_id):
+        resolved.append((api, symbol, order_id))
+        return {"orderId": 9, "clientOrderId": order_id, "executedQty": "1", "cummulativeQuoteQty": "94"}
+
+    monkeypatch.setattr(risk_engine, "resolve_unknown_order", resolve)
+    engine = RiskEngine(max_workers=1)
+    engine.protect(1, "BTCUSDT", 1.0, 100.0, exchange, stop_loss_pct=0.05)
+    position = next(iter(engine._positions.values()))
+    engine._exit(position, "stop_loss", 94.0)
+    assert len(exchange.orders) == 1
+    assert resolved == [(exchange, "BTCUSDT", exchange.orders[0][3])]
+    (args, _), = ledger.calls
+    assert args[7] == 9 and args[5] == 94.0
+
+
+def test_exit_unknown_order_that_never_arrived_is_not_recorded(sale, monkeypatch):
+    ledger, bus = sale
+    monkeypatch.setattr(risk_engine, "resolve_unknown_order", lambda api, symbol, order_id: None)
+    engine = RiskEngine(max_workers=1)
+    exchange = FakeExchange(status="unknown")
+    engine.protect(1, "BTCUSDT", 1.0, 100.0, exchange, stop_loss_pct=0.05)
+    engine._exit(next(iter(engine._positions.values())), "stop_loss", 94.0)
+    assert len(exchange.orders) == 1 and ledger.calls == [] and bus.calls == []
@@ -0,0 +1,29 @@
+# test_trade_ledger.py
+from db import connect
+from trade_ledger import TRADES_SCHEMA, INSERT_TRADE, decode_cursor, encode_cursor, fetch_trades
+
+
+def test_history_is_empty_before_the_trades_table_exists(tmp_path):
+    db = connect(str(tmp_path / "antigo.db"))
+    db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY)") # Banco de antes do ledger
+    assert fetch_trades(db, 1) == ([], None)
+
+
+def test_pages_follow_the_cursor(tmp_path):
+    db = connect(str(tmp_path / "database.db"))
+    db.executescript(TRADES_SCHEMA)
+    for index in range(5):
+        db.execute(INSERT_TRADE, (1, f"2026-01-0{index + 1}T00:00:00", "BUY", "BTCUSDT", 1.0, 100.0,
+                                  None, index, f"id{index}", "llm"))
+    db.execute(INSERT_TRADE, (2, "2026-01-09T00:00:00", "SELL", "BTCUSDT", 1.0, 100.0, None, 9, "x", "llm"))
+    trades, cursor = fetch_trades(db, 1, limit=2)
+    assert [trade["order_id"] for trade in trades] == [4, 3]
+    trades, cursor = fetch_trades(db, 1, cursor, limit=2)
+    assert [trade["order_id"] for trade in trades] == [2, 1]
+    trades, cursor = fetch_trades(db, 1, cursor, limit=2)
+    assert [trade["order_id"] for trade in trades] == [0] and cursor is None
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2026-01-01T00:00:00", 7)) == ("2026-01-01T00:00:00", 7)
+    assert decode_cursor("lixo") is None
@@ -0,0 +1,184 @@
+# trade_ledger.py
+import base64
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from db import connect
+from logging_setup import get_logger
+
+log = get_logger("ledger")
+
+# Mantido igual ao schema.sql, para bancos criados antes da tabela existir
+TRADES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    price REAL,
+    commission TEXT,
+    order_id INTEGER,
+    client_order_id TEXT,
+    source TEXT NOT NULL DEFAULT 'llm',
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS idx_trades_user_time ON trades (user_id, timestamp, id);
+"""
+
+INSERT_TRADE = (
+    "INSERT INTO trades (user_id, timestamp, type, symbol, quantity, price, commission, order_id, client_order_id, source)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def encode_cursor(timestamp, trade_id):
+    """Cursor opaco da paginação: a posição (timestamp, id) da última negociação da página."""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, trade_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Retorna (timestamp, id) do cursor, ou None se ele for inválido."""
+    try:
+        timestamp, trade_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(timestamp), int(trade_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def fetch_trades(db, user_id, cursor=None, limit=50):
+    """
+    Página de negociações do usuário, da mais recente para a mais antiga.
+    Usa o índice (user_id, timestamp, id) e o cursor da página anterior, em vez de OFFSET,
+    então o custo não cresce com o número de páginas. Retorna (negociações, próximo cursor ou None).
+    """
+    params = [user_id]
+    where = "user_id = ?"
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        where += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+        params += [position[0], position[0], position[1]]
+    try:
+        rows = db.execute(
+            f"SELECT id, timestamp, type, symbol, quantity, price, commission, order_id, client_order_id, source"
+            f" FROM trades WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        # Bancos criados antes do ledger só ganham a tabela na primeira gravação: até lá, nada a listar
+        if "no such table" in str(e):
+            return [], None
+        raise
+    trades = [{
+        "id": row["id"],
+        "timestamp": row["timestamp"],
+        "type": row["type"],
+        "symbol": row["symbol"],
+        "quantity": row["quantity"],
+        "price": row["price"],
+        "commission": json.loads(row["commission"]) if row["commission"] else {},
+        "order_id": row["order_id"],
+        "client_order_id": row["client_order_id"],
+        "source": row["source"]
+    } for row in rows[:limit]]
+    next_cursor = encode_cursor(trades[-1]["timestamp"], trades[-1]["id"]) if len(rows) > limit else None
+    return trades, next_cursor
+
+
+class TradeLedger:
+    """
+    Registro persistente das negociações no SQLite.
+    `record` só coloca a negociação numa fila em memória e retorna na hora; uma única thread
+    escritora junta o que chegou (até `batch_size` ou `flush_interval` segundos) e grava tudo
+    numa só transação. Assim nenhuma thread de bot espera por I/O de disco.
+    """
+    def __init__(self, path="database.db", batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def record(self, user_id, timestamp, trade_type, symbol, quantity, price, commission=None,
+               order_id=None, client_order_id=None, source="llm"):
+        """Enfileira uma negociação para gravação. Nunca bloqueia."""
+        self._queue.put((
+            user_id, timestamp, trade_type, symbol, float(quantity or 0),
+            float(price) if price not in (None, 'N/A') else None,
+            json.dumps(commission) if commission else None,
+            order_id, client_order_id, source
+        ))
+        self.start()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write_loop, name="trade-ledger", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        """Grava o que ainda está na fila e encerra a thread escritora."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        conn = connect(self.path) # WAL: os lotes não bloqueiam as leituras do dashboard
+        try:
+            conn.executescript(TRADES_SCHEMA)
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                # Junta o que chegar até encher o lote ou vencer o intervalo
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stopping = True
+                    batch = [item for item in batch if item is not None]
+                    while True: # Esvazia a fila antes de sair
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not None:
+                            batch.append(item)
+                if batch:
+                    self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with conn: # Uma transação por lote
+                conn.executemany(INSERT_TRADE, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.failed += len(batch)
+            log.error("Erro ao gravar %d negociações no banco de dados: %s", len(batch), e)
+
+
+# Instância única do processo, compartilhada por todos os bots
+trade_ledger = TradeLedger()
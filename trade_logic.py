@@ -1,104 +1,148 @@
+import asyncio
 import time
 import json
-import requests
 import os
 import re
 from datetime import datetime
 
 from binance_api import BinanceAPI
+from sim_exchange import SimulatedBinanceAPI
 from chatgpt_api import OpenAIAPI
+from market_data import market_data_hub
+from dashboard_bus import dashboard_bus
+from exchange_info import exchange_info, format_decimal
+from decision_cache import DecisionCache
+from decision_client import DecisionClient
+from prompt_builder import prompt_builder
+from risk_engine import risk_engine
+from execution_engine import ExecutionBatch, aggregate_fills, place_order
+from trade_ledger import trade_ledger
+from equity_series import equity_store
+from metrics import metrics, bot_stage_seconds, bot_cycles_total
+from logging_setup import get_logger, Lazy
 
-# Endpoint para o dashboard Flask
-FLASK_DASHBOARD_URL = "http://127.0.0.1:5000/update_data"
+log = get_logger("trade")
 
-# A variável global_config será populada pela função run_bot
-global_config = {}
-
-# ATUALIZADO: A função agora aceita user_id
 def send_to_dashboard(user_id, data):
-    """Envia dados atualizados para o dashboard Flask, incluindo user_id."""
-    data_with_user_id = data.copy()
-    data_with_user_id['user_id'] = user_id # Adiciona o user_id
-    try:
-        response = requests.post(FLASK_DASHBOARD_URL, json=data_with_user_id) # Envia com user_id
-        response.raise_for_status() # Lança exceções para status de erro (4xx ou 5xx)
-    except requests.exceptions.ConnectionError:
-        print(f"[DASHBOARD ERRO] Não foi possível conectar ao dashboard Flask para user {user_id}. Ele está rodando?")
-    except requests.exceptions.RequestException as e:
-        print(f"[DASHBOARD ERRO] Erro ao enviar dados ao dashboard Flask para user {user_id}: {e}")
+    """
+    Publica dados atualizados para o dashboard no barramento em processo.
+    Não bloqueia: a entrega ao Flask (ou ao transporte HTTP) é feita pela thread do barramento.
+    """
+    dashboard_bus.publish(user_id, data)
+
+class StageTimer:
+    """
+    Mede o tempo de parede (wall-clock) de cada estágio de um ciclo de negociação.
+    Com `user_label`, cada estágio (e o total, em report) também vai para o histograma bot_stage_seconds.
+    """
+    def __init__(self, user_label=None):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.user_label = user_label
+
+    def _record(self, name, seconds):
+        self.stages[name] = seconds
+        if self.user_label is not None:
+            bot_stage_seconds.observe(seconds, name, self.user_label)
+
+    async def run(self, name, awaitable):
+        """Aguarda o estágio e registra sua duração em segundos."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def measure(self, name, func, *args):
+        """Executa um estágio síncrono (CPU) e registra sua duração em segundos."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def report(self):
+        """Retorna {estágio: milissegundos}, incluindo o total do ciclo."""
+        report = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        total = time.perf_counter() - self.started_at
+        report["total"] = round(total * 1000, 1)
+        if self.user_label is not None:
+            bot_stage_seconds.observe(total, "total", self.user_label)
+            bot_cycles_total.inc(self.user_label)
+        return report
 
 def get_binance_balance_and_portfolio(binance_api, symbols_to_watch):
     """
     Obtém saldo em USDT e portfólio de criptomoedas com preços atuais.
     Filtra para incluir apenas símbolos de interesse e ignora BRL/outros.
     """
-    account_info = binance_api.get_account_info()
+    # Saldos não nulos, vindos da memória (user-data stream) ou do REST
+    balances = binance_api.get_balances()
+    if not balances:
+        return 0.0, {}
+    # Uma única leitura do snapshot de preços para todos os ativos em carteira
+    held_pairs = [asset + "USDT" for asset in balances if asset + "USDT" in symbols_to_watch]
+    return build_portfolio(balances, binance_api.get_prices(held_pairs), symbols_to_watch)
+
+def build_portfolio(balances, current_prices, symbols_to_watch):
+    """
+    Monta (saldo USDT, portfólio) a partir de {ativo: (free, locked)} e {símbolo: preço},
+    sem acessar a rede.
+    """
     portfolio = {}
     usdt_balance = 0.0
 
-    if account_info:
-        # Pega saldos de ativos da conta
-        for balance in account_info['balances']:
-            asset = balance['asset']
-            free = float(balance['free'])
-            locked = float(balance['locked'])
-            total_amount = free + locked
-
-            if total_amount > 0:
-                # Se for USDT, adicione ao saldo de caixa
-                if asset == "USDT":
-                    usdt_balance = total_amount
-                    portfolio["USDT"] = {"amount": usdt_balance, "current_price": 1.0} # Preço do USDT é 1.0
-                else:
-                    # Verifica se o ativo é um dos símbolos que queremos monitorar (ex: BTC, ETH)
-                    # e se forma um par válido com USDT (ex: BTCUSDT)
-                    symbol_pair = asset + "USDT"
-                    if symbol_pair in symbols_to_watch: # Verifica se é um dos pares monitorados
-                        current_price = binance_api.get_current_price(symbol_pair)
-                        if current_price is not None:
-                            portfolio[symbol_pair] = {
-                                "amount": total_amount,
-                                "current_price": current_price,
-                                "free": free,
-                                "locked": locked
-                            }
-                        else:
-                            print(f"Aviso: Não foi possível obter o preço para {symbol_pair}. Ignorando este ativo no portfólio.")
+    for asset, (free, locked) in balances.items():
+        total_amount = free + locked
+        # Se for USDT, adicione ao saldo de caixa
+        if asset == "USDT":
+            usdt_balance = total_amount
+            portfolio["USDT"] = {"amount": usdt_balance, "current_price": 1.0} # Preço do USDT é 1.0
+            continue
+        # Verifica se o ativo é um dos símbolos que queremos monitorar (ex: BTC, ETH)
+        # e se forma um par válido com USDT (ex: BTCUSDT)
+        symbol_pair = asset + "USDT"
+        if symbol_pair not in symbols_to_watch: # Verifica se é um dos pares monitorados
+            continue
+        current_price = current_prices.get(symbol_pair)
+        if current_price is not None:
+            portfolio[symbol_pair] = {
+                "amount": total_amount,
+                "current_price": current_price,
+                "free": free,
+                "locked": locked
+            }
+        else:
+            log.warning("Sem preço para %s; ativo ignorado no portfólio.", symbol_pair)
     return usdt_balance, portfolio
 
-def generate_openai_prompt(usdt_balance, portfolio_data):
+def generate_openai_prompt(usdt_balance, portfolio_data, config):
     """Gera um prompt detalhado para o OpenAI com base no portfólio atual."""
-    prompt = "Seu portfólio atual é: "
-    for symbol, data in portfolio_data.items():
-        if symbol == "USDT":
-            prompt += f"{data['amount']:.4f} USDT (cash), "
-        else:
-            prompt += f"{data['amount']:.4f} {symbol.replace('USDT', '')} (current price: ${data['current_price']:.4f}), "
-    
-    # Remove a vírgula extra no final se houver
-    prompt = prompt.rstrip(', ') + ". "
-
-    prompt += f"Você tem {usdt_balance:.2f} USDT disponíveis para negociar. "
-    prompt += "Seu objetivo é maximizar os lucros em um mercado de criptomoedas volátil. "
-    prompt += "Analise o mercado atual com base nas informações do seu portfólio. "
-    prompt += "Você deve retornar APENAS uma ação de negociação no formato JSON, como uma lista de objetos. "
-    prompt += "Se nenhuma ação for necessária, retorne uma lista vazia `[]`. "
-    prompt += "As ações disponíveis são 'BUY' ou 'SELL'. "
-    prompt += "Para 'BUY', inclua 'symbol' (ex: 'BTCUSDT') e 'usdt_amount' (valor em USDT para gastar). "
-    prompt += "Para 'SELL', inclua 'symbol' (ex: 'BTCUSDT') e 'quantity' (quantidade da criptomoeda para vender). "
-    prompt += f"A quantidade máxima de USDT que você pode gastar em uma única compra é {global_config['QUANTITY_PER_TRADE_USDT']}. "
-    prompt += "Não tente comprar ou vender USDT diretamente. "
-    prompt += "Exemplos de formato de saída:\n"
-    prompt += "Para comprar: `[{\"action\": \"BUY\", \"symbol\": \"BTCUSDT\", \"usdt_amount\": 10}]`\n"
-    prompt += "Para vender: `[{\"action\": \"SELL\", \"symbol\": \"ETHUSDT\", \"quantity\": 0.05}]`\n"
-    prompt += "Para manter: `[]`"
+    prompt, _ = build_openai_prompt(usdt_balance, portfolio_data, config)
     return prompt
 
+def build_openai_prompt(usdt_balance, portfolio_data, config):
+    """
+    Como generate_openai_prompt, mas retorna (prompt, contagens de tokens).
+    As instruções fixas vêm primeiro (prefixo reaproveitável pelo cache do provedor) e o portfólio
+    vem depois, em tabela compacta limitada a PROMPT_TOKEN_BUDGET tokens.
+    """
+    return prompt_builder.build(usdt_balance, portfolio_data, config['QUANTITY_PER_TRADE_USDT'],
+                                token_budget=config.get("PROMPT_TOKEN_BUDGET"))
+
 def parse_openai_response(response_str):
     """
     Analisa a string de resposta do OpenAI, extraindo o JSON.
     Lida com o encapsulamento de Markdown (```json ... ```).
     """
+    actions, _ = try_parse_openai_response(response_str)
+    return actions
+
+def try_parse_openai_response(response_str):
+    """
+    Como parse_openai_response, mas retorna (ações, válida): 'válida' é False quando a resposta
+    não pôde ser interpretada, distinguindo um erro de uma recomendação de manter ([]).
+    """
     # Remove o encapsulamento de markdown se presente
     clean_response = response_str.replace("```json", "").replace("```", "").strip()
     
@@ -106,196 +150,380 @@ def parse_openai_response(response_str):
         # Tenta carregar o JSON
         actions = json.loads(clean_response)
         if not isinstance(actions, list):
-            print(f"Aviso: Resposta do OpenAI não é uma lista. Recebido: {actions}")
-            return []
-        return actions
+            log.warning("Resposta do OpenAI não é uma lista.", extra={"response": response_str})
+            return [], False
+        return actions, True
     except json.JSONDecodeError as e:
-        print(f"Erro ao analisar JSON da resposta do OpenAI: {e}. Resposta: {response_str}")
-        return []
+        log.warning("Erro ao analisar o JSON da resposta do OpenAI: %s", e, extra={"response": response_str})
+        return [], False
     except Exception as e:
-        print(f"Erro inesperado ao processar resposta do OpenAI: {e}. Resposta: {response_str}")
-        return []
+        log.error("Erro inesperado ao processar a resposta do OpenAI: %s", e, extra={"response": response_str})
+        return [], False
 
-def execute_trade_action(action, binance_api, current_prices, usdt_balance, user_config):
-    """Executa a ação de compra ou venda recomendada pelo OpenAI."""
+def prepare_order_quantity(symbol, quantity, price):
+    """
+    Ajusta a quantidade aos filtros da Binance (stepSize, minQty, minNotional) usando o cache
+    de exchange info (price=None pula a checagem de valor mínimo) e retorna a quantidade como string decimal exata, ou None se a ordem
+    seria rejeitada. Sem filtros disponíveis, recorre ao arredondamento para 5 casas decimais.
+    """
+    quantized = exchange_info.quantize_quantity(symbol, quantity)
+    if quantized is None:
+        log.warning("Filtros de %s indisponíveis; quantidade arredondada para 5 casas decimais.", symbol)
+        quantity = round(quantity, 5)
+        return str(quantity) if quantity > 0 else None
+
+    valid, reason = exchange_info.validate_order(symbol, quantized, price)
+    if not valid:
+        log.info("Ordem de %s não atende aos filtros da Binance: %s Ignorando.", symbol, reason)
+        return None
+    return format_decimal(quantized)
+
+def plan_trade_action(action, current_prices, usdt_balance, user_config):
+    """
+    Valida a ação recomendada pelo OpenAI contra os preços e saldos do ciclo e retorna o plano
+    da ordem ({"side", "symbol", "quantity", "usdt_amount"}), ou None se ela deve ser ignorada.
+    """
     action_type = action.get('action')
     symbol = action.get('symbol')
 
     if action_type == 'BUY':
         usdt_amount = action.get('usdt_amount')
         if not symbol or not usdt_amount or usdt_amount <= 0:
-            print(f"Ação de compra inválida: {action}. Ignorando.")
+            log.info("Ação de compra inválida; ignorando.", extra={"action": action})
             return
 
         if usdt_amount > usdt_balance:
-            print(f"Não há USDT suficiente para comprar {usdt_amount} USDT de {symbol}. Saldo disponível: {usdt_balance:.2f} USDT. Ignorando compra.")
+            log.info("USDT insuficiente para comprar %s USDT de %s (saldo %.2f USDT); ignorando.", usdt_amount, symbol, usdt_balance)
             return
         
         # Limita a quantidade de compra por trade
         max_trade_usdt = user_config.get('QUANTITY_PER_TRADE_USDT', 10)
         if usdt_amount > max_trade_usdt:
-            print(f"Aviso: Quantidade de compra ({usdt_amount} USDT) excede o limite por trade ({max_trade_usdt} USDT). Ajustando para {max_trade_usdt} USDT.")
+            log.info("Compra de %s USDT excede o limite por trade; ajustada para %s USDT.", usdt_amount, max_trade_usdt)
             usdt_amount = max_trade_usdt
 
         current_price = current_prices.get(symbol)
         if not current_price:
-            print(f"Não foi possível obter o preço atual para {symbol}. Não é possível comprar.")
+            log.warning("Sem preço atual para %s; compra ignorada.", symbol)
             return
 
-        # Calcula a quantidade a ser comprada
-        quantity = usdt_amount / current_price
-        # A Binance tem requisitos de "step size" para a quantidade.
-        # Para simplificar aqui, vamos arredondar para um número razoável de casas decimais.
-        # Em produção, usaria client.get_symbol_info(symbol) para obter filtros de quantidade.
-        # Ex: arredondar para 5 casas decimais para a maioria das altcoins.
-        quantity = round(quantity, 5) # Ajuste conforme a precisão do ativo
+        # Calcula a quantidade a ser comprada, ajustada ao stepSize/minNotional do símbolo
+        quantity = prepare_order_quantity(symbol, usdt_amount / current_price, current_price)
 
-        if quantity <= 0:
-            print(f"Quantidade calculada para compra de {symbol} é zero ou negativa. Ignorando.")
+        if quantity is None:
+            log.info("Quantidade calculada para compra de %s é inválida; ignorando.", symbol)
             return
             
-        print(f"Executando compra de {quantity} {symbol} com {usdt_amount} USDT.")
-        order = binance_api.buy_market(symbol, quantity)
-        if order:
-            print(f"Compra de {symbol} executada com sucesso. ID da Ordem: {order.get('orderId')}")
-            return {"type": "BUY", "symbol": symbol, "executed_quantity": order.get('executedQty'), "price": order.get('fills')[0].get('price') if order.get('fills') else 'N/A'}
-        else:
-            print(f"Falha na compra de {symbol}.")
+        log.info("Executando compra de %s %s com %s USDT.", quantity, symbol, usdt_amount)
+        return {"side": "BUY", "symbol": symbol, "quantity": quantity, "usdt_amount": usdt_amount}
 
     elif action_type == 'SELL':
         quantity_to_sell = action.get('quantity')
         if not symbol or not quantity_to_sell or quantity_to_sell <= 0:
-            print(f"Ação de venda inválida: {action}. Ignorando.")
+            log.info("Ação de venda inválida; ignorando.", extra={"action": action})
             return
 
         # Verifique se o ativo existe no portfólio e se há quantidade suficiente
         # Note: 'portfolio_data' vem no 'user_config' passado para esta função.
         current_holdings = user_config.get('portfolio_data', {}).get(symbol, {}).get('amount', 0)
         if quantity_to_sell > current_holdings:
-            print(f"Não há {quantity_to_sell} {symbol} para vender. Saldo disponível: {current_holdings:.4f} {symbol}. Ignorando venda.")
+            log.info("Saldo insuficiente para vender %s %s (disponível %.4f); ignorando.", quantity_to_sell, symbol, current_holdings)
+            return
+
+        # A validação do minNotional usa o preço atual; sem ele, valida só a quantidade
+        quantity_to_sell = prepare_order_quantity(symbol, quantity_to_sell, current_prices.get(symbol))
+        if quantity_to_sell is None:
             return
         
-        print(f"Executando venda de {quantity_to_sell} {symbol}.")
-        order = binance_api.sell_market(symbol, quantity_to_sell)
-        if order:
-            print(f"Venda de {symbol} executada com sucesso. ID da Ordem: {order.get('orderId')}")
-            return {"type": "SELL", "symbol": symbol, "executed_quantity": order.get('executedQty'), "price": order.get('fills')[0].get('price') if order.get('fills') else 'N/A'}
-        else:
-            print(f"Falha na venda de {symbol}.")
+        log.info("Executando venda de %s %s.", quantity_to_sell, symbol)
+        return {"side": "SELL", "symbol": symbol, "quantity": quantity_to_sell, "usdt_amount": 0.0}
     else:
-        print(f"Tipo de ação desconhecido: {action_type}. Ignorando.")
+        log.info("Tipo de ação desconhecido: %s; ignorando.", action_type)
     return None
 
-# ATUALIZADO: A função run_bot agora aceita um dicionário de configuração completo
-# que inclui a chave da OpenAI, e também 'app_dashboard_data' para acesso direto.
-def run_bot(user_id, api_key, secret_key, config, stop_event, app_dashboard_data):
+def trade_result_from_order(plan, order):
+    """Resume a ordem executada para o histórico, somando todas as execuções (fills)."""
+    symbol = plan["symbol"]
+    if not order:
+        log.warning("Falha na ordem %s de %s.", plan["side"], symbol)
+        return None
+    log.info("Ordem %s de %s executada. ID da ordem: %s", plan["side"], symbol, order.get("orderId"))
+    fills = aggregate_fills(order)
+    # Quantidade que de fato ficou na conta: a taxa pode ser cobrada no próprio ativo comprado
+    fee_in_asset = fills["commission"].get(symbol.replace('USDT', ''), 0.0)
+    return {
+        "type": plan["side"],
+        "symbol": symbol,
+        "executed_quantity": order.get('executedQty'),
+        "price": fills["avg_price"] if fills["avg_price"] is not None else 'N/A',
+        "net_quantity": fills["executed_quantity"] - fee_in_asset if plan["side"] == "BUY" else fills["executed_quantity"],
+        "commission": fills["commission"],
+        "order_id": order.get('orderId'),
+        "client_order_id": order.get('clientOrderId')
+    }
+
+def execute_trade_action(action, binance_api, current_prices, usdt_balance, user_config, client_order_id=None):
+    """Executa a ação de compra ou venda recomendada pelo OpenAI."""
+    plan = plan_trade_action(action, current_prices, usdt_balance, user_config)
+    if plan is None:
+        return None
+    order = place_order(binance_api, plan, client_order_id)
+    return trade_result_from_order(plan, order)
+
+# O bot de cada usuário é uma corrotina executada pelo BotEngine (bot_engine.py) em um único
+# event loop. As chamadas bloqueantes (Binance, OpenAI, dashboard) passam pelos limites de
+# concorrência de 'limits' e rodam no pool de threads do loop.
+async def run_bot(user_id, api_key, secret_key, config, limits):
     """
-    Função principal do bot que é executada em uma thread.
-    Recebe user_id, api_key, secret_key e um dicionário 'config' que contém a chave OpenAI,
-    e outras configurações globais. 'app_dashboard_data' é uma referência ao dicionário
-    de dados do dashboard no app.py.
+    Corrotina principal do bot de um usuário.
+    Recebe user_id, api_key, secret_key, um dicionário 'config' que contém a chave OpenAI
+    e as demais configurações globais, e os limites de I/O do engine ('limits').
+    Roda até ser cancelada; o cancelamento substitui o antigo stop_event.
     """
-    global global_config
-    global_config = config # Salva a configuração passada, incluindo a chave OpenAI
+    # EXCHANGE_BACKEND = "simulated" negocia na exchange local (paper trading), com a mesma interface
+    exchange_backend = SimulatedBinanceAPI if config.get("EXCHANGE_BACKEND", "binance") == "simulated" else BinanceAPI
+    binance_api = await limits.exchange(exchange_backend, api_key, secret_key)
+    # As ações são validadas na thread do loop, então os filtros precisam estar carregados antes
+    # (só espera a thread de atualização: a chamada à Binance não ocupa uma vaga de I/O do bot)
+    await limits.io(exchange_info.ensure_loaded)
+    
+    # A chave da OpenAI vem dentro do dicionário 'config'
+    openai_api = OpenAIAPI(config.get("OPENAI_API_KEY"), base_url=config.get("OPENAI_BASE_URL"))
+    # Chamadas ao LLM com prazo por ciclo, novas tentativas com backoff e hedge para um modelo mais rápido
+    user_label = metrics.user_label(user_id)
+    decision_client = DecisionClient(
+        openai_api,
+        try_parse_openai_response,
+        primary_model=config.get("LLM_PRIMARY_MODEL", "gpt-4o"),
+        hedge_model=config.get("LLM_HEDGE_MODEL", "gpt-4o-mini"),
+        deadline=config.get("LLM_DEADLINE_SECONDS", 45),
+        hedge_percentile=config.get("LLM_HEDGE_PERCENTILE", 0.9),
+        max_retries=config.get("LLM_MAX_RETRIES", 2),
+        on_parse=lambda seconds: bot_stage_seconds.observe(seconds, "parse", user_label)
+    )
 
-    binance_api = BinanceAPI(api_key, secret_key)
+    trade_interval = config.get("TRADE_INTERVAL_SECONDS", 300)
     
-    # Agora a chave da OpenAI vem dentro do dicionário 'config'
-    openai_api = OpenAIAPI(global_config.get("OPENAI_API_KEY"))
+    # Lista de símbolos a serem observados (pode vir de config.json via config)
+    symbols_to_watch = config.get('symbols_to_watch', ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "DOGEUSDT", "LINKUSDT", "ADAUSDT", "FETUSDT", "AVAXUSDT", "OMUSDT", "RNDRUSDT", "TRUMPUSDT"])
+
+    log.info("Bot iniciado (intervalo de negociação: %s s).", trade_interval, extra={"user_id": user_id})
+
+    # Inscreve os símbolos deste bot no stream compartilhado de preços
+    market_data_hub.register(user_id, symbols_to_watch)
+    # Saldos mantidos em memória pelo user-data stream, em vez de get_account a cada ciclo
+    if config.get("USER_DATA_STREAM", False):
+        binance_api.start_account_stream(config.get("ACCOUNT_RECONCILE_SECONDS", 300))
+    # Decisões do LLM reutilizadas enquanto o portfólio não mudar além das faixas de tolerância
+    decision_cache = None
+    if config.get("DECISION_CACHE_ENABLED", True):
+        decision_cache = DecisionCache(
+            price_tolerance=config.get("DECISION_CACHE_PRICE_TOLERANCE", 0.005),
+            balance_tolerance=config.get("DECISION_CACHE_BALANCE_TOLERANCE", 0.01),
+            ttl=config.get("DECISION_CACHE_TTL_SECONDS", 900),
+            max_entries=config.get("DECISION_CACHE_MAX_ENTRIES", 128)
+        )
+    try:
+        while True:
+            await run_cycle(user_id, binance_api, decision_client, config, symbols_to_watch, limits, decision_cache)
+            log.debug("Próximo ciclo em %s s.", trade_interval, extra={"user_id": user_id})
+            await asyncio.sleep(trade_interval) # Espera, mas permite que o bot seja cancelado
+    finally:
+        market_data_hub.unregister(user_id)
+        risk_engine.remove_owner(user_id)
+        await asyncio.to_thread(binance_api.stop_account_stream)
+
+async def run_cycle(user_id, binance_api, decision_client, config, symbols_to_watch, limits, decision_cache=None):
+    """
+    Executa um ciclo de negociação como um grafo de estágios:
+
+        saldos ─┐
+                ├─> portfólio -> prompt -> OpenAI -> parse -> ordens
+        preços ─┘                                              ^
+           └───────────────────────────────────────────────────┘
 
-    trade_interval = global_config.get("TRADE_INTERVAL_SECONDS", 300)
-    max_trades_per_cycle = global_config.get("MAX_TRADES_PER_CYCLE", 1)
+    Saldos e preços são buscados em paralelo; os preços são buscados uma única vez e reutilizados
+    no prompt e na validação das ordens (ExecutionBatch). As notificações ao dashboard (barramento) não bloqueiam o ciclo.
+    Com 'decision_cache', um estado de portfólio já visto reutiliza a decisão anterior sem chamar o LLM.
+    O estágio "llm" inclui o parse: 'decision_client' só devolve uma resposta válida ou desiste no prazo.
+    Com LLM_STREAMING, as ordens começam assim que a primeira ação da resposta fica completa:
+    "first_action" e "first_order" medem esse caminho, separados do tempo da resposta completa ("llm").
+    Retorna {estágio: milissegundos} com o tempo de parede de cada estágio.
+    """
+    timer = StageTimer(metrics.user_label(user_id))
+    trade_interval = config.get("TRADE_INTERVAL_SECONDS", 300)
+    max_trades_per_cycle = config.get("MAX_TRADES_PER_CYCLE", 1)
+
+    current_time = int(time.time())
+    next_cycle_time = current_time + trade_interval
     
-    # Lista de símbolos a serem observados (pode vir de config.json via global_config)
-    symbols_to_watch = global_config.get('symbols_to_watch', ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "DOGEUSDT", "LINKUSDT", "ADAUSDT", "FETUSDT", "AVAXUSDT", "OMUSDT", "RNDRUSDT", "TRUMPUSDT"])
+    send_to_dashboard(user_id, {"next_cycle_time": next_cycle_time})
 
-    print(f"\n--- Bot para usuário {user_id} iniciado ---")
-    print(f"Intervalo de negociação: {trade_interval} segundos")
+    log.debug("Executando ciclo de negociação.", extra={"user_id": user_id})
+    
+    # 1. Obter saldos e preços do Binance em paralelo
+    balances, current_prices = await asyncio.gather(
+        timer.run("account", limits.exchange(binance_api.get_balances)),
+        timer.run("prices", limits.exchange(binance_api.get_prices, symbols_to_watch))
+    )
+    usdt_balance, portfolio_data = timer.measure("portfolio", build_portfolio, balances or {}, current_prices, symbols_to_watch)
+    
+    # Adiciona USDT ao portfolio_data para que o prompt da IA o inclua
+    # E também garante que o dashboard tenha o USDT correto
+    portfolio_data["USDT"] = {"amount": usdt_balance, "current_price": 1.0}
+    if balances:
+        # Patrimônio total do ciclo (USDT + ativos), para o gráfico de evolução do dashboard
+        # Em thread: o primeiro registro do usuário carrega a série do disco
+        await limits.io(equity_store.record, user_id, sum(data["amount"] * data["current_price"] for data in portfolio_data.values()))
 
-    while not stop_event.is_set():
-        current_time = int(time.time())
-        next_cycle_time = current_time + trade_interval
-        
-        # ATUALIZADO: Passa user_id para send_to_dashboard
-        send_to_dashboard(user_id, {"next_cycle_time": next_cycle_time})
+    # Atualiza o dashboard com os dados atuais do portfólio e saldo
+    send_to_dashboard(user_id, {
+        "status": "Analisando portfólio...",
+        "usdt": usdt_balance,
+        "portfolio": portfolio_data
+    })
 
-        print(f"\nExecutando ciclo de negociação para o usuário {user_id} às {datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # 1. Obter saldo e portfólio do Binance
-        usdt_balance, portfolio_data = get_binance_balance_and_portfolio(binance_api, symbols_to_watch)
-        
-        # Adiciona USDT ao portfolio_data para que o prompt da IA o inclua
-        # E também garante que o dashboard tenha o USDT correto
-        portfolio_data["USDT"] = {"amount": usdt_balance, "current_price": 1.0}
-
-        # Atualiza o dashboard com os dados atuais do portfólio e saldo
-        # ATUALIZADO: Passa user_id para send_to_dashboard
-        send_to_dashboard(user_id, {
-            "status": "Analisando portfólio...",
-            "usdt": usdt_balance,
-            "portfolio": portfolio_data
-        })
-
-        # 2. Gerar prompt para OpenAI
-        prompt = generate_openai_prompt(usdt_balance, portfolio_data)
-        print(f"[OpenAI Prompt]: {prompt}")
-
-        # 3. Obter recomendação do OpenAI
-        openai_response_str = openai_api.get_completion(prompt)
-        print(f"[OpenAI Response]: {openai_response_str}")
-        
-        trade_actions = parse_openai_response(openai_response_str)
-
-        if trade_actions:
-            print(f"OpenAI recomendou {len(trade_actions)} ações.")
-            executed_trades_count = 0
-            history_updates = []
-
-            # Para cada ação recomendada, execute-a
-            for action in trade_actions:
-                if executed_trades_count >= max_trades_per_cycle:
-                    print(f"Limite de {max_trades_per_cycle} negociações por ciclo atingido. Ignorando ações restantes.")
-                    break
-                
-                # ATUALIZADO: Passa user_id para send_to_dashboard
-                send_to_dashboard(user_id, {"status": f"Executando ação: {action.get('action')} {action.get('symbol')}"})
-                
-                # Obter preços atualizados para todas as moedas monitoradas antes de executar a ação
-                current_prices = {}
-                for symbol_pair in symbols_to_watch:
-                    price = binance_api.get_current_price(symbol_pair)
-                    if price:
-                        current_prices[symbol_pair] = price
-
-                # Passa a configuração do usuário e o portfolio_data para execute_trade_action
-                user_config_for_trade = global_config.copy()
-                user_config_for_trade["portfolio_data"] = portfolio_data
-                
-                trade_result = execute_trade_action(action, binance_api, current_prices, usdt_balance, user_config_for_trade)
-                
-                if trade_result:
-                    executed_trades_count += 1
-                    # Atualiza o histórico para o dashboard
-                    history_entry = {
-                        "timestamp": datetime.now().isoformat(),
-                        "type": trade_result["type"],
-                        "symbol": trade_result["symbol"],
-                        "quantity": trade_result["executed_quantity"],
-                        "price": trade_result["price"]
-                    }
-                    history_updates.append(history_entry)
-                    print(f"Negociação registrada: {history_entry}")
-
-            if history_updates:
-                # ATUALIZADO: Passa user_id para send_to_dashboard
-                send_to_dashboard(user_id, {"history": history_updates, "status": "Negociações executadas. Atualizando portfólio..."})
-            else:
-                # ATUALIZADO: Passa user_id para send_to_dashboard
-                send_to_dashboard(user_id, {"status": "Nenhuma negociação executada neste ciclo."})
+    # 2. Reutilizar a decisão se o estado do portfólio não mudou materialmente
+    trade_actions = None
+    if decision_cache is not None:
+        cache_key = decision_cache.fingerprint(usdt_balance, portfolio_data, (config['QUANTITY_PER_TRADE_USDT'],))
+        trade_actions = decision_cache.get(cache_key)
+        if trade_actions is not None:
+            log.debug("Portfólio sem mudanças relevantes; reutilizando a última decisão do OpenAI.",
+                      extra={"user_id": user_id, "cache": Lazy(decision_cache.stats)})
+
+    llm_task = None
+    llm_started_at = None
+    if trade_actions is not None:
+        action_source = iterate_actions(trade_actions)
+    else:
+        # 3. Gerar prompt para OpenAI
+        prompt, prompt_tokens = timer.measure("prompt", build_openai_prompt, usdt_balance, portfolio_data, config)
+        # O prompt inteiro só é escrito com o componente "trade" em DEBUG (e passa pela amostragem)
+        log.debug("Prompt do OpenAI.", extra={"user_id": user_id, "tokens": prompt_tokens, "prompt": prompt})
+
+        # 4. Obter recomendação do OpenAI (já parseada), dentro do prazo do ciclo
+        llm_started_at = time.perf_counter()
+        if config.get("LLM_STREAMING", True):
+            # Em streaming, cada ação vai para a fila assim que fica completa e é executada
+            # enquanto o modelo ainda gera as próximas
+            action_queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+
+            def on_action(action):
+                loop.call_soon_threadsafe(action_queue.put_nowait, action)
+
+            llm_task = asyncio.ensure_future(timer.run("llm", limits.llm(decision_client.decide_streaming, prompt, on_action)))
+            llm_task.add_done_callback(lambda _: action_queue.put_nowait(None)) # Fim da fila
+            action_source = iterate_action_queue(action_queue)
         else:
-            print("Nenhuma ação recomendada pelo OpenAI. Mantendo portfólio.")
-            # ATUALIZADO: Passa user_id para send_to_dashboard
-            send_to_dashboard(user_id, {"status": "Nenhuma ação recomendada. Aguardando próximo ciclo."})
+            llm_task = asyncio.ensure_future(timer.run("llm", limits.llm(decision_client.decide, prompt)))
+            action_source = iterate_actions((await llm_task)[0])
+
+    history_updates = []
+
+    # Passa a configuração do usuário e o portfolio_data para a validação das ações
+    user_config_for_trade = config.copy()
+    user_config_for_trade["portfolio_data"] = portfolio_data
+
+    # Todas as ações do ciclo são validadas contra o mesmo snapshot de preços e saldos;
+    # cada ordem é enviada assim que validada, sem esperar as anteriores
+    batch = ExecutionBatch(user_id, binance_api, plan_trade_action, current_prices, usdt_balance,
+                           user_config_for_trade, limits, cycle_id=current_time, max_orders=max_trades_per_cycle)
+    orders_started_at = None
+    async for action in action_source:
+        # Lote cheio: espera as ordens em andamento; uma que não executar devolve a vaga
+        if batch.full and not await batch.wait_for_slot():
+            log.info("Limite de %s negociações por ciclo atingido; ações restantes ignoradas.", max_trades_per_cycle,
+                     extra={"user_id": user_id})
+            break
         
-        print(f"Próximo ciclo de negociação para o usuário {user_id} em {trade_interval} segundos...")
-        stop_event.wait(trade_interval) # Espera, mas permite que o bot seja parado
\ No newline at end of file
+        send_to_dashboard(user_id, {"status": f"Executando ação: {action.get('action')} {action.get('symbol')}"})
+        if batch.submit(action) and orders_started_at is None:
+            orders_started_at = time.perf_counter()
+
+    for plan, order in await batch.results():
+        trade_result = trade_result_from_order(plan, order)
+        if trade_result:
+            track_position_risk(user_id, binance_api, trade_result, current_prices, config)
+            # Atualiza o histórico para o dashboard
+            history_entry = {
+                "timestamp": datetime.now().isoformat(),
+                "type": trade_result["type"],
+                "symbol": trade_result["symbol"],
+                "quantity": trade_result["executed_quantity"],
+                "price": trade_result["price"]
+            }
+            history_updates.append(history_entry)
+            # Gravação persistente em lote, em outra thread: não espera o disco
+            trade_ledger.record(user_id, history_entry["timestamp"], trade_result["type"], trade_result["symbol"],
+                                trade_result["executed_quantity"], trade_result["price"], trade_result["commission"],
+                                trade_result["order_id"], trade_result["client_order_id"])
+            log.info("Negociação registrada.", extra={"user_id": user_id, "trade": history_entry})
+    if orders_started_at is not None:
+        timer.stages["orders"] = time.perf_counter() - orders_started_at
+    # Tempo até a primeira ordem executada, contado do pedido ao LLM (separado do tempo da resposta completa)
+    if llm_started_at is not None and batch.first_fill_at is not None:
+        timer.stages["first_order"] = batch.first_fill_at - llm_started_at
+
+    if llm_task is not None:
+        # Aguarda a resposta completa (a lista inteira) mesmo que o limite de negociações tenha sido atingido
+        trade_actions, valid_response, llm_info = await llm_task
+        if llm_info.get("first_action_latency") is not None:
+            timer.stages["first_action"] = llm_info["first_action_latency"]
+        log.debug("Resposta do OpenAI (modelo %s, hedge: %s, %.2fs).", llm_info["model"], llm_info["hedged"], llm_info["latency"],
+                  extra={"user_id": user_id, "actions": trade_actions})
+
+        # Respostas com erro não entram no cache, para que o próximo ciclo tente de novo
+        if decision_cache is not None and valid_response:
+            decision_cache.put(cache_key, trade_actions)
+
+    if trade_actions:
+        log.debug("OpenAI recomendou %s ações.", len(trade_actions), extra={"user_id": user_id})
+        if history_updates:
+            send_to_dashboard(user_id, {"history": history_updates, "status": "Negociações executadas. Atualizando portfólio..."})
+        else:
+            send_to_dashboard(user_id, {"status": "Nenhuma negociação executada neste ciclo."})
+    else:
+        log.debug("Nenhuma ação recomendada pelo OpenAI; mantendo o portfólio.", extra={"user_id": user_id})
+        send_to_dashboard(user_id, {"status": "Nenhuma ação recomendada. Aguardando próximo ciclo."})
+
+    timings = timer.report()
+    log.info("Ciclo concluído em %.1f ms.", timings["total"], extra={"user_id": user_id, "timings_ms": timings})
+    send_to_dashboard(user_id, {"cycle_timings": timings})
+    return timings
+
+def track_position_risk(user_id, binance_api, trade_result, current_prices, config):
+    """
+    Mantém as regras de saída do motor de risco em dia com uma negociação do ciclo:
+    uma compra ganha stop-loss/take-profit/trailing stop; uma venda desconta das posições protegidas.
+    """
+    if not config.get("RISK_ENGINE_ENABLED", False):
+        return
+    symbol = trade_result["symbol"]
+    if trade_result["type"] == "SELL":
+        risk_engine.reduce(user_id, symbol, float(trade_result["executed_quantity"] or 0))
+        return
+    try:
+        entry_price = float(trade_result["price"])
+    except (TypeError, ValueError):
+        entry_price = current_prices.get(symbol, 0.0)
+    risk_engine.protect(
+        user_id, symbol, trade_result.get("net_quantity", 0.0), entry_price, binance_api,
+        stop_loss_pct=config.get("STOP_LOSS_PCT"),
+        take_profit_pct=config.get("TAKE_PROFIT_PCT"),
+        trailing_pct=config.get("TRAILING_STOP_PCT")
+    )
+
+async def iterate_actions(actions):
+    """Entrega uma lista de ações já conhecida (ex: do cache) pela mesma interface do streaming."""
+    for action in actions:
+        yield action
+
+async def iterate_action_queue(action_queue):
+    """Entrega as ações da fila do streaming até encontrar o marcador de fim (None)."""
+    while True:
+        action = await action_queue.get()
+        if action is None:
+            return
+        yield action